@@ -0,0 +1,118 @@
+"""Bytes on the wire and CPU per request for each Accept-Encoding.
+
+Seeds --blogs posts with --cells text cells each for one user (in the
+database from backend/.env) and requests, in-process, with every encoding
+the server supports:
+
+* GET /api/blogs/{id}, cold (first request for a version, which compresses
+  and caches the body) and warm (served from the cached compressed body);
+* GET /api/my-blogs, compressed per request by CompressionMiddleware;
+* GET /api/export, compressed as a stream.
+
+CPU is process time (client included, so compare rows against identity).
+Every decoded body is checked against the identity body.
+
+    cd backend
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/bench_compression.py --blogs 200 --cells 40
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All requests come from one client; the per-client rate limits would only measure themselves
+os.environ.setdefault("RATE_LIMITS", "off")
+
+import httpx
+import psycopg2
+
+import compression
+import db
+import main
+
+USER = {"username": "bench_compression", "password": "bench", "email": "bench_compression@example.com"}
+
+
+def seed(blogs, cells):
+    conn = psycopg2.connect(**db.connection_kwargs())
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM blogs WHERE author = %s", (USER["username"],))
+        cursor.execute('''
+            INSERT INTO blogs (title, cells, author)
+            SELECT 'post ' || b,
+                   (SELECT jsonb_agg(jsonb_build_object(
+                        'id', c, 'type', 'text',
+                        'content', 'Paragraph ' || c || ' of post ' || b || '. ' || repeat('lorem ipsum dolor sit amet ', 20)))
+                    FROM generate_series(1, %s) c),
+                   %s
+            FROM generate_series(1, %s) b
+        ''', (cells, USER["username"], blogs))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+async def measure(client, urls, headers, expected):
+    """Requests every url once; returns (wire bytes, CPU ms) per request."""
+    wire = 0
+    started = time.process_time()
+    for url in urls:
+        response = await client.get(url, headers=headers)
+        response.raise_for_status()
+        wire += response.num_bytes_downloaded
+        if expected is not None and response.content != expected[url]:
+            raise AssertionError(f"{url}: decoded body differs with {headers}")
+    cpu = time.process_time() - started
+    return wire / len(urls), cpu * 1000 / len(urls)
+
+
+async def main_async(args):
+    await main.prepare()
+    seed(args.blogs, args.cells)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        response = await client.post("/api/register", json=USER)
+        if response.status_code != 200:
+            response = await client.post("/api/login", json=USER)
+        auth = {"Authorization": f"Bearer {response.json()['token']}"}
+        blogs = (await client.get("/api/my-blogs/summary?limit=100", headers=auth)).json()["items"]
+        blog_urls = [f"/api/blogs/{blog['id']}" for blog in blogs]
+
+        groups = [
+            ("blog, cold", blog_urls, True),
+            ("blog, warm", blog_urls, False),
+            ("my-blogs", ["/api/my-blogs"] * args.repeat, False),
+            ("export", ["/api/export"] * args.repeat, False),
+        ]
+        identity = {"Accept-Encoding": "identity", **auth}
+        expected = {}
+        for _, urls, _ in groups:
+            for url in set(urls):
+                expected[url] = (await client.get(url, headers=identity)).content
+
+        print(f"{'':12} {'encoding':>9} {'bytes/req':>12} {'ratio':>7} {'cpu ms/req':>11}")
+        for name, urls, cold in groups:
+            baseline = None
+            for encoding in ["identity", *compression.ENCODINGS]:
+                if cold:
+                    main.blog_cache.clear()
+                    await measure(client, urls, identity, None)  # cached uncompressed, as after a first read
+                size, cpu = await measure(client, urls, {"Accept-Encoding": encoding, **auth}, expected)
+                baseline = baseline or size
+                print(f"{name:12} {encoding:>9} {size:>12.0f} {baseline / size:>6.1f}x {cpu:>11.2f}")
+            print()
+
+    db.shutdown_executor()
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blogs", type=int, default=200)
+    parser.add_argument("--cells", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(main_async(parser.parse_args()))
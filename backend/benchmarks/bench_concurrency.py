@@ -0,0 +1,89 @@
+"""Throughput of GET /api/blogs/{id} at increasing numbers of in-flight requests.
+
+Runs the app in-process on a single event loop (like one uvicorn worker)
+against the Postgres configured in backend/.env. Every query is preceded by
+pg_sleep(--latency-ms) to stand in for a slow query or a remote database, so
+a blocking handler shows up as flat throughput while the async data-access
+layer should scale with concurrency up to DB_MAX_CONCURRENCY.
+
+    cd backend
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/bench_concurrency.py --latency-ms 20 --requests 400
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All requests come from one client; the per-client rate limits would only measure themselves
+os.environ.setdefault("RATE_LIMITS", "off")
+
+import httpx
+
+import db
+import main
+
+
+def with_latency(fn, seconds):
+    def wrapper(conn, query, params=None):
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_sleep(%s)", (seconds,))
+        return fn(conn, query, params)
+    return wrapper
+
+
+async def seed(client):
+    credentials = {"username": "bench_concurrency", "password": "bench", "email": "bench_concurrency@example.com"}
+    response = await client.post("/api/register", json=credentials)
+    if response.status_code != 200:
+        response = await client.post("/api/login", json=credentials)
+    headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    blog = {"title": "Benchmark post", "cells": [{"id": 1, "type": "text", "content": "lorem ipsum " * 200}]}
+    response = await client.post("/api/blogs", json=blog, headers=headers)
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def run_level(client, blog_id, concurrency, total):
+    remaining = total
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            response = await client.get(f"/api/blogs/{blog_id}")
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - started)
+
+
+async def main_async(args):
+    await main.prepare()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        blog_id = await seed(client)
+
+        if args.latency_ms > 0:
+            db.fetch_one = with_latency(db.fetch_one, args.latency_ms / 1000)
+
+        print(f"latency per query: {args.latency_ms} ms, DB concurrency limit: {db.get_executor().max_workers}")
+        print(f"{'in-flight':>10} {'req/s':>10}")
+        for concurrency in args.levels:
+            rps = await run_level(client, blog_id, concurrency, args.requests)
+            print(f"{concurrency:>10} {rps:>10.1f}")
+
+    db.shutdown_executor()
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    asyncio.run(main_async(parser.parse_args()))
@@ -0,0 +1,99 @@
+"""Posts per second through POST /api/import.
+
+Generates an NDJSON archive in memory (--folders folders, --posts posts of
+--cells text cells each), streams it to the app running in-process against
+the Postgres from backend/.env and prints the import stats. The account is
+emptied first, so the benchmark can be re-run.
+
+    cd backend
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/bench_import.py --posts 50000
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All requests come from one client; the per-client rate limits would only measure themselves
+os.environ.setdefault("RATE_LIMITS", "off")
+
+import httpx
+import orjson
+
+import db
+import main
+
+USER = {"username": "bench_import", "password": "bench", "email": "bench_import@example.com"}
+
+
+def archive(folders, posts, cells):
+    lines = []
+    for folder_id in range(1, folders + 1):
+        parent = folder_id // 2 or None  # a binary tree of folders
+        lines.append({"type": "folder", "id": folder_id, "name": f"folder {folder_id}", "parent_id": parent})
+    for post in range(posts):
+        lines.append({
+            "type": "blog",
+            "title": f"Imported post {post}",
+            "cells": [{"id": cell, "type": "text", "content": f"paragraph {cell} " + "lorem ipsum " * 30}
+                      for cell in range(cells)],
+            "folder_id": post % (folders + 1) or None,
+            "created_at": "2020-01-01T00:00:00",
+        })
+    return b"".join(orjson.dumps(line) + b"\n" for line in lines)
+
+
+async def chunked(data, size=256 * 1024):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def main_async(args):
+    body = archive(args.folders, args.posts, args.cells)
+    headers = {}
+    if args.gzip:
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    print(f"archive: {len(body) / 1e6:.1f} MB{' gzipped' if args.gzip else ''}")
+
+    await main.prepare()
+    await db.run(db.execute, "DELETE FROM blogs WHERE author = %s", (USER["username"],))
+    await db.run(db.execute, "DELETE FROM folders WHERE author = %s", (USER["username"],))
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=3600) as client:
+        response = await client.post("/api/register", json=USER)
+        if response.status_code != 200:
+            response = await client.post("/api/login", json=USER)
+        headers["Authorization"] = f"Bearer {response.json()['token']}"
+
+        started = time.perf_counter()
+        response = await client.post("/api/import", content=chunked(body), headers=headers)
+        elapsed = time.perf_counter() - started
+        response.raise_for_status()
+        stats = response.json()
+
+        # The queued search_backfill job, run here since no job worker runs without the app lifespan
+        started = time.perf_counter()
+        await db.run(main._search_backfill_job, {"author": USER["username"]})
+        backfill = time.perf_counter() - started
+
+    print(f"folders: {stats['folders']}, blogs: {stats['blogs']}, errors: {stats['error_count']}")
+    loaded = stats["elapsed_seconds"]
+    print(f"load:  {stats['blogs']['imported'] / loaded:.0f} posts/s ({loaded:.1f}s, {stats['batches']} batches)")
+    print(f"backfill: {backfill:.1f}s of search vectors, total {elapsed + backfill:.1f}s")
+
+    db.shutdown_executor()
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=50000)
+    parser.add_argument("--folders", type=int, default=100)
+    parser.add_argument("--cells", type=int, default=5)
+    parser.add_argument("--gzip", action="store_true")
+    asyncio.run(main_async(parser.parse_args()))
@@ -0,0 +1,97 @@
+"""Latency of other endpoints during a burst of logins.
+
+Runs the app in-process on a single event loop (like one uvicorn worker)
+against the Postgres configured in backend/.env. A probe requests
+GET /api/folders in a loop, first alone and then while --logins concurrent
+logins hash passwords, and prints its latency percentiles for both phases.
+With --inline, bcrypt runs directly on the event loop instead of the hash
+worker pool, which is what the probe latency looks like without the pool.
+
+    cd backend
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/bench_login_storm.py --logins 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All requests come from one client; the per-client rate limits would only measure themselves
+os.environ.setdefault("RATE_LIMITS", "off")
+
+import httpx
+
+import db
+import main
+import passwords
+
+CREDENTIALS = {"username": "bench_login", "password": "bench password", "email": "bench_login@example.com"}
+
+
+async def probe(client, headers, stop):
+    timings = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        response = await client.get("/api/folders", headers=headers)
+        response.raise_for_status()
+        timings.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.01)
+    return timings
+
+
+def summary(timings):
+    timings = sorted(timings)
+    pick = lambda q: timings[min(len(timings) - 1, int(len(timings) * q))]
+    return f"n={len(timings):4} p50={pick(0.50):8.2f}ms p95={pick(0.95):8.2f}ms max={timings[-1]:8.2f}ms"
+
+
+async def main_async(args):
+    if args.inline:
+        async def inline(fn, *fn_args):
+            return fn(*fn_args)
+        passwords.get_pool().run = inline
+
+    await main.prepare()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        response = await client.post("/api/register", json=CREDENTIALS)
+        if response.status_code != 200:
+            response = await client.post("/api/login", json=CREDENTIALS)
+        headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, headers, stop))
+        await asyncio.sleep(args.baseline_seconds)
+        stop.set()
+        print(f"baseline     {summary(await task)}")
+
+        statuses = {}
+
+        async def login():
+            response = await client.post("/api/login", json=CREDENTIALS)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        stop = asyncio.Event()
+        task = asyncio.create_task(probe(client, headers, stop))
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(args.logins)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        print(f"during storm {summary(await task)}")
+        print(f"{args.logins} logins in {elapsed:.1f}s, statuses: {statuses}")
+        if not args.inline:
+            print(f"hash pool: {passwords.get_pool().stats()}")
+
+    passwords.shutdown_pool()
+    db.shutdown_executor()
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--baseline-seconds", type=float, default=3.0)
+    parser.add_argument("--inline", action="store_true", help="hash on the event loop (no worker pool)")
+    asyncio.run(main_async(parser.parse_args()))
@@ -0,0 +1,114 @@
+"""Latency under overload, with and without DB admission control.
+
+Runs the app in-process on a single event loop (like one uvicorn worker)
+against the Postgres configured in backend/.env. --clients clients each
+request GET /api/folders in a loop for --duration seconds; every query is
+preceded by pg_sleep(--latency-ms), so the DB slots (DB_MAX_CONCURRENCY)
+serve far fewer requests per second than the clients send. A client that
+is refused (503) waits its Retry-After before trying again, as a browser
+would.
+
+Each --max-queue setting is one run: "none" lets every request wait for a
+slot however long it takes (the behaviour before admission control), a
+number sheds requests once that many are waiting or after --queue-timeout
+seconds. Printed per run: successful requests per second, p50/p99 latency
+of the successful ones and the share that was shed.
+
+    cd backend
+    python benchmarks/bench_overload.py --clients 200 --latency-ms 50 --max-queue none 20 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All requests come from one client; the per-client rate limits would only measure themselves
+os.environ.setdefault("RATE_LIMITS", "off")
+
+import httpx
+
+import db
+import main
+
+
+def with_latency(fn, seconds):
+    def wrapper(conn, query, params=None):
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT pg_sleep(%s)", (seconds,))
+        return fn(conn, query, params)
+    return wrapper
+
+
+async def login(client):
+    credentials = {"username": "bench_overload", "password": "bench", "email": "bench_overload@example.com"}
+    response = await client.post("/api/register", json=credentials)
+    if response.status_code != 200:
+        response = await client.post("/api/login", json=credentials)
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+async def run_level(client, headers, clients, duration):
+    latencies, shed = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal shed
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            response = await client.get("/api/folders", headers=headers)
+            if response.status_code == 503:
+                shed += 1
+                await asyncio.sleep(float(response.headers.get("retry-after", 1)))
+                continue
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    total = len(latencies) + shed
+    return {
+        "ok_per_second": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0.0,
+        "shed": shed / total if total else 0.0,
+    }
+
+
+async def main_async(args):
+    await main.prepare()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        headers = await login(client)
+        db.fetch_all = with_latency(db.fetch_all, args.latency_ms / 1000)
+
+        executor = db.get_executor()
+        print(f"{args.clients} clients, {args.latency_ms} ms per query, "
+              f"DB concurrency limit: {executor.max_workers}, queue timeout: {args.queue_timeout}s")
+        print(f"{'max queue':>10} {'ok/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'shed':>6}")
+        for max_queue in args.max_queue:
+            if max_queue == "none":
+                executor.max_queue, executor.queue_timeout = float("inf"), None
+            else:
+                executor.max_queue, executor.queue_timeout = int(max_queue), args.queue_timeout
+            result = await run_level(client, headers, args.clients, args.duration)
+            print(f"{max_queue:>10} {result['ok_per_second']:>8.1f} {result['p50_ms']:>8.1f} "
+                  f"{result['p99_ms']:>8.1f} {result['shed']:>6.0%}")
+
+    db.shutdown_executor()
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--queue-timeout", type=float, default=db.get_executor().queue_timeout)
+    parser.add_argument("--max-queue", nargs="+", default=["none", "20", "100"])
+    asyncio.run(main_async(parser.parse_args()))
@@ -0,0 +1,191 @@
+"""Storage growth and reconstruction time of the revision history.
+
+Creates one post of --cells cells (text/code/media mix from seed.py) and
+saves it --edits times, the way PUT /api/blogs/{id} does: the new cells are
+diffed against the stored ones and revisions.record() writes the delta (or
+a snapshot) in the same transaction as the update. Most saves change one
+cell a little; some insert, delete or move a cell. The same edit sequence
+is replayed for each --every snapshot interval.
+
+For each interval it reports the stored history against what full copies
+per save would take, the time per save spent on diff + record, and the time
+to rebuild revisions with blog_revision_cells(), at the worst case (the
+revision just before a snapshot) and over a sample of all revisions. Every
+rebuilt revision is checked against the cells that were saved.
+
+    cd backend
+    python benchmarks/bench_revisions.py --cells 40 --edits 2000 --every 10 20 50
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+import orjson
+import psycopg2
+
+load_dotenv()
+
+import db
+import migrations
+import revisions
+import seed
+
+AUTHOR = "bench_revisions"
+
+
+def _media_pool(rng, count=20):
+    pool = []
+    for n in range(count):
+        sha256 = rng.randbytes(32).hex()
+        pool.append({"name": f"{AUTHOR}{n}.png", "type": "image/png", "size": rng.randint(20 * 1024, 400 * 1024),
+                     "sha256": sha256, "url": f"/api/media/{sha256}"})
+    return pool
+
+
+def edit_history(cells, edits, seed_value):
+    """The cells after each of edits saves; every save is a small edit like an editor would make."""
+    rng = random.Random(seed_value)
+    media_pool = _media_pool(rng)
+    current = seed._cells(rng, cells, (6, 3, 1), media_pool)
+    next_id = len(current) + 1
+    history = [current]
+    for _ in range(edits):
+        current = [dict(cell) for cell in current]
+        action = rng.random()
+        if action < 0.1 or not current:
+            new = seed._cells(rng, 1, (6, 3, 1), media_pool)[0]
+            new["id"] = next_id
+            next_id += 1
+            current.insert(rng.randint(0, len(current)), new)
+        elif action < 0.18:
+            current.pop(rng.randrange(len(current)))
+        elif action < 0.25:
+            current.insert(rng.randint(0, len(current) - 1), current.pop(rng.randrange(len(current))))
+        else:
+            # Typing: a few words added to or changed in one text/code cell
+            editable = [cell for cell in current if isinstance(cell["content"], str)]
+            if editable:
+                cell = rng.choice(editable)
+                words = cell["content"].split(" ")
+                words[rng.randrange(len(words))] = " ".join(rng.choice(seed.WORDS) for _ in range(rng.randint(1, 4)))
+                cell["content"] = " ".join(words)
+        history.append(current)
+    return history
+
+
+def replay(conn, history):
+    """Saves every state of history as a revision of a new post; returns (blog id, seconds per save)."""
+    cursor = conn.cursor()
+    cells_json = orjson.dumps(history[0]).decode()
+    cursor.execute("INSERT INTO blogs (title, cells, author) VALUES (%s, %s::jsonb, %s) RETURNING id",
+                   ("revisions", cells_json, AUTHOR))
+    blog_id = cursor.fetchone()["id"]
+    revisions.record(cursor, blog_id, AUTHOR, "revisions", cells_json)
+    conn.commit()
+
+    elapsed = 0.0
+    for previous, cells in zip(history, history[1:]):
+        cells_json = orjson.dumps(cells).decode()
+        cursor.execute("UPDATE blogs SET cells = %s::jsonb WHERE id = %s", (cells_json, blog_id))
+        started = time.perf_counter()
+        revisions.record(cursor, blog_id, AUTHOR, "revisions", cells_json, revisions.diff(previous, cells))
+        elapsed += time.perf_counter() - started
+        conn.commit()
+    return blog_id, elapsed / max(1, len(history) - 1)
+
+
+def rebuild(cursor, blog_id, number):
+    started = time.perf_counter()
+    cursor.execute("SELECT blog_revision_cells(%s, %s)::text AS cells", (blog_id, number))
+    cells = cursor.fetchone()["cells"]
+    return time.perf_counter() - started, orjson.loads(cells)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(conn, history, every, sample, rng):
+    revisions.SNAPSHOT_EVERY = every
+    blog_id, save_seconds = replay(conn, history)
+    cursor = conn.cursor()
+    cursor.execute(
+        '''
+        SELECT count(*) FILTER (WHERE snapshot IS NOT NULL) AS snapshots,
+               coalesce(sum(size), 0) AS stored,
+               coalesce(sum(pg_column_size(snapshot)), 0) + coalesce(sum(pg_column_size(delta)), 0) AS on_disk
+        FROM blog_revisions WHERE blog_id = %s
+        ''',
+        (blog_id,)
+    )
+    totals = cursor.fetchone()
+    full = sum(len(orjson.dumps(cells)) for cells in history)
+
+    # The revision just before each snapshot applies the most deltas
+    worst = [number for number in range(every, len(history) + 1, every)] or [len(history)]
+    numbers = sorted(set(rng.sample(range(1, len(history) + 1), min(sample, len(history)))) | set(worst))
+    times = {}
+    for number in numbers:
+        seconds, cells = rebuild(cursor, blog_id, number)
+        if cells != history[number - 1]:
+            raise AssertionError(f"revision {number} rebuilt differently (every={every})")
+        times[number] = seconds
+    conn.commit()
+
+    cursor.execute("DELETE FROM blogs WHERE id = %s", (blog_id,))
+    conn.commit()
+    all_times = list(times.values())
+    return {
+        "every": every,
+        "snapshots": totals["snapshots"],
+        "stored": totals["stored"],
+        "on_disk": totals["on_disk"],
+        "full": full,
+        "save_ms": save_seconds * 1000,
+        "p50_ms": statistics.median(all_times) * 1000,
+        "p95_ms": percentile(all_times, 0.95) * 1000,
+        "worst_ms": max(times[number] for number in worst) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cells", type=int, default=40, help="cells in the post at the start")
+    parser.add_argument("--edits", type=int, default=2000, help="saves after the first")
+    parser.add_argument("--every", type=int, nargs="+", default=[10, 20, 50], help="snapshot intervals to compare")
+    parser.add_argument("--sample", type=int, default=200, help="revisions rebuilt per interval")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    history = edit_history(args.cells, args.edits, args.seed)
+    conn = psycopg2.connect(**db.connection_kwargs())
+    try:
+        migrations.migrate(conn)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM blogs WHERE author = %s", (AUTHOR,))
+        conn.commit()
+
+        last = len(orjson.dumps(history[-1]))
+        print(f"{len(history)} revisions, last one {last / 1024:.1f} KB of cells, "
+              f"full copies would take {sum(len(orjson.dumps(cells)) for cells in history) / 1024 / 1024:.1f} MB")
+        print(f"{'every':>6} {'snapshots':>10} {'stored KB':>10} {'on disk KB':>11} {'vs full':>8} "
+              f"{'save ms':>8} {'rebuild p50':>12} {'p95':>8} {'worst':>8}")
+        for every in args.every:
+            result = run(conn, history, every, args.sample, random.Random(args.seed))
+            print(f"{result['every']:>6} {result['snapshots']:>10} {result['stored'] / 1024:>10.0f} "
+                  f"{result['on_disk'] / 1024:>11.0f} {result['full'] / result['stored']:>7.1f}x "
+                  f"{result['save_ms']:>8.2f} {result['p50_ms']:>12.2f} {result['p95_ms']:>8.2f} "
+                  f"{result['worst_ms']:>8.2f}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Times /api/search queries on a seeded corpus.
+
+Seeds --posts blogs (authors prefixed with "searchbench_") with titles and
+text/code cells drawn from a small vocabulary, so common words match many
+rows and rare ones only a few. Then runs the same query main.py runs for a
+mix of search terms and prints latency percentiles in milliseconds.
+
+    cd backend
+    python benchmarks/bench_search.py --posts 100000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+import psycopg2
+
+load_dotenv()
+
+import db
+import migrations
+from main import _search_blogs
+
+AUTHOR = "searchbench_1"
+
+# Term -> roughly how often it occurs (see seed)
+QUERIES = [
+    "postgres",            # every 2nd post
+    "index scan",          # both words, every 6th post
+    "\"connection pool\"", # phrase
+    "rare17",              # a handful of posts
+    "python -java",        # negation
+    "nomatch",
+]
+
+
+def seed(cursor, posts, authors):
+    cursor.execute("DELETE FROM blogs WHERE author LIKE 'searchbench\\_%%'")
+    cursor.execute('''
+        INSERT INTO blogs (title, cells, author, created_at, updated_at)
+        SELECT
+            'post ' || n || CASE WHEN n %% 2 = 0 THEN ' postgres' ELSE ' python' END,
+            jsonb_build_array(
+                jsonb_build_object('id', 1, 'type', 'text', 'content',
+                    'notes about ' || CASE WHEN n %% 3 = 0 THEN 'index scan ' ELSE 'java ' END ||
+                    CASE WHEN n %% 5 = 0 THEN 'connection pool ' ELSE '' END ||
+                    'rare' || (n %% 5000) || ' ' || repeat('lorem ipsum dolor sit amet ', 20)),
+                jsonb_build_object('id', 2, 'type', 'code', 'content',
+                    'SELECT * FROM t' || (n %% 100) || ' WHERE id = ' || n),
+                jsonb_build_object('id', 3, 'type', 'image', 'content', 'ignored')
+            ),
+            'searchbench_' || ((n / 7) %% %s),
+            now() - (n || ' seconds')::interval,
+            now()
+        FROM generate_series(1, %s) n
+    ''', (authors, posts))
+    cursor.execute("ANALYZE blogs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark full-text search")
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--authors", type=int, default=10,
+                        help="posts are spread evenly over this many authors")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**db.connection_kwargs())
+    try:
+        migrations.migrate(conn)
+        cursor = conn.cursor()
+        started = time.perf_counter()
+        seed(cursor, args.posts, args.authors)
+        conn.commit()
+        print(f"Seeded {args.posts} posts in {time.perf_counter() - started:.1f}s")
+
+        for q in QUERIES:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                page = _search_blogs(conn, AUTHOR, q, None, 20, 0)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            p95 = timings[int(len(timings) * 0.95) - 1]
+            print(f"{q!r:24} hits={len(page['items']):3} has_more={str(page['has_more']):5} "
+                  f"median={statistics.median(timings):7.2f}ms p95={p95:7.2f}ms")
+
+        if not args.keep:
+            cursor.execute("DELETE FROM blogs WHERE author LIKE 'searchbench\\_%%'")
+            conn.commit()
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Rows per second for the list endpoints and for the JSON encoding alone.
+
+Seeds --blogs posts with --cells cells each for one user (in the database
+from backend/.env), then:
+
+* requests every list endpoint in-process and reports rows/sec end to end;
+* fetches the same rows once and times only the encoding: the previous
+  path (copy into dicts, isoformat, validate against BlogResponse, stdlib
+  json) against serialization.rows_response (orjson, cells passed through
+  as raw JSONB text).
+
+    cd backend
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/bench_serialization.py --blogs 2000 --cells 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All requests come from one client; the per-client rate limits would only measure themselves
+os.environ.setdefault("RATE_LIMITS", "off")
+
+import httpx
+import psycopg2
+from pydantic import TypeAdapter
+
+import db
+import main
+import serialization
+
+USER = {"username": "bench_serialization", "password": "bench", "email": "bench_serialization@example.com"}
+
+
+def seed(blogs, cells):
+    conn = psycopg2.connect(**db.connection_kwargs())
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM blogs WHERE author = %s", (USER["username"],))
+        cursor.execute("DELETE FROM folders WHERE author = %s", (USER["username"],))
+        cursor.execute('''
+            INSERT INTO folders (name, author) SELECT 'folder ' || f, %s FROM generate_series(1, 20) f
+        ''', (USER["username"],))
+        cursor.execute('''
+            INSERT INTO blogs (title, cells, author, folder_id)
+            SELECT 'post ' || b,
+                   (SELECT jsonb_agg(jsonb_build_object('id', c, 'type', 'text',
+                                                        'content', repeat('lorem ipsum ', 40)))
+                    FROM generate_series(1, %s) c),
+                   %s,
+                   CASE WHEN b %% 2 = 0 THEN NULL ELSE (
+                       SELECT id FROM folders WHERE author = %s ORDER BY id LIMIT 1
+                   ) END
+            FROM generate_series(1, %s) b
+        ''', (cells, USER["username"], USER["username"], blogs))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def legacy_encode(rows):
+    blogs = []
+    for result in rows:
+        blogs.append({
+            "id": result["id"],
+            "title": result["title"],
+            "cells": result["cells"],
+            "author": result["author"],
+            "folder_id": result["folder_id"],
+            "created_at": result["created_at"].isoformat(),
+            "updated_at": result["updated_at"].isoformat(),
+        })
+    validated = TypeAdapter(List[main.BlogResponse]).validate_python(blogs)
+    return json.dumps([blog.model_dump() for blog in validated]).encode()
+
+
+def time_encoding(fn, rows, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(rows)
+    return len(rows) * repeat / (time.perf_counter() - started)
+
+
+async def time_endpoints(client, headers, repeat):
+    folders = (await client.get("/api/folders", headers=headers)).json()
+    folder_id = min(folder["id"] for folder in folders)
+    endpoints = [
+        "/api/my-blogs",
+        "/api/root-blogs",
+        f"/api/folders/{folder_id}/blogs",
+        "/api/root-contents",
+        f"/api/folders/{folder_id}/contents",
+        "/api/my-blogs/summary?limit=100&excerpt=true",
+        "/api/folders",
+        "/api/folders/tree",
+    ]
+    print(f"{'endpoint':48} {'rows':>6} {'rows/s':>10}")
+    for url in endpoints:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            response = await client.get(url, headers=headers)
+            response.raise_for_status()
+        elapsed = time.perf_counter() - started
+
+        # The body is decoded only once, outside the timed loop
+        body = response.json()
+        if isinstance(body, list):
+            rows = len(body)
+        elif "items" in body:
+            rows = len(body["items"])
+        elif "folders" in body:
+            rows = len(body["folders"]) + len(body["blogs"])
+        else:
+            rows = body["total_blog_count"]
+        print(f"{url:48} {rows:>6} {rows * repeat / elapsed:>10.0f}")
+
+
+async def main_async(args):
+    await main.prepare()
+    seed(args.blogs, args.cells)
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        response = await client.post("/api/register", json=USER)
+        if response.status_code != 200:
+            response = await client.post("/api/login", json=USER)
+        headers = {"Authorization": f"Bearer {response.json()['token']}"}
+        await time_endpoints(client, headers, args.repeat)
+
+    query = "SELECT id, title, {cells}, author, folder_id, created_at, updated_at FROM blogs WHERE author = %s"
+    decoded = await db.run(db.fetch_all, query.format(cells="cells"), (USER["username"],))
+    raw = await db.run(db.fetch_all, query.format(cells="cells::text AS cells"), (USER["username"],))
+    print()
+    print(f"encoding only, {len(decoded)} rows x {args.cells} cells")
+    print(f"  dicts + pydantic + json : {time_encoding(legacy_encode, decoded, args.repeat):>10.0f} rows/s")
+    encode = lambda rows: serialization.rows_response([dict(row) for row in rows], raw_columns=("cells",))
+    print(f"  orjson + raw jsonb      : {time_encoding(encode, raw, args.repeat):>10.0f} rows/s")
+
+    db.shutdown_executor()
+    db.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blogs", type=int, default=2000)
+    parser.add_argument("--cells", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main_async(parser.parse_args()))
@@ -0,0 +1,95 @@
+"""Checks that an export cancelled midway gives its connection back.
+
+The export holds one pooled connection, with a REPEATABLE READ snapshot
+and a server-side cursor open, for as long as it streams. When the client
+disconnects, Starlette cancels the streaming task. Under anyio that
+cancellation is delivered again at every later await, including the ones
+in the generator's cleanup. This check reproduces that:
+
+1. It seeds --posts posts for a throwaway user into the database from
+   backend/.env.
+2. It starts streaming an export inside an anyio cancel scope.
+3. After the first rows, it fills every DB slot, so the export's next
+   fetch has to wait for one.
+4. It cancels the scope while the export waits.
+
+Once the slots are free again, every pooled connection must be idle and no
+export may be counted as running. Exits with status 1 otherwise.
+
+    cd backend
+    python benchmarks/check_export_cancel.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import anyio
+
+import db
+import main
+
+USER = "exportcancel_check"
+
+
+def seed(conn, posts):
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM blogs WHERE author = %s", (USER,))
+    cursor.execute('''
+        INSERT INTO blogs (title, cells, author)
+        SELECT 'post ' || n, '[{"id": 1, "type": "text", "content": "seed"}]'::jsonb, %s
+        FROM generate_series(1, %s) n
+    ''', (USER, posts))
+    conn.commit()
+
+
+async def cancel_midway(hold_seconds):
+    executor = db.get_executor()
+    records = main._export_records(USER, (None, 0))
+    first_rows = asyncio.Event()
+
+    async def consume():
+        async for chunk in records:
+            if chunk:
+                first_rows.set()
+
+    async with anyio.create_task_group() as group:
+        group.start_soon(consume)
+        await first_rows.wait()
+        # Every DB slot busy: the export's next fetchmany (and anything it awaits afterwards) has to queue
+        for _ in range(executor.max_workers):
+            group.start_soon(executor.call, time.sleep, hold_seconds)
+        await asyncio.sleep(0.1)
+        group.cancel_scope.cancel()
+    # The slot holders were cancelled while waiting, not their threads; let those finish
+    await asyncio.sleep(hold_seconds + 0.5)
+
+
+async def main_async(args):
+    await main.prepare()
+    await db.run(seed, args.posts)
+    try:
+        before = db.pool.stats()["in_use"]
+        await cancel_midway(args.hold)
+        in_use = db.pool.stats()["in_use"]
+        running = main._exports_running
+        ok = in_use == before and running == 0
+        print(f"[{'ok' if ok else 'FAIL'}] connections in use: {before} before, {in_use} after; "
+              f"exports running: {running}")
+    finally:
+        if not args.keep:
+            await db.run(db.execute, "DELETE FROM blogs WHERE author = %s", (USER,))
+        db.shutdown_executor()
+        db.close_pool()
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--posts", type=int, default=5000, help="several EXPORT_FETCH_SIZE batches")
+    parser.add_argument("--hold", type=float, default=1.0, help="seconds the DB slots are kept busy")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded posts")
+    sys.exit(0 if asyncio.run(main_async(parser.parse_args())) else 1)
@@ -0,0 +1,144 @@
+"""Checks with EXPLAIN that the hot listing queries are served by indexes.
+
+Seeds a throwaway data set (authors prefixed with "idxcheck_") into the
+database from backend/.env, runs the migrations, ANALYZEs and then asserts
+that none of the queries below does a sequential scan. Plans that still
+need an explicit Sort are reported too; with --strict they also fail (the
+planner may legitimately prefer bitmap scan + sort for small per-author
+result sets). Exits with status 1 if any plan regresses.
+
+    cd backend
+    python benchmarks/check_indexes.py
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+import psycopg2
+
+load_dotenv()
+
+import db
+import main
+import migrations
+
+AUTHOR = "idxcheck_7"
+
+# Built from main.py's own statements, so the check cannot drift from what the endpoints run.
+# "FOLDER" stands for a seeded folder id, "AFTER" for a keyset cursor position (created_at, id).
+HOT_QUERIES = {
+    "get_blogs / get_my_blogs": (
+        main.AUTHOR_BLOGS_SQL.format(columns=main.BLOG_COLUMNS), (AUTHOR,)),
+    "get_root_blogs / root-contents blogs": (
+        main.ROOT_BLOGS_SQL.format(columns=main.BLOG_COLUMNS), (AUTHOR,)),
+    "get_folder_blogs / folder contents blogs": (
+        main.FOLDER_BLOGS_SQL.format(columns=main.BLOG_COLUMNS), ("FOLDER", AUTHOR)),
+    "get_folders": (
+        main.AUTHOR_FOLDERS_SQL.format(columns=main.FOLDER_COLUMNS), (AUTHOR,)),
+    "root-contents folders": (
+        main.ROOT_FOLDERS_SQL.format(columns=main.FOLDER_COLUMNS), (AUTHOR,)),
+    "folder contents subfolders": (
+        main.SUBFOLDERS_SQL.format(columns=main.FOLDER_COLUMNS), ("FOLDER", AUTHOR)),
+    "my-blogs summary first page": (
+        main.blog_summaries_query("", after=False, excerpt=True), (AUTHOR, 21)),
+    "my-blogs summary next page": (
+        main.blog_summaries_query("", after=True, excerpt=True), (AUTHOR, "AFTER", 21)),
+    "root-blogs summary page": (
+        main.blog_summaries_query(main.ROOT_SUMMARY_FILTER, after=True, excerpt=False),
+        (AUTHOR, "AFTER", 21)),
+    "folder blogs summary page": (
+        main.blog_summaries_query(main.FOLDER_SUMMARY_FILTER, after=True, excerpt=False),
+        (AUTHOR, "FOLDER", "AFTER", 21)),
+}
+
+
+def seed(cursor, authors, folders_per_author, blogs_per_author):
+    cursor.execute("DELETE FROM blogs WHERE author LIKE 'idxcheck\\_%%'")
+    cursor.execute("DELETE FROM folders WHERE author LIKE 'idxcheck\\_%%'")
+    cursor.execute('''
+        INSERT INTO folders (name, author, created_at)
+        SELECT 'folder ' || f, 'idxcheck_' || a, now() - (f || ' minutes')::interval
+        FROM generate_series(1, %s) a, generate_series(1, %s) f
+    ''', (authors, folders_per_author))
+    cursor.execute('''
+        INSERT INTO blogs (title, cells, author, folder_id, created_at, updated_at)
+        SELECT 'post ' || b, '[{"id": 1, "type": "text", "content": "seed"}]'::jsonb, 'idxcheck_' || a,
+               CASE WHEN b %% 3 = 0 THEN NULL ELSE (
+                   SELECT id FROM folders WHERE author = 'idxcheck_' || a ORDER BY id OFFSET (b %% %s) LIMIT 1
+               ) END,
+               now() - (b || ' minutes')::interval, now()
+        FROM generate_series(1, %s) a, generate_series(1, %s) b
+    ''', (folders_per_author, authors, blogs_per_author))
+    cursor.execute("ANALYZE blogs")
+    cursor.execute("ANALYZE folders")
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def check(cursor, strict=False):
+    cursor.execute("SELECT id FROM folders WHERE author = %s ORDER BY id LIMIT 1", (AUTHOR,))
+    folder_id = cursor.fetchone()["id"]
+    # Somewhere in the middle of the author's posts, as the second page's cursor would be
+    cursor.execute("SELECT created_at, id FROM blogs WHERE author = %s ORDER BY created_at DESC, id DESC "
+                   "OFFSET 20 LIMIT 1", (AUTHOR,))
+    position = cursor.fetchone()
+    placeholders = {"FOLDER": (folder_id,), "AFTER": (position["created_at"], position["id"])}
+
+    failures = 0
+    for name, (query, params) in HOT_QUERIES.items():
+        params = tuple(value for param in params for value in placeholders.get(param, (param,)))
+        cursor.execute("EXPLAIN (FORMAT JSON) " + query, params)
+        plan = cursor.fetchone()["QUERY PLAN"][0]["Plan"]
+        nodes = list(plan_nodes(plan))
+
+        seq_scans = [n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan"]
+        sorts = [n for n in nodes if n["Node Type"] in ("Sort", "Incremental Sort")]
+        indexes = [n["Index Name"] for n in nodes if "Index Name" in n]
+
+        ok = not seq_scans and bool(indexes) and not (strict and sorts)
+        failures += 0 if ok else 1
+        detail = f"seq_scans={seq_scans} sorts={len(sorts)} indexes={indexes}"
+        print(f"[{'ok' if ok else 'FAIL'}] {name}: {detail}")
+        if not ok:
+            print(json.dumps(plan, indent=2))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Assert hot queries use index scans")
+    parser.add_argument("--authors", type=int, default=200)
+    parser.add_argument("--folders", type=int, default=20)
+    parser.add_argument("--blogs", type=int, default=100)
+    parser.add_argument("--strict", action="store_true", help="also fail on plans with a Sort node")
+    parser.add_argument("--keep", action="store_true", help="keep the seeded rows")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**db.connection_kwargs())
+    try:
+        migrations.migrate(conn)
+        cursor = conn.cursor()
+        seed(cursor, args.authors, args.folders, args.blogs)
+        conn.commit()
+
+        failures = check(cursor, args.strict)
+
+        if not args.keep:
+            cursor.execute("DELETE FROM blogs WHERE author LIKE 'idxcheck\\_%%'")
+            cursor.execute("DELETE FROM folders WHERE author LIKE 'idxcheck\\_%%'")
+            conn.commit()
+    finally:
+        conn.close()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""Load test: throughput and p50/p95/p99 latency per endpoint and concurrency.
+
+Seeds the synthetic data set from seed.py (same arguments; --no-seed reuses
+the loadtest_ data already in the database), logs every account in, then
+drives each scenario for --duration seconds at each --levels concurrency
+(number of requests in flight). Requests go to the app in-process by
+default, which measures the handlers and the database without network or
+uvicorn; with --url they go to a running server instead.
+
+Results are printed and written as JSON (--output, by default
+benchmarks/results/<time>-<commit>.json) together with the commit, the
+data set and the arguments. --baseline prints the change against an
+earlier result file; --compare OLD NEW only compares two files.
+
+    cd backend
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/loadtest.py --users 10 --posts 200 --levels 1 8 32
+    python benchmarks/loadtest.py --no-seed --baseline benchmarks/results/<earlier>.json
+"""
+import argparse
+import asyncio
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# All requests come from one client; the per-client rate limits would only measure themselves
+os.environ.setdefault("RATE_LIMITS", "off")
+
+import httpx
+import orjson
+
+import seed
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class Context:
+    """Tokens and ids the scenarios pick from, plus per-run state."""
+
+    def __init__(self, data, tokens, blog_bodies):
+        self.users = [name for name, user in data["users"].items() if user["blogs"]]
+        self.data = data
+        self.tokens = tokens
+        self.blog_bodies = blog_bodies  # username -> [(id, body)] for updates
+        self.revision = 0
+
+    def auth(self, username):
+        return {"Authorization": f"Bearer {self.tokens[username]}"}
+
+
+# Scenarios: (ctx, rng) -> (method, url, request kwargs)
+
+def login(ctx, rng):
+    username = rng.choice(ctx.users)
+    return "POST", "/api/login", {"json": {"username": username, "password": ctx.data["password"]}}
+
+
+def root_contents(ctx, rng):
+    username = rng.choice(ctx.users)
+    return "GET", "/api/root-contents", {"headers": ctx.auth(username)}
+
+
+def folder_contents(ctx, rng):
+    username = rng.choice(ctx.users)
+    folder_id = rng.choice(ctx.data["users"][username]["folders"])
+    return "GET", f"/api/folders/{folder_id}/contents", {"headers": ctx.auth(username)}
+
+
+def get_blog(ctx, rng):
+    username = rng.choice(ctx.users)
+    return "GET", f"/api/blogs/{rng.choice(ctx.data['users'][username]['blogs'])}", {}
+
+
+def update_blog(ctx, rng):
+    username = rng.choice(ctx.users)
+    blog_id, body = rng.choice(ctx.blog_bodies[username])
+    ctx.revision += 1
+    payload = {**body, "title": f"{body['title']} (rev {ctx.revision})"}
+    return "PUT", f"/api/blogs/{blog_id}", {"json": payload, "headers": ctx.auth(username)}
+
+
+def my_blogs_summary(ctx, rng):
+    username = rng.choice(ctx.users)
+    return "GET", "/api/my-blogs/summary?limit=20", {"headers": ctx.auth(username)}
+
+
+def folder_blogs_summary(ctx, rng):
+    username = rng.choice(ctx.users)
+    folder_id = rng.choice(ctx.data["users"][username]["folders"])
+    return "GET", f"/api/folders/{folder_id}/blogs/summary?limit=20", {"headers": ctx.auth(username)}
+
+
+def folders(ctx, rng):
+    username = rng.choice(ctx.users)
+    return "GET", "/api/folders", {"headers": ctx.auth(username)}
+
+
+def folder_tree(ctx, rng):
+    username = rng.choice(ctx.users)
+    return "GET", "/api/folders/tree", {"headers": ctx.auth(username)}
+
+
+def my_blogs(ctx, rng):
+    username = rng.choice(ctx.users)
+    return "GET", "/api/my-blogs", {"headers": ctx.auth(username)}
+
+
+SCENARIOS = {
+    "login": login,
+    "root_contents": root_contents,
+    "folder_contents": folder_contents,
+    "get_blog": get_blog,
+    "update_blog": update_blog,
+    "my_blogs_summary": my_blogs_summary,
+    "folder_blogs_summary": folder_blogs_summary,
+    "folders": folders,
+    "folder_tree": folder_tree,
+    "my_blogs": my_blogs,
+}
+
+# Roughly what a browsing session does; "mixed" draws from these
+MIXED_WEIGHTS = {
+    "get_blog": 40,
+    "root_contents": 15,
+    "folder_contents": 15,
+    "my_blogs_summary": 10,
+    "folder_blogs_summary": 8,
+    "folders": 5,
+    "update_blog": 5,
+    "folder_tree": 2,
+}
+
+
+def mixed(ctx, rng):
+    name = rng.choices(list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values()))[0]
+    return SCENARIOS[name](ctx, rng)
+
+
+SCENARIOS["mixed"] = mixed
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(scenario, concurrency, latencies, statuses, errors, elapsed):
+    latencies.sort()
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "status_codes": {str(code): count for code, count in sorted(statuses.items(), key=lambda item: str(item[0]))},
+        "duration_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+            "p50": ms(percentile(latencies, 50)),
+            "p95": ms(percentile(latencies, 95)),
+            "p99": ms(percentile(latencies, 99)),
+            "max": ms(latencies[-1]) if latencies else None,
+        },
+    }
+
+
+async def run_level(client, ctx, scenario, concurrency, duration, warmup, seed_value):
+    make_request = SCENARIOS[scenario]
+    latencies, statuses = [], Counter()
+    errors = 0
+    measuring = False
+    deadline = time.perf_counter() + warmup
+
+    async def worker(n):
+        nonlocal errors
+        rng = random.Random(f"{seed_value}-{scenario}-{concurrency}-{n}")
+        while time.perf_counter() < deadline:
+            method, url, kwargs = make_request(ctx, rng)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                await response.aread()
+                status = response.status_code
+            except httpx.HTTPError:
+                status = "exception"
+            latency = time.perf_counter() - started
+            if measuring:
+                statuses[status] += 1
+                if status == "exception" or status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(latency)
+
+    if warmup > 0:
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    measuring = True
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return summarize(scenario, concurrency, latencies, statuses, errors, time.perf_counter() - started)
+
+
+async def prepare(client, data, update_pool):
+    tokens, blog_bodies = {}, {}
+    for username, user in data["users"].items():
+        response = await client.post("/api/login", json={"username": username, "password": data["password"]})
+        response.raise_for_status()
+        tokens[username] = response.json()["token"]
+        bodies = []
+        for blog_id in user["blogs"][:update_pool]:
+            blog = (await client.get(f"/api/blogs/{blog_id}")).json()
+            bodies.append((blog_id, {"title": blog["title"], "cells": blog["cells"], "folder_id": blog["folder_id"]}))
+        blog_bodies[username] = bodies
+    return Context(data, tokens, blog_bodies)
+
+
+def git_revision():
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=BENCH_DIR, capture_output=True, text=True,
+                                  timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def print_table(results):
+    print(f"{'scenario':22} {'conc':>5} {'req':>7} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for row in results:
+        latency = row["latency_ms"]
+        fmt = lambda value: f"{value:>9.2f}" if value is not None else f"{'-':>9}"
+        print(f"{row['scenario']:22} {row['concurrency']:>5} {row['requests']:>7} {row['errors']:>5} "
+              f"{row['throughput_rps']:>9.1f} {fmt(latency['p50'])} {fmt(latency['p95'])} {fmt(latency['p99'])}")
+
+
+def compare(old, new):
+    """Prints throughput and p95/p99 changes for scenario/concurrency pairs present in both results."""
+    previous = {(row["scenario"], row["concurrency"]): row for row in old["results"]}
+    print(f"compared with {old['meta'].get('commit') or '?'} ({old['meta'].get('timestamp')})")
+    print(f"{'scenario':22} {'conc':>5} {'req/s':>16} {'p95 ms':>18} {'p99 ms':>18}")
+
+    def change(before, after):
+        if not before or after is None:
+            return f"{'-':>18}"
+        return f"{after:>9.1f} {(after - before) / before * 100:>+7.1f}%"
+
+    matched = 0
+    for row in new["results"]:
+        before = previous.get((row["scenario"], row["concurrency"]))
+        if before is None:
+            continue
+        matched += 1
+        rps = row["throughput_rps"]
+        rps_change = (rps - before["throughput_rps"]) / before["throughput_rps"] * 100 if before["throughput_rps"] else 0.0
+        print(f"{row['scenario']:22} {row['concurrency']:>5} {rps:>8.1f} {rps_change:>+6.1f}% "
+              f"{change(before['latency_ms']['p95'], row['latency_ms']['p95'])} "
+              f"{change(before['latency_ms']['p99'], row['latency_ms']['p99'])}")
+    if not matched:
+        print("no scenario/concurrency pairs in common")
+
+
+def load_result(path):
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+async def main_async(args):
+    if args.no_seed:
+        conn = seed.connect()
+        try:
+            data = seed.manifest(conn)
+        finally:
+            conn.close()
+    else:
+        print("seeding...")
+        data = seed.generate_from_args(args)
+    if not data["users"]:
+        raise SystemExit("No loadtest_ data in the database; run without --no-seed first")
+    print(f"data set: {orjson.dumps(data['totals']).decode()}")
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout,
+                                   limits=httpx.Limits(max_connections=max(args.levels)))
+    else:
+        import db
+        import main
+        await main.prepare()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://loadtest",
+                                   timeout=args.timeout)
+
+    results = []
+    try:
+        async with client:
+            ctx = await prepare(client, data, args.update_pool)
+            for scenario in args.scenarios:
+                for concurrency in args.levels:
+                    result = await run_level(client, ctx, scenario, concurrency, args.duration, args.warmup, args.seed)
+                    results.append(result)
+                    print_table([result])
+    finally:
+        if not args.url:
+            db.shutdown_executor()
+            db.close_pool()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            **git_revision(),
+            "target": args.url or "in-process",
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "dataset": data["totals"],
+        "results": results,
+    }
+    output = args.output
+    if output is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(BENCH_DIR, "results", f"{stamp}-{(report['meta']['commit'] or 'nogit')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "wb") as f:
+        f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
+    print()
+    print_table(results)
+    print(f"\nresults written to {output}")
+
+    if args.baseline:
+        print()
+        compare(load_result(args.baseline), report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    seed.add_arguments(parser)
+    parser.add_argument("--no-seed", action="store_true", help="reuse the loadtest_ data in the database")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 8, 32], help="requests in flight")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per scenario and level")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds run before measuring")
+    parser.add_argument("--update-pool", type=int, default=20, help="posts per user that update_blog rewrites")
+    parser.add_argument("--url", help="base URL of a running server instead of the in-process app")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--output", help="result file (default benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--baseline", help="earlier result file to compare with")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="only compare two result files")
+    args = parser.parse_args()
+    if args.compare:
+        compare(load_result(args.compare[0]), load_result(args.compare[1]))
+    else:
+        asyncio.run(main_async(args))
@@ -0,0 +1,232 @@
+"""Synthetic data set for the load tests.
+
+Creates --users accounts (usernames prefixed with "loadtest_", password
+"loadtest"), each with --folders folders nested up to --depth levels and
+--posts posts. A post has about --cells cells drawn from a text/code/media
+mix (--mix, relative weights); media cells point at --media-files blobs
+stored through media.store_bytes like uploads. Everything is derived from
+--seed, so the same arguments give the same data set. Earlier loadtest_
+data is removed first.
+
+    cd backend
+    python benchmarks/seed.py --users 10 --posts 200
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+import orjson
+import psycopg2
+from psycopg2.extras import execute_values
+
+load_dotenv()
+
+import db
+import media
+import migrations
+import passwords
+
+PREFIX = "loadtest_"
+PASSWORD = "loadtest"
+
+WORDS = (
+    "postgres index query cache latency python async event loop worker pool "
+    "request response json folder blog post cell media image video code text "
+    "search vector snapshot cursor batch stream export import replica lock "
+    "transaction commit rollback benchmark throughput percentile the a of and "
+    "to in is for with on that this by from as are be it at or an"
+).split()
+
+CODE_SNIPPETS = [
+    "def {name}(items):\n    total = 0\n    for item in items:\n        total += item.{field}\n    return total\n",
+    "SELECT {field}, count(*)\nFROM {name}\nWHERE created_at > now() - interval '7 days'\nGROUP BY {field};\n",
+    "export async function {name}(id) {{\n  const response = await api.get(`/{field}/${{id}}`);\n  return response.data;\n}}\n",
+    "for f in {name}/*.json; do\n  jq '.{field}' \"$f\"\ndone\n",
+]
+
+
+def _sentence(rng, words):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def _text_cell(rng):
+    paragraphs = [" ".join(_sentence(rng, rng.randint(6, 18)) for _ in range(rng.randint(2, 6)))
+                  for _ in range(rng.randint(1, 3))]
+    return "\n\n".join(paragraphs)
+
+
+def _code_cell(rng):
+    template = rng.choice(CODE_SNIPPETS)
+    return "".join(template.format(name=rng.choice(WORDS) + str(n), field=rng.choice(WORDS))
+                   for n in range(rng.randint(1, 4)))
+
+
+def _media_cell(rng, media_pool):
+    return [{**item, "id": n + 1} for n, item in enumerate(rng.sample(media_pool, rng.randint(1, min(3, len(media_pool)))))]
+
+
+def _cells(rng, count, mix, media_pool):
+    kinds = rng.choices(["text", "code", "media"], weights=mix, k=count)
+    cells = []
+    for cell_id, kind in enumerate(kinds, start=1):
+        if kind == "media" and not media_pool:
+            kind = "text"
+        if kind == "text":
+            content = _text_cell(rng)
+        elif kind == "code":
+            content = _code_cell(rng)
+        else:
+            content = _media_cell(rng, media_pool)
+        cells.append({"id": cell_id, "type": kind, "content": content})
+    return cells
+
+
+def _store_media(cursor, rng, count):
+    """Random-content blobs of image-like sizes, registered in the media table."""
+    pool, stored = [], []
+    for n in range(count):
+        content_type = "video/mp4" if n % 5 == 4 else rng.choice(["image/png", "image/jpeg"])
+        data = rng.randbytes(rng.randint(20 * 1024, 400 * 1024))
+        sha256, size = media.store_bytes(data)
+        stored.append((sha256, content_type, size))
+        extension = content_type.split("/")[1]
+        pool.append({"name": f"{PREFIX}{n}.{extension}", "type": content_type, "size": size,
+                     "sha256": sha256, "url": media.media_url(sha256)})
+    media.register_media(cursor, stored, PREFIX + "seed")
+    return pool
+
+
+def _folder_levels(rng, count, depth):
+    """Splits count folders into depth levels, with the widest level at the top."""
+    levels = [[] for _ in range(depth)]
+    for n in range(count):
+        level = 0 if n < max(1, count // depth) else rng.randint(1, depth - 1)
+        levels[level].append(n)
+    return [level for level in levels if level]
+
+
+def clear(cursor):
+    cursor.execute("DELETE FROM blogs WHERE author LIKE %s", (PREFIX + "%",))
+    cursor.execute("DELETE FROM folders WHERE author LIKE %s", (PREFIX + "%",))
+    cursor.execute("DELETE FROM users WHERE username LIKE %s", (PREFIX + "%",))
+
+
+def generate(conn, users=10, folders=30, depth=4, posts=200, cells=12, mix=(6, 3, 1), media_files=20, seed=1):
+    rng = random.Random(seed)
+    cursor = conn.cursor()
+    clear(cursor)
+
+    # One hash for every account; hashing per user would dominate seeding
+    password_hash = passwords.context.hash(PASSWORD)
+    usernames = [f"{PREFIX}{n}" for n in range(users)]
+    execute_values(cursor, "INSERT INTO users (username, password, email) VALUES %s",
+                   [(name, password_hash, f"{name}@example.com") for name in usernames])
+
+    media_pool = _store_media(cursor, rng, media_files)
+    now = datetime.now().replace(microsecond=0)
+
+    for username in usernames:
+        folder_ids = []
+        parents = [None]
+        for level in _folder_levels(rng, folders, depth):
+            rows = execute_values(
+                cursor,
+                "INSERT INTO folders (name, parent_id, author) VALUES %s RETURNING id",
+                [(f"{rng.choice(WORDS).title()} {n}", rng.choice(parents), username) for n in level],
+                fetch=True,
+            )
+            parents = [row["id"] for row in rows]
+            folder_ids.extend(parents)
+
+        # About a fifth of the posts stay at the root
+        placements = folder_ids + [None] * max(1, len(folder_ids) // 4)
+        blogs = []
+        for n in range(posts):
+            created = now - timedelta(seconds=rng.randint(0, 365 * 24 * 3600))
+            count = rng.randint(max(1, cells // 2), max(1, cells * 3 // 2))
+            blogs.append((
+                _sentence(rng, rng.randint(3, 8))[:-1],
+                orjson.dumps(_cells(rng, count, mix, media_pool)).decode(),
+                username,
+                rng.choice(placements),
+                created,
+                created + timedelta(seconds=rng.randint(0, 30 * 24 * 3600)),
+            ))
+        execute_values(
+            cursor,
+            "INSERT INTO blogs (title, cells, author, folder_id, created_at, updated_at) VALUES %s",
+            blogs,
+            template="(%s, %s::jsonb, %s, %s, %s, %s)",
+            page_size=500,
+        )
+    conn.commit()
+    cursor.execute("ANALYZE blogs")
+    cursor.execute("ANALYZE folders")
+    conn.commit()
+    return manifest(conn)
+
+
+def manifest(conn):
+    """The seeded accounts with their folder and blog ids."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT username FROM users WHERE username LIKE %s ORDER BY username", (PREFIX + "%",))
+    users = {row["username"]: {"folders": [], "blogs": []} for row in cursor.fetchall()}
+    cursor.execute("SELECT id, author FROM folders WHERE author LIKE %s ORDER BY id", (PREFIX + "%",))
+    for row in cursor.fetchall():
+        users[row["author"]]["folders"].append(row["id"])
+    cursor.execute("SELECT id, author FROM blogs WHERE author LIKE %s ORDER BY id", (PREFIX + "%",))
+    for row in cursor.fetchall():
+        users[row["author"]]["blogs"].append(row["id"])
+    cursor.execute("SELECT coalesce(sum(jsonb_array_length(cells)), 0) AS cells FROM blogs WHERE author LIKE %s",
+                   (PREFIX + "%",))
+    totals = cursor.fetchone()
+    return {
+        "password": PASSWORD,
+        "users": users,
+        "totals": {
+            "users": len(users),
+            "folders": sum(len(user["folders"]) for user in users.values()),
+            "blogs": sum(len(user["blogs"]) for user in users.values()),
+            "cells": totals["cells"],
+        },
+    }
+
+
+def connect():
+    conn = psycopg2.connect(**db.connection_kwargs())
+    migrations.migrate(conn)
+    return conn
+
+
+def add_arguments(parser):
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--folders", type=int, default=30, help="folders per user")
+    parser.add_argument("--depth", type=int, default=4, help="folder nesting levels")
+    parser.add_argument("--posts", type=int, default=200, help="posts per user")
+    parser.add_argument("--cells", type=int, default=12, help="average cells per post")
+    parser.add_argument("--mix", type=int, nargs=3, default=[6, 3, 1], metavar=("TEXT", "CODE", "MEDIA"),
+                        help="relative weights of cell types")
+    parser.add_argument("--media-files", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+
+
+def generate_from_args(args):
+    conn = connect()
+    try:
+        return generate(conn, users=args.users, folders=args.folders, depth=args.depth, posts=args.posts,
+                        cells=args.cells, mix=args.mix, media_files=args.media_files, seed=args.seed)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    result = generate_from_args(parser.parse_args())
+    print(orjson.dumps(result["totals"]).decode())
@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """In-process LRU cache bounded by total value size in bytes.
+
+    Entries expire after ttl seconds, which bounds staleness when several
+    worker processes each keep their own copy. A fill that started before an
+    invalidation of the same key is rejected (see begin_fill/put), so a slow
+    reader cannot put back a row that was updated meanwhile.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes=None, ttl=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes or max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size, stored_at)
+        self._bytes = 0
+        self._clock = 0
+        self._invalidated = OrderedDict()  # key -> clock at invalidation
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.rejected = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[2] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def begin_fill(self):
+        """Token to pass to put() for a value about to be loaded from the database."""
+        with self._lock:
+            return self._clock
+
+    def put(self, key, value, size, token=None):
+        with self._lock:
+            if size > self.max_entry_bytes:
+                self.rejected += 1
+                return False
+            if token is not None and self._invalidated.get(key, -1) > token:
+                self.rejected += 1
+                return False
+
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+            return True
+
+    def update(self, key, value, size):
+        """Replaces the value of a cached entry, keeping its age. No-op if the key is no longer cached."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or size > self.max_entry_bytes:
+                return False
+            self._bytes += size - entry[1]
+            self._entries[key] = (value, size, entry[2])
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+            return True
+
+    def invalidate(self, *keys):
+        with self._lock:
+            self._clock += 1
+            for key in keys:
+                self._invalidated[key] = self._clock
+                self._invalidated.move_to_end(key)
+                if key in self._entries:
+                    self._remove(key)
+                    self.invalidations += 1
+            while len(self._invalidated) > 10000:
+                self._invalidated.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "rejected": self.rejected,
+            }
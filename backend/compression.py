@@ -0,0 +1,196 @@
+"""Negotiated response compression (zstd, br, gzip).
+
+brotli and zstandard are optional: an encoding whose module is not
+installed is simply never offered. CompressionMiddleware compresses
+textual responses of at least COMPRESSION_MIN_BYTES, streaming ones chunk
+by chunk. Responses that already carry a Content-Encoding (such as the
+precompressed blog bodies in main.py) are passed through unchanged.
+"""
+import gzip
+import os
+import zlib
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+MINIMUM_SIZE = int(os.getenv("COMPRESSION_MIN_BYTES") or 1024)
+# Larger bodies are compressed on a worker thread instead of the event loop
+THREAD_THRESHOLD = 256 * 1024
+
+# Server preference, best ratio first
+ENCODINGS = [name for name, available in (
+    ("zstd", zstandard is not None),
+    ("br", brotli is not None),
+    ("gzip", True),
+) if available]
+
+# Per-request compression favours speed; bodies that are cached and reused
+# (see main.get_blog) are compressed once, so they can afford a higher level.
+DYNAMIC_LEVELS = {"zstd": 3, "br": 4, "gzip": 6}
+STATIC_LEVELS = {"zstd": 12, "br": 9, "gzip": 9}
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/x-ndjson", "application/javascript",
+    "application/xml", "image/svg+xml",
+)
+
+
+def negotiate(accept_encoding):
+    """Picks the encoding for an Accept-Encoding header value, or None for identity."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    candidates = [(accepted.get(name, wildcard), -rank, name) for rank, name in enumerate(ENCODINGS)]
+    quality, _, name = max(candidates)
+    return name if quality > 0 else None
+
+
+def compress(data, encoding, level=None):
+    level = DYNAMIC_LEVELS[encoding] if level is None else level
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"Unsupported encoding {encoding}")
+
+
+async def compress_async(data, encoding, level=None):
+    if len(data) >= THREAD_THRESHOLD:
+        return await run_in_threadpool(compress, data, encoding, level)
+    return compress(data, encoding, level)
+
+
+class _StreamCompressor:
+    def __init__(self, encoding):
+        level = DYNAMIC_LEVELS[encoding]
+        if encoding == "gzip":
+            obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.compress, self.finish = obj.compress, obj.flush
+        elif encoding == "br":
+            obj = brotli.Compressor(quality=level)
+            self.compress, self.finish = obj.process, obj.finish
+        else:
+            obj = zstandard.ZstdCompressor(level=level).compressobj()
+            self.compress, self.finish = obj.compress, obj.flush
+
+
+def encoded_etag(etag, encoding):
+    """ETag of an encoded representation: '"abc"' -> '"abc-br"'."""
+    return etag if encoding is None else f'{etag[:-1]}-{encoding}"'
+
+
+def base_etag(etag):
+    """Reverses encoded_etag() and weakening, so a validator matches whatever encoding the client holds."""
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    for encoding in ("zstd", "br", "gzip"):
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+def is_compressible(headers):
+    content_type = headers.get("content-type", "")
+    return "content-encoding" not in headers and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size=MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+
+
+class _CompressingSend:
+    def __init__(self, send, encoding, minimum_size):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start = None
+        self.active = None  # None: undecided, False: pass through, True: compressing a stream
+        self.compressor = None
+
+    def _set_headers(self, length=None):
+        headers = MutableHeaders(scope=self.start)
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        if length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(length)
+        # The compressed bytes differ per encoding, so a strong validator becomes weak
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            if message["status"] < 200 or message["status"] in (204, 206, 304) or \
+                    not is_compressible(Headers(raw=message["headers"])):
+                self.active = False
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body" or self.active is False:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.active is None:
+            if not more_body:
+                # Whole body in one message
+                if len(body) < self.minimum_size:
+                    await self.send(self.start)
+                    await self.send(message)
+                    return
+                compressed = await compress_async(body, self.encoding)
+                self._set_headers(len(compressed))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": compressed})
+                return
+            self.active = True
+            self.compressor = _StreamCompressor(self.encoding)
+            self._set_headers()
+            await self.send(self.start)
+
+        data = self.compressor.compress(body) if body else b""
+        if not more_body:
+            data += self.compressor.finish()
+        if data or not more_body:
+            await self.send({"type": "http.response.body", "body": data, "more_body": more_body})
@@ -0,0 +1,764 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor
+
+import metrics
+import replicas
+import slowlog
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseUnavailable(Exception):
+    """Raised when a connection could not be obtained from the pool."""
+
+
+class PoolTimeout(DatabaseUnavailable):
+    pass
+
+
+class ExecutorBusy(Exception):
+    """Raised when a request's query is shed instead of queued (see AsyncExecutor)."""
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def connection_kwargs():
+    pg_db = os.getenv("PG_DB")
+    pg_user = os.getenv("PG_USERNAME")
+    pg_pass = os.getenv("PG_PASSWORD")
+    pg_host = os.getenv("PG_HOST")
+    pg_port = os.getenv("PG_PORT")
+
+    missing = [name for name, val in [
+        ("PG_DB", pg_db), ("PG_USERNAME", pg_user), ("PG_PASSWORD", pg_pass), ("PG_HOST", pg_host), ("PG_PORT", pg_port)
+    ] if not val]
+
+    if missing:
+        raise RuntimeError(f"Missing required Postgres env vars: {', '.join(missing)}")
+
+    return {
+        "dbname": pg_db,
+        "user": pg_user,
+        "password": pg_pass,
+        "host": pg_host,
+        "port": pg_port,
+        "cursor_factory": TimedCursor,
+    }
+
+
+def _replica_dsns():
+    return [dsn.strip() for dsn in os.getenv("PG_REPLICA_DSNS", "").split(";") if dsn.strip()]
+
+
+def replica_connection_kwargs():
+    """Connection settings per replica in PG_REPLICA_DSNS (libpq DSNs or URIs, separated by ';').
+
+    Whatever a DSN leaves out (user, password, dbname...) is taken from the
+    primary's PG_* settings, so "host=replica1 port=5433" is enough.
+    """
+    primary = connection_kwargs()
+    return [{**primary, **extensions.parse_dsn(dsn)} for dsn in _replica_dsns()]
+
+
+# Statements that change data. Anything else (SELECT, FETCH...) does not make a call a write;
+# data-modifying CTEs start with WITH and are counted too
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "WITH")
+
+# Set by AsyncExecutor._call while a call runs on the primary with replicas configured
+_wrote = contextvars.ContextVar("db_wrote", default=None)
+
+
+def _mark_write(query):
+    flag = _wrote.get()
+    if flag is None or flag[0]:
+        return
+    if isinstance(query, bytes):
+        query = query[:16].decode("ascii", "replace")
+    elif not isinstance(query, str):
+        flag[0] = True  # psycopg2.sql objects: assume the worst
+        return
+    flag[0] = query.lstrip(" \n\t(")[:6].upper().startswith(WRITE_STATEMENTS)
+
+
+class TimedCursor(RealDictCursor):
+    """RealDictCursor that reports each statement's time and row count to metrics,
+    and statements over the slow-query threshold to slowlog.
+
+    Server-side (named) cursors do their work when rows are fetched, so
+    their fetches are timed as well.
+    """
+
+    def execute(self, query, vars=None):
+        _mark_write(query)
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.record_query(query, elapsed, self.rowcount)
+        if elapsed >= slowlog.THRESHOLD_SECONDS:
+            slowlog.record(self, query, vars, elapsed)
+        return result
+
+    def executemany(self, query, vars_list):
+        _mark_write(query)
+        started = time.perf_counter()
+        try:
+            result = super().executemany(query, vars_list)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.record_query(query, elapsed, self.rowcount)
+        if elapsed >= slowlog.THRESHOLD_SECONDS:
+            slowlog.record(self, query, None, elapsed)
+        return result
+
+    def fetchmany(self, size=None):
+        if self.name is None:
+            return super().fetchmany(size)
+        started = time.perf_counter()
+        rows = super().fetchmany(size)
+        metrics.record_query("FETCH", time.perf_counter() - started, len(rows))
+        return rows
+
+    def fetchall(self):
+        if self.name is None:
+            return super().fetchall()
+        started = time.perf_counter()
+        rows = super().fetchall()
+        metrics.record_query("FETCH", time.perf_counter() - started, len(rows))
+        return rows
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections.
+
+    Connections are checked for health on checkout and rolled back / reset
+    when they are returned, so a handler never sees state left behind by
+    the previous user of the connection.
+    """
+
+    def __init__(self, connect_kwargs, minconn=1, maxconn=10, timeout=10.0, check_idle=30.0, max_lifetime=3600.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size: need 0 <= minconn <= maxconn and maxconn >= 1")
+
+        self.connect_kwargs = connect_kwargs
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        self._idle = []  # [(conn, returned_at)]
+        self._created_at = {}  # id(conn) -> created timestamp
+        self._size = 0
+        self._closed = True
+
+        self._waiting = 0
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._health_failures = 0
+        self._resets = 0
+        self._discarded = 0
+
+    # Lifecycle
+    def open(self):
+        with self._cond:
+            self._closed = False
+        for _ in range(self.minconn):
+            with self._cond:
+                self._size += 1
+            conn = self._connect()
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+
+    def warm(self, count):
+        """Opens connections in parallel until count (at most maxconn) are open; returns how many were opened.
+
+        Meant for startup, so the first requests do not pay for connecting.
+        """
+        with self._cond:
+            missing = min(count, self.maxconn) - self._size
+            if missing <= 0 or self._closed:
+                return 0
+            self._size += missing
+        with ThreadPoolExecutor(max_workers=missing, thread_name_prefix="db-warm") as connector:
+            futures = [connector.submit(self._connect) for _ in range(missing)]
+        opened = 0
+        for future in futures:
+            if future.exception() is not None:
+                continue
+            with self._cond:
+                closed = self._closed
+                if not closed:
+                    self._idle.append((future.result(), time.monotonic()))
+                    self._cond.notify()
+            if closed:
+                self._drop(future.result())
+                continue
+            opened += 1
+        return opened
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._drop(conn)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def _connect(self):
+        # The caller has already reserved a slot by incrementing _size
+        try:
+            conn = psycopg2.connect(**self.connect_kwargs)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        self._created_at[id(conn)] = time.monotonic()
+        return conn
+
+    def _drop(self, conn):
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _is_healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if time.monotonic() - self._created_at.get(id(conn), 0) > self.max_lifetime:
+            return False
+        if idle_for < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    # Checkout / return
+    def getconn(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            conn = None
+            returned_at = None
+            create = False
+
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                self._waiting += 1
+                try:
+                    while not self._idle and self._size >= self.maxconn:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._timeouts += 1
+                            raise PoolTimeout(f"Timed out after {timeout:.1f}s waiting for a database connection")
+                        self._cond.wait(remaining)
+                        if self._closed:
+                            raise RuntimeError("Connection pool is closed")
+                finally:
+                    self._waiting -= 1
+
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                conn = self._connect()
+            elif not self._is_healthy(conn, time.monotonic() - returned_at):
+                with self._cond:
+                    self._health_failures += 1
+                self._discard(conn)
+                continue
+
+            waited = time.monotonic() - started
+            with self._cond:
+                self._checkouts += 1
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+            return conn
+
+    def putconn(self, conn):
+        if conn.closed or self._closed:
+            self._discard(conn)
+            return
+
+        try:
+            status = conn.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._discard(conn)
+                return
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+                with self._cond:
+                    self._resets += 1
+            if conn.autocommit:
+                conn.autocommit = False
+        except Exception:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            if self._closed:
+                closed = True
+            else:
+                closed = False
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+        if closed:
+            self._drop(conn)
+
+    def _discard(self, conn):
+        with self._cond:
+            self._discarded += 1
+        self._drop(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        with self._cond:
+            in_use = self._size - len(self._idle)
+            return {
+                "min_size": self.minconn,
+                "max_size": self.maxconn,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "waiting": self._waiting,
+                "checkouts": self._checkouts,
+                "timeouts": self._timeouts,
+                "wait_avg_ms": round(self._wait_total / self._checkouts * 1000, 3) if self._checkouts else 0.0,
+                "wait_max_ms": round(self._wait_max * 1000, 3),
+                "health_check_failures": self._health_failures,
+                "resets": self._resets,
+                "discarded": self._discarded,
+                "closed": self._closed,
+            }
+
+
+pool = None
+read_replicas = []  # replicas.Replica per PG_REPLICA_DSNS entry
+
+
+def open_pool():
+    global pool
+    if pool is not None and not pool.closed:
+        return pool
+    pool = ConnectionPool(
+        connection_kwargs(),
+        minconn=_env_int("PG_POOL_MIN", 1),
+        maxconn=_env_int("PG_POOL_MAX", 10),
+        timeout=_env_float("PG_POOL_TIMEOUT", 10.0),
+        check_idle=_env_float("PG_POOL_CHECK_IDLE", 30.0),
+        max_lifetime=_env_float("PG_POOL_MAX_LIFETIME", 3600.0),
+    )
+    try:
+        pool.open()
+    finally:
+        # Also when the primary is down: the pool stays published (it connects on demand),
+        # so a later call returns early and would never get to the replicas
+        if not read_replicas:
+            _open_replicas()
+    return pool
+
+
+def _open_replicas():
+    for kwargs in replica_connection_kwargs():
+        replica_pool = ConnectionPool(
+            kwargs,
+            minconn=_env_int("PG_REPLICA_POOL_MIN", _env_int("PG_POOL_MIN", 1)),
+            maxconn=_env_int("PG_REPLICA_POOL_MAX", _env_int("PG_POOL_MAX", 10)),
+            # A busy replica is skipped for the primary rather than waited for
+            timeout=_env_float("PG_REPLICA_POOL_TIMEOUT", 1.0),
+            check_idle=_env_float("PG_POOL_CHECK_IDLE", 30.0),
+            max_lifetime=_env_float("PG_POOL_MAX_LIFETIME", 3600.0),
+        )
+        replica = replicas.Replica(f"{kwargs.get('host')}:{kwargs.get('port') or 5432}", replica_pool)
+        try:
+            replica_pool.open()
+        except Exception as e:
+            logger.warning("Could not connect to replica %s, reads go to the primary for now: %s", replica.name, e)
+            replica.mark_down()
+        read_replicas.append(replica)
+
+
+def close_pool():
+    global pool
+    if pool is not None:
+        pool.close()
+        pool = None
+    for replica in read_replicas:
+        replica.pool.close()
+    read_replicas.clear()
+
+
+def get_pool():
+    if pool is None or pool.closed:
+        raise RuntimeError("Database pool is not initialized")
+    return pool
+
+
+def connection():
+    """Checks out a connection, opening the pool lazily if startup could not."""
+    try:
+        current = pool if pool is not None and not pool.closed else open_pool()
+        conn = current.getconn()
+    except DatabaseUnavailable:
+        raise
+    except Exception as e:
+        raise DatabaseUnavailable(str(e)) from e
+    return current, conn
+
+
+_next_replica = 0
+
+
+def _replay_lsn(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_last_wal_replay_lsn()::text AS lsn")
+        lsn = cursor.fetchone()["lsn"]
+    conn.commit()
+    return replicas.parse_lsn(lsn)
+
+
+def read_connection(min_lsn):
+    """Checks out a connection for a read that must see min_lsn: a replica that has replayed it, else the primary.
+
+    Returns (pool, conn, replica, bound); replica is None for the primary and
+    the data read is at least as new as bound.
+    """
+    global _next_replica
+    count = len(read_replicas)
+    start, _next_replica = _next_replica, (_next_replica + 1) % max(count, 1)
+    for n in range(count):
+        replica = read_replicas[(start + n) % count]
+        if not replica.available:
+            continue
+        try:
+            conn = replica.pool.getconn()
+        except PoolTimeout:
+            continue
+        except Exception as e:
+            logger.warning("Replica %s is unavailable: %s", replica.name, e)
+            replica.mark_down()
+            continue
+        if replica.replay_lsn < min_lsn:
+            try:
+                replica.saw(_replay_lsn(conn))
+            except Exception as e:
+                logger.warning("Replica %s is unavailable: %s", replica.name, e)
+                replica.pool.putconn(conn)
+                replica.mark_down()
+                continue
+            if replica.replay_lsn < min_lsn:
+                replica.lagging += 1
+                replica.pool.putconn(conn)
+                continue
+        replica.reads += 1
+        replicas.READS.inc(target="replica")
+        return replica.pool, conn, replica, max(replica.replay_lsn, min_lsn)
+
+    replicas.READS.inc(target="primary")
+    current, conn = connection()
+    return current, conn, None, max(min_lsn, replicas.primary_lsn())
+
+
+def _replica_failed(conn, error):
+    """Whether a read may run again on the primary: the replica went away, or cancelled it for a recovery conflict."""
+    return bool(conn.closed) or isinstance(error, (psycopg2.errors.SerializationFailure, psycopg2.errors.AdminShutdown))
+
+
+def current_wal_lsn(conn):
+    """The primary's current WAL position, as an int."""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_current_wal_lsn()::text AS lsn")
+        lsn = replicas.parse_lsn(cursor.fetchone()["lsn"])
+    conn.commit()
+    return lsn
+
+
+def _note_write(conn):
+    replicas.note_write(current_wal_lsn(conn))
+
+
+# Async data access
+#
+# psycopg2 is a blocking driver, so every query runs on a dedicated thread
+# pool instead of the event loop. The semaphore bounds the number of queries
+# in flight; callers beyond that wait on the event loop without holding a
+# thread or a connection.
+#
+# Request handlers go through admit() (or read(), which may use a replica),
+# which bound that wait too: when max_queue calls are already waiting, or a
+# call has waited queue_timeout seconds, it raises ExecutorBusy and the API
+# answers 503 with Retry-After.
+# A burst then costs the clients that arrive last a quick retry instead of
+# making every request slower without limit. Background work (jobs, the
+# statements of a connection that is already held) uses run()/call() and
+# always waits its turn.
+
+class AsyncExecutor:
+    def __init__(self, max_workers, max_queue=None, queue_timeout=None):
+        self.max_workers = max_workers
+        self.max_queue = max_queue if max_queue is not None else 10 * max_workers
+        self.queue_timeout = queue_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="db")
+        self._semaphore = None
+        self._in_flight = 0
+        self._queued = 0
+        self._completed = 0
+        self._rejected = 0
+        self._timed_out = 0
+
+    def _call(self, fn, args, kwargs, queued_at, read=False):
+        if read and read_replicas:
+            return self._read(fn, args, kwargs, queued_at)
+        current, conn = connection()
+        metrics.record_db_acquire(time.perf_counter() - queued_at)
+        # With replicas, a call that wrote reports the primary's LSN once it has committed
+        wrote = [False] if read_replicas else None
+        token = _wrote.set(wrote)
+        try:
+            result = fn(conn, *args, **kwargs)
+            _wrote.reset(token)
+            if wrote and wrote[0]:
+                _note_write(conn)
+            elif read:
+                replicas.note_read(max(replicas.min_lsn(), replicas.primary_lsn()))
+            return result
+        finally:
+            current.putconn(conn)
+
+    def _read(self, fn, args, kwargs, queued_at):
+        current, conn, replica, bound = read_connection(replicas.min_lsn())
+        metrics.record_db_acquire(time.perf_counter() - queued_at)
+        retry = False
+        try:
+            result = fn(conn, *args, **kwargs)
+        except (psycopg2.OperationalError, psycopg2.errors.SerializationFailure) as e:
+            if replica is None or not _replica_failed(conn, e):
+                raise
+            logger.warning("Read on replica %s failed, retrying on the primary: %s", replica.name, e)
+            if conn.closed:
+                replica.mark_down()
+            retry = True
+        finally:
+            current.putconn(conn)
+
+        if retry:
+            replicas.READS.inc(target="primary")
+            bound = max(replicas.min_lsn(), replicas.primary_lsn())
+            current, conn = connection()
+            try:
+                result = fn(conn, *args, **kwargs)
+            finally:
+                current.putconn(conn)
+        replicas.note_read(bound)
+        return result
+
+    async def run(self, fn, *args, **kwargs):
+        return await self.call(self._call, fn, args, kwargs, time.perf_counter())
+
+    async def admit(self, fn, *args, **kwargs):
+        return await self.call(self._call, fn, args, kwargs, time.perf_counter(), admit=True)
+
+    async def read(self, fn, *args, **kwargs):
+        return await self.call(self._call, fn, args, kwargs, time.perf_counter(), True, admit=True)
+
+    async def _acquire(self, admit):
+        if admit and self._semaphore.locked() and self._queued >= self.max_queue:
+            self._rejected += 1
+            metrics.DB_REJECTED.inc(reason="queue_full")
+            raise ExecutorBusy(f"Database is busy ({self._queued} queries waiting), try again later")
+
+        self._queued += 1
+        try:
+            if admit and self.queue_timeout:
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    self._timed_out += 1
+                    metrics.DB_REJECTED.inc(reason="timeout")
+                    raise ExecutorBusy(f"Database is busy (waited {self.queue_timeout:g}s), try again later")
+            else:
+                await self._semaphore.acquire()
+        finally:
+            self._queued -= 1
+
+    async def call(self, fn, *args, admit=False):
+        """Runs fn(*args) on the DB threads under the concurrency limit, without checking out a connection.
+
+        With admit=True the wait for a slot is bounded (ExecutorBusy).
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        await self._acquire(admit)
+
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # The request's context (metrics.current()) goes with the call into the DB thread
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self._executor, context.run, fn, *args)
+        finally:
+            self._in_flight -= 1
+            self._completed += 1
+            self._semaphore.release()
+
+    def release(self, pool, conn):
+        """Starts pool.putconn(conn) on the DB threads; returns a future to await.
+
+        Not limited like call(): cleanup that runs because its task was
+        cancelled may be cancelled again at any await, so the connection is
+        handed back before anything is awaited. It goes back to the pool even
+        if the caller never sees the result.
+        """
+        return asyncio.get_running_loop().run_in_executor(self._executor, pool.putconn, conn)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_workers,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+        }
+
+
+executor = None
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        # With replicas, reads have their pools too
+        pool_max = _env_int("PG_POOL_MAX", 10)
+        max_workers = _env_int("DB_MAX_CONCURRENCY",
+                               pool_max + len(_replica_dsns()) * _env_int("PG_REPLICA_POOL_MAX", pool_max))
+        executor = AsyncExecutor(
+            max_workers,
+            max_queue=_env_int("DB_MAX_QUEUE", 10 * max_workers),
+            queue_timeout=_env_float("DB_QUEUE_TIMEOUT", 5.0),
+        )
+    return executor
+
+
+def shutdown_executor():
+    global executor
+    if executor is not None:
+        executor.shutdown()
+        executor = None
+
+
+async def run(fn, *args, **kwargs):
+    """Runs fn(conn, *args, **kwargs) on the DB thread pool with a pooled connection."""
+    return await get_executor().run(fn, *args, **kwargs)
+
+
+async def admit(fn, *args, **kwargs):
+    """Like run(), for request handlers: raises ExecutorBusy rather than waiting long for a slot."""
+    return await get_executor().admit(fn, *args, **kwargs)
+
+
+async def read(fn, *args, **kwargs):
+    """Like admit(), for fn that only reads: it may run on a replica (see replicas.py)."""
+    return await get_executor().read(fn, *args, **kwargs)
+
+
+@asynccontextmanager
+async def held_connection(admit=False):
+    """Keeps one pooled connection checked out for a whole async block.
+
+    Meant for long-lived work such as streaming a server-side cursor; every
+    use of the connection inside the block must go through call() so it
+    still runs on the DB threads. admit=True bounds the wait for the
+    connection like admit() does; once it is held nothing is shed.
+    """
+    executor = get_executor()
+    queued_at = time.perf_counter()
+    current, conn = await executor.call(connection, admit=admit)
+    metrics.record_db_acquire(time.perf_counter() - queued_at)
+    try:
+        yield conn
+    finally:
+        # putconn rolls back the snapshot and any named cursor; a cancelled caller stops waiting, not it
+        await asyncio.shield(executor.release(current, conn))
+
+
+async def call(fn, *args):
+    return await get_executor().call(fn, *args)
+
+
+# Small helpers for single-statement queries, meant to be passed to run()
+def fetch_one(conn, query, params=None):
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        result = cursor.fetchone()
+    conn.commit()
+    return result
+
+
+def fetch_all(conn, query, params=None):
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        results = cursor.fetchall()
+    conn.commit()
+    return results
+
+
+def execute(conn, query, params=None):
+    with conn.cursor() as cursor:
+        cursor.execute(query, params)
+        rowcount = cursor.rowcount
+    conn.commit()
+    return rowcount
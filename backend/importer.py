@@ -0,0 +1,326 @@
+"""Bulk import of folders and blogs from NDJSON.
+
+The input is what GET /api/export writes: one JSON object per line with a
+"type" of "folder" or "blog" (other keys as in the export; "end" lines and
+blank lines are skipped). Folder ids in the file are the source system's
+ids. They are remapped to new ids, and parent_id / folder_id are rewritten
+through that map, so a folder must come before the blogs that use it.
+Parents may come after their children; such links are fixed up once the
+parent is imported.
+
+Records are loaded BATCH_SIZE at a time with multi-row INSERTs, one
+transaction per batch. A bad record is reported with its line number and
+skipped; if the database rejects a batch, it is retried record by record
+under savepoints so only the offending records are lost.
+
+Computing the search vector is most of the cost of inserting a blog, so
+imports defer it (blogs.defer_search_vector) and backfill_search_vectors()
+fills it in afterwards, in a BACKFILL_JOB background job. Every batch that
+inserts blogs queues that job in its own transaction, so posts that were
+committed are backfilled even if the import fails later on. Until then
+imported posts do not show up in search.
+"""
+import os
+import time
+import zlib
+from datetime import datetime
+from typing import Any, List, Optional
+
+import orjson
+from psycopg2.extras import execute_values
+from pydantic import BaseModel, ValidationError
+
+import jobs
+import media
+
+BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE") or 500)
+# Batches are also cut by size so a file with huge posts does not pile up in memory
+BATCH_MAX_BYTES = int(os.getenv("IMPORT_BATCH_MAX_BYTES") or 16 * 1024 * 1024)
+MAX_RECORD_BYTES = int(os.getenv("IMPORT_MAX_RECORD_BYTES") or 64 * 1024 * 1024)
+MAX_REPORTED_ERRORS = 1000
+BACKFILL_BATCH_SIZE = 1000
+# Job type of the search vector backfill; the handler is registered in main.py
+BACKFILL_JOB = "search_backfill"
+
+
+class RecordTooLarge(Exception):
+    pass
+
+
+class ImportCell(BaseModel):
+    id: int
+    type: str
+    content: Any
+
+
+class ImportFolder(BaseModel):
+    id: int
+    name: str
+    parent_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+
+class ImportBlog(BaseModel):
+    title: str
+    cells: List[ImportCell]
+    folder_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
+RECORD_TYPES = {"folder": ImportFolder, "blog": ImportBlog}
+
+
+async def gunzip(chunks):
+    decompressor = zlib.decompressobj(47)  # 32 + 15: gzip or zlib header
+    async for chunk in chunks:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+async def iter_lines(chunks, max_bytes=MAX_RECORD_BYTES):
+    """Yields (line_number, line) from a stream of byte chunks.
+
+    Only the newly received bytes are searched for newlines, and the partial
+    line is extended in place, so a long record costs linear time.
+    """
+    buffer = bytearray()
+    line_no = 0
+    async for chunk in chunks:
+        scan = len(buffer)  # what is already buffered holds no newline
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", scan)) >= 0:
+            line_no += 1
+            yield line_no, bytes(buffer[start:end])
+            start = scan = end + 1
+        if start:
+            del buffer[:start]
+        if len(buffer) > max_bytes:
+            raise RecordTooLarge(f"Line {line_no + 1} is longer than {max_bytes} bytes")
+    if buffer:
+        yield line_no + 1, bytes(buffer)
+
+
+def _validation_message(e: ValidationError):
+    first = e.errors()[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}" if location else first["msg"]
+
+
+class ImportJob:
+    def __init__(self, author):
+        self.author = author
+        self.folder_map = {}        # id in the file -> new id
+        self.pending_parents = {}   # new folder id -> parent id in the file, not imported yet
+        self.started = time.monotonic()
+        self.lines = 0
+        self.batches = 0
+        self.imported = {"folder": 0, "blog": 0}
+        self.failed = {"folder": 0, "blog": 0}
+        self.errors = []
+        self.error_count = 0
+        self.finished = False
+
+    def error(self, line_no, message, kind=None):
+        if kind:
+            self.failed[kind] += 1
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line_no, "error": message})
+
+    def parse(self, line_no, line):
+        """Returns (kind, record), or None for lines that carry no record."""
+        if not line.strip():
+            return None
+        try:
+            data = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            self.error(line_no, f"Invalid JSON: {e}")
+            return None
+        kind = data.get("type") if isinstance(data, dict) else None
+        if kind == "end":
+            return None
+        model = RECORD_TYPES.get(kind)
+        if model is None:
+            self.error(line_no, f"Unknown record type {kind!r}")
+            return None
+        try:
+            return kind, model.model_validate(data)
+        except ValidationError as e:
+            self.error(line_no, _validation_message(e), kind)
+            return None
+
+    # Database side; called through db.run, so each runs on a DB thread with its own connection
+
+    def write_batch(self, conn, lines):
+        """Parses and inserts one batch of (line_number, line) in one transaction."""
+        records = []
+        for line_no, line in lines:
+            parsed = self.parse(line_no, line)
+            if parsed:
+                records.append((line_no, *parsed))
+        self.lines = max(self.lines, lines[-1][0]) if lines else self.lines
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SET LOCAL blogs.defer_search_vector = on")
+            new_map, pending, counts, errors = self._insert(cursor, records)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            new_map, pending, counts, errors = self._insert_one_by_one(conn, cursor, records)
+
+        for error in errors:
+            self.error(*error)
+        self.folder_map.update(new_map)
+        self.pending_parents.update(pending)
+        for kind, count in counts.items():
+            self.imported[kind] += count
+        self.batches += 1
+        self._link_pending_parents(conn)
+
+    def finish(self, conn):
+        self._link_pending_parents(conn)
+        for folder_id, parent in self.pending_parents.items():
+            self.error(None, f"Parent folder {parent} of imported folder {folder_id} not found; left at the root")
+        self.pending_parents = {}
+        self.finished = True
+
+    def _insert(self, cursor, records):
+        """Inserts parsed records. Nothing is recorded on self; the caller applies the result after commit."""
+        new_map, pending, counts, errors = {}, {}, {"folder": 0, "blog": 0}, []
+
+        # Folders first, so blogs in the same batch can point at them
+        folders = [(line_no, record) for line_no, kind, record in records if kind == "folder"]
+        rows = []
+        for line_no, folder in folders:
+            if folder.id in self.folder_map or folder.id in new_map:
+                errors.append((line_no, f"Duplicate folder id {folder.id}", "folder"))
+                continue
+            parent = None
+            if folder.parent_id is not None:
+                parent = self.folder_map.get(folder.parent_id)
+            rows.append((line_no, folder, parent))
+            new_map[folder.id] = None  # reserved; filled in after the insert
+        if rows:
+            ids = execute_values(
+                cursor,
+                "INSERT INTO folders (name, parent_id, author, created_at) VALUES %s RETURNING id",
+                [(folder.name, parent, self.author, folder.created_at) for _, folder, parent in rows],
+                template="(%s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP))",
+                page_size=len(rows),
+                fetch=True,
+            )
+            for (_, folder, parent), row in zip(rows, ids):
+                new_map[folder.id] = row["id"]
+                if folder.parent_id is not None and parent is None:
+                    pending[row["id"]] = folder.parent_id
+            counts["folder"] = len(rows)
+        new_map = {old: new for old, new in new_map.items() if new is not None}
+
+        blogs = []
+        stored_media = []
+        for line_no, kind, blog in records:
+            if kind != "blog":
+                continue
+            folder_id = None
+            if blog.folder_id is not None:
+                folder_id = new_map.get(blog.folder_id) or self.folder_map.get(blog.folder_id)
+                if folder_id is None:
+                    errors.append((line_no, f"Unknown folder {blog.folder_id}", "blog"))
+                    continue
+            cells = [cell.model_dump() for cell in blog.cells]
+            if media.has_embedded_media(cells):
+                cells, stored = media.externalize_cells(cells)
+                stored_media.extend(stored)
+            blogs.append((blog.title, orjson.dumps(cells).decode(), self.author, folder_id,
+                          blog.created_at, blog.updated_at, blog.created_at))
+        if blogs:
+            media.register_media(cursor, stored_media, self.author)
+            execute_values(
+                cursor,
+                "INSERT INTO blogs (title, cells, author, folder_id, created_at, updated_at) VALUES %s",
+                blogs,
+                template="(%s, %s::jsonb, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP), COALESCE(%s, %s, CURRENT_TIMESTAMP))",
+                page_size=len(blogs),
+            )
+            # One queued job per author: the enqueues of later batches are folded into it
+            jobs.enqueue(cursor, BACKFILL_JOB, {"author": self.author}, key=self.author)
+            counts["blog"] = len(blogs)
+        return new_map, pending, counts, errors
+
+    def _insert_one_by_one(self, conn, cursor, records):
+        new_map, pending, counts, errors = {}, {}, {"folder": 0, "blog": 0}, []
+        saved_map = self.folder_map
+        # Later records of the batch must see the folders inserted before them
+        self.folder_map = {**saved_map}
+        try:
+            cursor.execute("SET LOCAL blogs.defer_search_vector = on")
+            for line_no, kind, record in records:
+                cursor.execute("SAVEPOINT import_record")
+                try:
+                    one_map, one_pending, one_counts, one_errors = self._insert(cursor, [(line_no, kind, record)])
+                except Exception as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT import_record")
+                    errors.append((line_no, str(e).strip().splitlines()[0], kind))
+                    continue
+                cursor.execute("RELEASE SAVEPOINT import_record")
+                new_map.update(one_map)
+                self.folder_map.update(one_map)
+                pending.update(one_pending)
+                errors.extend(one_errors)
+                for key, count in one_counts.items():
+                    counts[key] += count
+            conn.commit()
+        finally:
+            self.folder_map = saved_map
+        return new_map, pending, counts, errors
+
+    def _link_pending_parents(self, conn):
+        ready = [(folder_id, self.folder_map[parent])
+                 for folder_id, parent in self.pending_parents.items() if parent in self.folder_map]
+        if not ready:
+            return
+        cursor = conn.cursor()
+        execute_values(
+            cursor,
+            "UPDATE folders SET parent_id = v.parent_id FROM (VALUES %s) AS v (id, parent_id) "
+            "WHERE folders.id = v.id",
+            [(folder_id, parent_id) for folder_id, parent_id in ready],
+            template="(%s::int, %s::int)",
+        )
+        conn.commit()
+        for folder_id, _ in ready:
+            del self.pending_parents[folder_id]
+
+    def stats(self):
+        elapsed = time.monotonic() - self.started
+        imported = self.imported["folder"] + self.imported["blog"]
+        return {
+            "finished": self.finished,
+            "lines": self.lines,
+            "batches": self.batches,
+            "folders": {"imported": self.imported["folder"], "failed": self.failed["folder"]},
+            "blogs": {"imported": self.imported["blog"], "failed": self.failed["blog"]},
+            "error_count": self.error_count,
+            "errors": sorted(self.errors, key=lambda e: (e["line"] is None, e["line"] or 0)),
+            "elapsed_seconds": round(elapsed, 3),
+            "records_per_second": round(imported / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+def backfill_search_vectors(conn, author):
+    """Fills in one chunk of search vectors deferred by imports. Returns the number of rows updated."""
+    with conn.cursor() as cursor:
+        cursor.execute('''
+            UPDATE blogs SET search_vector = blog_search_document(title, cells)
+            WHERE id IN (SELECT id FROM blogs WHERE author = %s AND search_vector IS NULL LIMIT %s)
+        ''', (author, BACKFILL_BATCH_SIZE))
+        updated = cursor.rowcount
+    conn.commit()
+    return updated
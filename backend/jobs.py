@@ -0,0 +1,342 @@
+"""Background jobs, queued in Postgres and run by an asyncio worker.
+
+Work that does not have to finish before a save returns (rendering HTML,
+processing media, ...) is queued with enqueue() in the same transaction as
+the save, so a job exists exactly when the save committed. Every API
+process runs a Worker (started from the app lifespan, JOBS_ENABLED=0 turns
+it off) that claims due jobs with SELECT ... FOR UPDATE SKIP LOCKED, so any
+number of processes can share the queue without claiming the same job.
+
+Handlers are registered with @handler(type) and run as fn(conn, payload) on
+the DB thread pool, like the request handlers' DB functions. A handler that
+is a coroutine function runs as await fn(payload) instead, holding no
+connection: jobs with slow work outside the database (image processing)
+use db.run only for their short DB steps. Each type has
+a per-process concurrency limit (JOB_CONCURRENCY="render_blog=2,..."
+overrides the registered one), which also bounds how much of the DB
+executor background work can take from requests.
+
+A job that raises is retried after an exponential backoff with jitter until
+max_attempts, then left as "failed" for GET /api/admin/jobs. A job whose
+process died is requeued once it has been running for JOB_LOCK_TIMEOUT.
+
+Idempotency keys coalesce work: enqueueing a (type, key) that is already
+queued and has not started returns the queued job instead of adding one,
+and a queued job is not claimed while another job with its key is running.
+So "re-render blog 5" queued by ten quick saves runs once, after the last.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+
+import orjson
+
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("JOBS_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL") or 1.0)
+LOCK_TIMEOUT = int(os.getenv("JOB_LOCK_TIMEOUT") or 600)
+BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE") or 2.0)
+BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX") or 600.0)
+RETENTION_HOURS = int(os.getenv("JOB_RETENTION_HOURS") or 24)
+MAINTENANCE_INTERVAL = 60
+DEFAULT_MAX_ATTEMPTS = 5
+
+JOBS_PROCESSED = metrics.Counter("jobs_processed_total", "Background jobs run, by outcome.", ("type", "result"))
+JOB_DURATION = metrics.Histogram("job_duration_seconds", "Time a background job's handler ran.", ("type",))
+JOB_DELAY = metrics.Histogram(
+    "job_queue_delay_seconds", "Time from a job being due to being claimed.", ("type",))
+JOBS_RUNNING = metrics.Gauge("jobs_running", "Background jobs running in this process.", ("type",))
+
+
+def _concurrency_overrides():
+    limits = {}
+    for item in (os.getenv("JOB_CONCURRENCY") or "").split(","):
+        name, sep, value = item.partition("=")
+        if sep and name.strip() and value.strip().isdigit():
+            limits[name.strip()] = int(value)
+    return limits
+
+
+class JobType:
+    def __init__(self, name, fn, concurrency, max_attempts):
+        self.name = name
+        self.fn = fn
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+
+
+handlers = {}
+
+
+def handler(name, concurrency=1, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Registers fn(conn, payload), or async fn(payload), as the handler of jobs of this type."""
+    def register(fn):
+        limit = _concurrency_overrides().get(name, concurrency)
+        handlers[name] = JobType(name, fn, limit, max_attempts)
+        return fn
+    return register
+
+
+def enqueue(cursor, job_type, payload=None, key=None, delay=0):
+    """Queues a job in the caller's transaction; returns its id.
+
+    With a key, an already queued job of the same type and key is reused
+    (its payload replaced and its run time moved up if this one is due
+    sooner).
+    """
+    job = handlers.get(job_type)
+    max_attempts = job.max_attempts if job is not None else DEFAULT_MAX_ATTEMPTS
+    cursor.execute(
+        '''
+        INSERT INTO jobs (type, payload, idempotency_key, max_attempts, run_at)
+        VALUES (%s, %s::jsonb, %s, %s, now() + %s * interval '1 second')
+        ON CONFLICT (type, idempotency_key) WHERE status = 'queued'
+        DO UPDATE SET payload = EXCLUDED.payload, run_at = LEAST(jobs.run_at, EXCLUDED.run_at)
+        RETURNING id
+        ''',
+        (job_type, orjson.dumps(payload or {}).decode(), key, max_attempts, delay)
+    )
+    return cursor.fetchone()["id"]
+
+
+def backoff(attempts):
+    """Seconds before retry number attempts: exponential, capped, with jitter."""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+# Queue operations, each fn(conn, ...) in its own transaction
+
+def _claim(conn, job_type, limit, worker_id):
+    cursor = conn.cursor()
+    cursor.execute(
+        '''
+        UPDATE jobs
+        SET status = 'running', attempts = attempts + 1, locked_at = now(), locked_by = %s
+        WHERE id IN (
+            SELECT id FROM jobs j
+            WHERE status = 'queued' AND type = %s AND run_at <= now()
+              AND (idempotency_key IS NULL OR NOT EXISTS (
+                  SELECT 1 FROM jobs r
+                  WHERE r.status = 'running' AND r.type = j.type AND r.idempotency_key = j.idempotency_key))
+            ORDER BY run_at, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, type, payload, idempotency_key, attempts, max_attempts,
+                  extract(epoch FROM now() - run_at)::float AS delay
+        ''',
+        (worker_id, job_type, limit)
+    )
+    rows = cursor.fetchall()
+    conn.commit()
+    return rows
+
+
+def _complete(conn, job_id):
+    cursor = conn.cursor()
+    cursor.execute("UPDATE jobs SET status = 'done', finished_at = now(), last_error = NULL WHERE id = %s",
+                   (job_id,))
+    conn.commit()
+
+
+# A retried job that now has a queued twin with the same key is superseded by it
+_SUPERSEDED = '''
+    EXISTS (SELECT 1 FROM jobs q WHERE q.status = 'queued' AND q.type = jobs.type
+            AND q.idempotency_key = jobs.idempotency_key AND q.id <> jobs.id)
+'''
+
+
+def _fail(conn, job, error, retry_in):
+    """Requeues the job after retry_in seconds, or marks it failed when retry_in is None. Returns the new status."""
+    cursor = conn.cursor()
+    cursor.execute(
+        f'''
+        UPDATE jobs
+        SET status = CASE WHEN %s::float IS NULL THEN 'failed'
+                          WHEN {_SUPERSEDED} THEN 'superseded'
+                          ELSE 'queued' END,
+            run_at = now() + coalesce(%s::float, 0) * interval '1 second',
+            finished_at = CASE WHEN %s::float IS NULL OR {_SUPERSEDED} THEN now() END,
+            locked_at = NULL, locked_by = NULL, last_error = %s
+        WHERE id = %s
+        RETURNING status
+        ''',
+        (retry_in, retry_in, retry_in, error, job["id"])
+    )
+    row = cursor.fetchone()
+    conn.commit()
+    return row["status"] if row else None
+
+
+def _maintain(conn):
+    """Requeues jobs whose worker went away and drops finished jobs past the retention."""
+    cursor = conn.cursor()
+    cursor.execute(
+        f'''
+        UPDATE jobs
+        SET status = CASE WHEN attempts >= max_attempts THEN 'failed'
+                          WHEN {_SUPERSEDED} THEN 'superseded'
+                          ELSE 'queued' END,
+            finished_at = CASE WHEN attempts >= max_attempts OR {_SUPERSEDED} THEN now() END,
+            locked_at = NULL, locked_by = NULL, last_error = 'worker lock timed out', run_at = now()
+        WHERE status = 'running' AND locked_at < now() - %s * interval '1 second'
+        ''',
+        (LOCK_TIMEOUT,)
+    )
+    reaped = cursor.rowcount
+    cursor.execute(
+        "DELETE FROM jobs WHERE status IN ('done', 'superseded') AND finished_at < now() - %s * interval '1 hour'",
+        (RETENTION_HOURS,)
+    )
+    conn.commit()
+    return reaped, cursor.rowcount
+
+
+def stats(conn, limit=50):
+    cursor = conn.cursor()
+    cursor.execute("SELECT type, status, count(*) AS count FROM jobs GROUP BY type, status ORDER BY type, status")
+    counts = cursor.fetchall()
+    cursor.execute(
+        '''
+        SELECT id, type, payload, idempotency_key, attempts, max_attempts, last_error, created_at, finished_at
+        FROM jobs WHERE status = 'failed' ORDER BY finished_at DESC LIMIT %s
+        ''',
+        (limit,)
+    )
+    failed = cursor.fetchall()
+    conn.commit()
+    return {"counts": counts, "failed": failed}
+
+
+def retry(conn, job_id):
+    """Queues a failed job again with a fresh set of attempts. Returns False if there is no such failed job."""
+    cursor = conn.cursor()
+    cursor.execute(
+        f'''
+        UPDATE jobs
+        SET status = CASE WHEN {_SUPERSEDED} THEN 'superseded' ELSE 'queued' END,
+            attempts = 0, run_at = now(), finished_at = CASE WHEN {_SUPERSEDED} THEN now() END
+        WHERE id = %s AND status = 'failed'
+        ''',
+        (job_id,)
+    )
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+class Worker:
+    """Claims and runs jobs on the running event loop until stop()."""
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._running = {}
+        self._tasks = set()
+        self._wakeup = None
+        self._loop_task = None
+        self._stopping = False
+        self._last_maintenance = 0.0
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._loop_task = asyncio.get_running_loop().create_task(self._run())
+        logger.info("Job worker %s started for %s", self.worker_id,
+                    ", ".join(f"{name}={job.concurrency}" for name, job in handlers.items()) or "no job types")
+
+    def wake(self):
+        """Checks the queue now instead of at the next poll; call after committing new jobs."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self, timeout=30):
+        """Stops claiming and waits up to timeout seconds for running jobs."""
+        if self._loop_task is None:
+            return
+        self._stopping = True
+        self.wake()
+        await self._loop_task
+        self._loop_task = None
+        if self._tasks:
+            done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            if pending:
+                # Still marked running; _maintain() requeues them after LOCK_TIMEOUT
+                logger.warning("%d job(s) still running at shutdown", len(pending))
+
+    async def _run(self):
+        while not self._stopping:
+            self._wakeup.clear()
+            try:
+                if time.monotonic() - self._last_maintenance > MAINTENANCE_INTERVAL:
+                    self._last_maintenance = time.monotonic()
+                    reaped, deleted = await db.run(_maintain)
+                    if reaped:
+                        logger.warning("Requeued %d job(s) whose worker stopped responding", reaped)
+                claimed = await self._claim_available()
+            except Exception as e:
+                logger.warning("Job queue poll failed: %s", e)
+                claimed = 0
+            if claimed:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim_available(self):
+        claimed = 0
+        for job_type in handlers.values():
+            free = job_type.concurrency - self._running.get(job_type.name, 0)
+            if free <= 0:
+                continue
+            for job in await db.run(_claim, job_type.name, free, self.worker_id):
+                claimed += 1
+                self._running[job_type.name] = self._running.get(job_type.name, 0) + 1
+                JOBS_RUNNING.inc(type=job_type.name)
+                JOB_DELAY.observe(max(job["delay"], 0.0), type=job_type.name)
+                task = asyncio.get_running_loop().create_task(self._execute(job_type, job))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        return claimed
+
+    async def _execute(self, job_type, job):
+        started = time.perf_counter()
+        try:
+            if asyncio.iscoroutinefunction(job_type.fn):
+                await job_type.fn(job["payload"])
+            else:
+                await db.run(job_type.fn, job["payload"])
+        except Exception as e:
+            JOB_DURATION.observe(time.perf_counter() - started, type=job_type.name)
+            retry_in = backoff(job["attempts"]) if job["attempts"] < job["max_attempts"] else None
+            try:
+                status = await db.run(_fail, job, f"{type(e).__name__}: {e}", retry_in)
+            except Exception as fail_error:
+                logger.error("Could not record failure of job %s: %s", job["id"], fail_error)
+                status = None
+            JOBS_PROCESSED.inc(type=job_type.name, result="retry" if status == "queued" else str(status))
+            log = logger.error if status == "failed" else logger.warning
+            log("Job %s (%s) attempt %s/%s failed: %s", job["id"], job_type.name,
+                job["attempts"], job["max_attempts"], e)
+        else:
+            JOB_DURATION.observe(time.perf_counter() - started, type=job_type.name)
+            try:
+                await db.run(_complete, job["id"])
+                JOBS_PROCESSED.inc(type=job_type.name, result="done")
+            except Exception as e:
+                logger.error("Could not mark job %s done: %s", job["id"], e)
+        finally:
+            self._running[job_type.name] -= 1
+            JOBS_RUNNING.dec(type=job_type.name)
+            # A slot is free again
+            self.wake()
+
+
+worker = Worker()
@@ -1,19 +1,64 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, File, UploadFile, Request, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
-from typing import List, Optional, Any
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import List, Optional, Any, Literal
 import jwt
 from datetime import datetime, timedelta
+from contextlib import asynccontextmanager
+import asyncio
+import base64
+import hashlib
+import html
 import json
+import logging
+import math
 import secrets
 import os
+import time
+import zlib
 from dotenv import load_dotenv
 import psycopg2
-from psycopg2.extras import RealDictCursor
 load_dotenv() 
 
-app = FastAPI(title="Blog Platform API")
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
+
+import cache
+import compression
+import db
+import importer
+import jobs
+import media
+import metrics
+import migrations
+import passwords
+import ratelimit
+import render
+import replicas
+import revisions
+import serialization
+import slowlog
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connection pool bir marta ishga tushganda yaratiladi va to'xtaganda yopiladi.
+    # Sxema va isitish shu yerda, import paytida emas: uvicorn so'rov qabul qilishni shundan keyin boshlaydi
+    await prepare()
+    if jobs.ENABLED:
+        jobs.worker.start()
+    yield
+    await jobs.worker.stop()
+    passwords.shutdown_pool()
+    db.shutdown_executor()
+    db.close_pool()
+
+app = FastAPI(title="Blog Platform API", lifespan=lifespan)
 
 # CORS sozlamalari
 app.add_middleware(
@@ -22,11 +67,56 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Write-LSN"],
 )
+async def _primary_wal_lsn():
+    # X-Min-LSN faqat replikalar bilan ishlatiladi
+    if not db.read_replicas:
+        return None
+    return await db.run(db.current_wal_lsn)
+
+# So'rov sessiyasi: X-Min-LSN o'qiladi (primary'dagi LSN'dan oshmaydi), yozuvdan keyin X-Write-LSN qaytariladi
+app.add_middleware(replicas.ConsistencyMiddleware, primary_lsn=_primary_wal_lsn)
+app.add_middleware(compression.CompressionMiddleware)
+# Eng tashqi qatlam: javob hajmi siqilgandan keyin o'lchanadi
+app.add_middleware(metrics.MetricsMiddleware)
 
 security = HTTPBearer()
 SECRET_KEY = os.getenv('SECRET_KEY') or secrets.token_urlsafe(32)
 ALGORITHM = "HS256"
+# blogs jadvalida qidiruv uchun katta ustunlar ham bor, ro'yxatlarda faqat shular olinadi.
+# cells matn sifatida olinadi va javobga o'zgarishsiz yoziladi (serialization.raw_json)
+BLOG_COLUMNS = "id, title, cells::text AS cells, author, folder_id, created_at, updated_at"
+FOLDER_COLUMNS = "id, name, parent_id, author, created_at"
+# Ro'yxat so'rovlari ({columns} bilan); benchmarks/check_indexes.py aynan shularni EXPLAIN qiladi
+AUTHOR_BLOGS_SQL = "SELECT {columns} FROM blogs WHERE author = %s ORDER BY created_at DESC"
+ROOT_BLOGS_SQL = "SELECT {columns} FROM blogs WHERE folder_id IS NULL AND author = %s ORDER BY created_at DESC"
+FOLDER_BLOGS_SQL = "SELECT {columns} FROM blogs WHERE folder_id = %s AND author = %s ORDER BY created_at DESC"
+AUTHOR_FOLDERS_SQL = "SELECT {columns} FROM folders WHERE author = %s ORDER BY created_at DESC"
+ROOT_FOLDERS_SQL = "SELECT {columns} FROM folders WHERE parent_id IS NULL AND author = %s ORDER BY created_at DESC"
+SUBFOLDERS_SQL = "SELECT {columns} FROM folders WHERE parent_id = %s AND author = %s ORDER BY created_at DESC"
+SUMMARY_PAGE_SIZE = 20
+SUMMARY_MAX_PAGE_SIZE = 100
+EXCERPT_LENGTH = 200
+BLOG_CACHE_CONTROL = os.getenv("BLOG_CACHE_CONTROL", "public, max-age=0, must-revalidate")
+ADMIN_USERS = {name.strip() for name in os.getenv("ADMIN_USERS", "").split(",") if name.strip()}
+
+# So'rovlar chegarasi (ratelimit.py): login qilganlar username bo'yicha, ochiq endpointlar IP bo'yicha
+user_limiter = ratelimit.RateLimiter("user", *ratelimit.parse("RATE_LIMIT_USER", (20, 100)))
+ip_limiter = ratelimit.RateLimiter("ip", *ratelimit.parse("RATE_LIMIT_IP", (20, 100)))
+login_limiter = ratelimit.RateLimiter("login", *ratelimit.parse("RATE_LIMIT_LOGIN", (0.5, 20)))
+# Butun ro'yxatni (cells bilan) o'qiydigan yoki uzoq ishlaydigan endpointlar bir nechta token oladi
+ROUTE_COSTS = {
+    ("GET", "/api/blogs"): 5,
+    ("GET", "/api/my-blogs"): 5,
+    ("GET", "/api/root-blogs"): 5,
+    ("GET", "/api/folders/{folder_id}/blogs"): 5,
+    ("GET", "/api/root-contents"): 5,
+    ("GET", "/api/folders/{folder_id}/contents"): 5,
+    ("GET", "/api/search"): 3,
+    ("GET", "/api/export"): 20,
+    ("POST", "/api/import"): 20,
+}
 
 # Pydantic modellari
 class UserRegister(BaseModel):
@@ -74,92 +164,190 @@ class FolderResponse(BaseModel):
 class BlogMoveRequest(BaseModel):
     folder_id: Optional[int] = None
 
+BATCH_MAX_IDS = 1000
+
+class BatchIds(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=BATCH_MAX_IDS)
+
+class BlogBatchMove(BatchIds):
+    folder_id: Optional[int] = None
+
+class FolderBatchMove(BatchIds):
+    parent_id: Optional[int] = None
+
+class CellOperation(BaseModel):
+    op: Literal["insert", "replace", "move", "delete"]
+    id: Optional[int] = None          # replace/move/delete: target cell
+    cell: Optional[Cell] = None       # insert/replace: new cell
+    after_id: Optional[int] = None    # insert/move: put after this cell, None = at the start
+
+class BlogPatch(BaseModel):
+    title: Optional[str] = None
+    ops: List[CellOperation] = []
+
+class BlogSummary(BaseModel):
+    id: int
+    title: str
+    folder_id: Optional[int]
+    cell_count: int
+    created_at: str
+    updated_at: str
+    excerpt: Optional[str] = None
+
+class BlogSummaryPage(BaseModel):
+    items: List[BlogSummary]
+    next_cursor: Optional[str]
+
+class SearchHit(BaseModel):
+    id: int
+    title: str
+    folder_id: Optional[int]
+    created_at: str
+    updated_at: str
+    rank: float
+    title_highlight: str
+    snippet: str
+
+class SearchPage(BaseModel):
+    items: List[SearchHit]
+    has_more: bool
+
+class BlogStub(BaseModel):
+    id: int
+    title: str
+    folder_id: Optional[int]
+    cell_count: int
+    created_at: str
+    updated_at: str
+    excerpt: Optional[str] = None
+
+class FolderTreeNode(BaseModel):
+    id: Optional[int]                 # None = root papka
+    name: Optional[str]
+    parent_id: Optional[int]
+    created_at: Optional[str]
+    depth: int
+    blog_count: int                   # shu papkaning o'zidagi bloglar
+    subfolder_count: int              # to'g'ridan-to'g'ri ichki papkalar (depth chegarasidan tashqaridagilar ham)
+    total_blog_count: int             # qaytarilgan barcha ichki papkalar bilan birga
+    blogs: List[BlogStub] = []
+    children: List["FolderTreeNode"] = []
+
+# Ochiq GET /api/blogs/{id} uchun serialize qilingan javoblar keshi
+blog_cache = cache.LRUCache(
+    max_bytes=int(os.getenv("BLOG_CACHE_MAX_BYTES") or 64 * 1024 * 1024),
+    max_entry_bytes=int(os.getenv("BLOG_CACHE_MAX_ENTRY_BYTES") or 8 * 1024 * 1024),
+    ttl=float(os.getenv("BLOG_CACHE_TTL") or 30),
+)
+# GET /api/blogs/{id}/html uchun tayyor HTML keshi; blog_cache bilan birga tozalanadi
+html_cache = cache.LRUCache(
+    max_bytes=int(os.getenv("HTML_CACHE_MAX_BYTES") or 64 * 1024 * 1024),
+    max_entry_bytes=int(os.getenv("BLOG_CACHE_MAX_ENTRY_BYTES") or 8 * 1024 * 1024),
+    ttl=float(os.getenv("BLOG_CACHE_TTL") or 30),
+)
+
+def _invalidate_blogs(*blog_ids):
+    blog_cache.invalidate(*blog_ids)
+    html_cache.invalidate(*blog_ids)
+
 # Database initialization
 def get_conn():
-    pg_db = os.getenv("PG_DB")
-    pg_user = os.getenv("PG_USERNAME")
-    pg_pass = os.getenv("PG_PASSWORD")
-    pg_host = os.getenv("PG_HOST")
-    pg_port = os.getenv("PG_PORT")
-
-    missing = [name for name, val in [
-        ("PG_DB", pg_db), ("PG_USERNAME", pg_user), ("PG_PASSWORD", pg_pass), ("PG_HOST", pg_host), ("PG_PORT", pg_port)
-    ] if not val]
-
-    if missing:
-        raise RuntimeError(f"Missing required Postgres env vars: {', '.join(missing)}")
-
-    return psycopg2.connect(
-        dbname=pg_db,
-        user=pg_user,
-        password=pg_pass,
-        host=pg_host,
-        port=pg_port,
-        cursor_factory=RealDictCursor
-    )
+    return psycopg2.connect(**db.connection_kwargs())
 
-def safe_get_conn():
+async def run_db(fn, *args):
+    """fn(conn, *args) ni DB thread pool'ida bajaradi, event loop bloklanmaydi.
+    Navbat to'lgan bo'lsa kutib o'tirmaydi — 503 va Retry-After qaytadi."""
     try:
-        return get_conn()
-    except Exception as e:
+        return await db.admit(fn, *args)
+    except (db.ExecutorBusy, db.PoolTimeout) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except db.DatabaseUnavailable as e:
         raise HTTPException(status_code=500, detail=f"Database connection error: {str(e)}")
 
-def init_db():
-    conn = safe_get_conn()
-    cursor = conn.cursor()
+async def fetch_one(query, params=None):
+    return await run_db(db.fetch_one, query, params)
 
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS folders (
-            id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL,
-            parent_id INTEGER REFERENCES folders(id) ON DELETE CASCADE,
-            author TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS blogs (
-            id SERIAL PRIMARY KEY,
-            title TEXT NOT NULL,
-            cells JSONB NOT NULL,
-            author TEXT NOT NULL,
-            folder_id INTEGER REFERENCES folders(id) ON DELETE SET NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+async def fetch_all(query, params=None):
+    return await run_db(db.fetch_all, query, params)
 
-    # Agar blogs jadvali mavjud bo'lsa, folder_id ustunini qo'shish
+async def read_db(fn, *args):
+    """run_db kabi, lekin fn faqat o'qiydi: replikada bajarilishi mumkin (replicas.py)."""
     try:
-        cursor.execute("SELECT column_name FROM information_schema.columns WHERE table_name='blogs' AND column_name='folder_id'")
-        folder_id_exists = cursor.fetchone()
-        
-        if not folder_id_exists:
-            print("Adding folder_id column to blogs table...")
-            cursor.execute('ALTER TABLE blogs ADD COLUMN folder_id INTEGER REFERENCES folders(id) ON DELETE SET NULL')
-    except Exception as e:
-        print(f"Error checking/adding folder_id column: {e}")
+        return await db.read(fn, *args)
+    except (db.ExecutorBusy, db.PoolTimeout) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except db.DatabaseUnavailable as e:
+        raise HTTPException(status_code=500, detail=f"Database connection error: {str(e)}")
 
-    conn.commit()
-    conn.close()
+async def read_one(query, params=None):
+    return await read_db(db.fetch_one, query, params)
 
-try:
-    init_db()
-    print("Database initialization completed successfully!")
-except Exception as e:
-    print("WARNING: init_db failed — backend may not work until DB is available and environment variables are set.")
-    print(str(e))
+async def read_all(query, params=None):
+    return await read_db(db.fetch_all, query, params)
+
+def init_db():
+    # Alohida ulanish: migrate() advisory lock'i sessiyaga bog'langan, yopilganda albatta bo'shaydi
+    conn = get_conn()
+    try:
+        return migrations.migrate(conn)
+    finally:
+        conn.close()
+
+# Ishga tushish: sxema, ulanishlar va keshlarni tayyorlash (lifespan'da, /readyz muvaffaqiyatsiz bo'lsa qayta)
+POOL_WARM_CONNECTIONS = int(os.getenv("PG_POOL_WARM") or os.getenv("PG_POOL_MAX") or 10)
+CACHE_WARM_BLOGS = int(os.getenv("CACHE_WARM_BLOGS") or 100)
+READY_TIMEOUT = float(os.getenv("READY_TIMEOUT") or 2)
+_schema_ready = False
+_warmed = False
+_startup_error = None
+_prepare_lock = None
+
+def _warm_blog_rows(conn, limit: int):
+    # Eng yangi postlar (pkey indeksi bo'yicha), cells faqat shular uchun o'qiladi
+    return db.fetch_all(conn, f"SELECT {BLOG_COLUMNS} FROM blogs ORDER BY id DESC LIMIT %s", (limit,))
+
+async def _warm_caches():
+    if CACHE_WARM_BLOGS <= 0:
+        return 0
+    token = blog_cache.begin_fill()
+    rows = serialization.with_raw_json(await db.run(_warm_blog_rows, CACHE_WARM_BLOGS), "cells")
+    for row in rows:
+        entry = _cache_entry(serialization.dumps(row))
+        blog_cache.put(row["id"], entry, len(entry["body"]), token)
+    return len(rows)
+
+async def prepare():
+    """Sxemani yangilaydi va ulanishlar/keshlarni isitadi; True — tayyor. Qayta chaqirish mumkin."""
+    global _schema_ready, _warmed, _startup_error, _prepare_lock
+    if _schema_ready and _warmed:
+        return True
+    if _prepare_lock is None:
+        _prepare_lock = asyncio.Lock()
+    async with _prepare_lock:
+        started = time.perf_counter()
+        try:
+            if not _schema_ready:
+                applied = await run_in_threadpool(init_db)
+                _schema_ready = True
+                logger.info("Database schema is at version %s (applied %s)", migrations.LATEST_VERSION, applied or "none")
+            if not _warmed:
+                current = db.open_pool()
+                # bcrypt "dummy" hash va ulanishlar bir vaqtda tayyorlanadi
+                opened, _, *_ = await asyncio.gather(
+                    run_in_threadpool(current.warm, POOL_WARM_CONNECTIONS),
+                    run_in_threadpool(passwords.warm),
+                    *(run_in_threadpool(replica.pool.warm, POOL_WARM_CONNECTIONS)
+                      for replica in db.read_replicas if replica.available),
+                )
+                cached = await _warm_caches()
+                _warmed = True
+                logger.info("Warmed up in %.0f ms: %d new connections, %d posts cached; pool %s",
+                            (time.perf_counter() - started) * 1000, opened, cached, current.stats())
+            _startup_error = None
+        except Exception as e:
+            _startup_error = str(e)
+            logger.warning("Startup is not complete — /readyz will retry: %s", e)
+    return _schema_ready and _warmed
 
 # Helper functions
 def create_token(username: str):
@@ -179,89 +367,196 @@ def verify_token(token: str):
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError as e:
-        print(f"Token invalid: {str(e)}")
+        logger.debug("Token invalid: %s", e)
         raise HTTPException(status_code=401, detail="Invalid token")
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def check_rate(limiter: ratelimit.RateLimiter, key: str, cost: int = 1):
+    wait = limiter.hit(key, cost)
+    if wait:
+        raise HTTPException(status_code=429, detail="Too many requests, slow down",
+                            headers={"Retry-After": str(max(1, math.ceil(wait)))})
+
+def client_ip(request: Request) -> str:
+    # Proksi ortida uvicorn --proxy-headers (X-Forwarded-For) bilan ishga tushiriladi
+    return request.client.host if request.client else "unknown"
+
+def limit_by_ip(request: Request):
+    check_rate(ip_limiter, client_ip(request))
+
+def limit_login(request: Request):
+    check_rate(login_limiter, client_ip(request))
+
+def get_current_user(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)):
     payload = verify_token(credentials.credentials)
-    return payload["username"]
+    username = payload["username"]
+    # Foydalanuvchining o'z yozuvlari replikadan o'qishda ham ko'rinadi
+    replicas.bind_user(username)
+    route = getattr(request.scope.get("route"), "path", None)
+    check_rate(user_limiter, username, ROUTE_COSTS.get((request.method, route), 1))
+    return username
+
+def get_admin_user(current_user: str = Depends(get_current_user)):
+    if current_user not in ADMIN_USERS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
 
 # Root endpoint
 @app.get("/")
 async def root():
     return {"message": "Blog Platform API", "docs": "/docs"}
 
+# Liveness: jarayon va event loop javob beryapti (DB tekshirilmaydi, aks holda DB uzilishi
+# hamma worker'larni qayta ishga tushirtiradi)
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+# Readiness: sxema joyida, isitish tugagan va DB javob beryapti
+@app.get("/readyz", include_in_schema=False)
+async def readyz():
+    if not await prepare():
+        return serialization.json_response({"status": "starting", "detail": _startup_error}, status_code=503)
+    try:
+        await asyncio.wait_for(db.run(db.fetch_one, "SELECT 1"), READY_TIMEOUT)
+    except Exception as e:
+        detail = "Database did not answer in time" if isinstance(e, asyncio.TimeoutError) else str(e)
+        return serialization.json_response({"status": "unavailable", "detail": detail}, status_code=503)
+    return {"status": "ready", "schema_version": migrations.LATEST_VERSION}
+
+# Operator endpoints
+@app.get("/api/admin/pool")
+async def get_pool_stats(admin: str = Depends(get_admin_user)):
+    if db.pool is None:
+        raise HTTPException(status_code=503, detail="Database pool is not initialized")
+    return {**db.pool.stats(), "executor": db.get_executor().stats(),
+            "replicas": [replica.stats() for replica in db.read_replicas]}
+
+@app.get("/api/admin/rate-limits")
+async def get_rate_limit_stats(admin: str = Depends(get_admin_user)):
+    return {limiter.name: limiter.stats() for limiter in (user_limiter, ip_limiter, login_limiter)}
+
+@app.get("/api/admin/passwords")
+async def get_password_hashing_stats(admin: str = Depends(get_admin_user)):
+    return passwords.get_pool().stats()
+
+@app.get("/api/admin/cache")
+async def get_cache_stats(admin: str = Depends(get_admin_user)):
+    return {"blogs": blog_cache.stats()}
+
+@app.get("/api/admin/slow-queries")
+async def get_slow_queries(limit: int = Query(50, ge=1, le=slowlog.LOG_SIZE), admin: str = Depends(get_admin_user)):
+    return serialization.json_response({**slowlog.log.stats(), "entries": slowlog.log.entries(limit)})
+
+@app.delete("/api/admin/slow-queries")
+async def clear_slow_queries(admin: str = Depends(get_admin_user)):
+    slowlog.log.clear()
+    return {"message": "Slow query log cleared"}
+
+@app.get("/api/admin/jobs")
+async def get_jobs(limit: int = Query(50, ge=1, le=500), admin: str = Depends(get_admin_user)):
+    result = await run_db(jobs.stats, limit)
+    return serialization.json_response({
+        **result,
+        "types": {name: {"concurrency": job.concurrency, "max_attempts": job.max_attempts}
+                  for name, job in jobs.handlers.items()},
+    })
+
+def _retry_job(conn, job_id: int):
+    if not jobs.retry(conn, job_id):
+        raise HTTPException(status_code=404, detail="Failed job not found")
+
+@app.post("/api/admin/jobs/{job_id}/retry")
+async def retry_job(job_id: int, admin: str = Depends(get_admin_user)):
+    await run_db(_retry_job, job_id)
+    jobs.worker.wake()
+    return {"message": "Job queued"}
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    # Pool, executor va kesh holati so'rov paytida o'qiladi
+    if db.pool is not None and not db.pool.closed:
+        pool_stats = db.pool.stats()
+        for state in ("idle", "in_use", "waiting"):
+            metrics.DB_POOL_CONNECTIONS.set(pool_stats[state], state=state)
+    executor_stats = db.get_executor().stats()
+    for state in ("in_flight", "queued"):
+        metrics.DB_EXECUTOR_TASKS.set(executor_stats[state], state=state)
+    for stat, value in blog_cache.stats().items():
+        metrics.BLOG_CACHE.set(value, stat=stat)
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # Auth endpoints
-@app.post("/api/register")
-async def register(user: UserRegister):
-    conn = safe_get_conn()
+async def run_hash(fn, *args):
+    """Parol hash'lash alohida pool'da; navbat to'lsa 503."""
+    try:
+        return await fn(*args)
+    except passwords.HashQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+def _register(conn, user: UserRegister, password_hash: str):
     cursor = conn.cursor()
-    
     try:
         cursor.execute(
             "INSERT INTO users (username, password, email) VALUES (%s, %s, %s)",
-            (user.username, user.password, user.email)
+            (user.username, password_hash, user.email)
         )
         conn.commit()
-        token = create_token(user.username)
-        return {"message": "User registered successfully", "token": token}
     except psycopg2.IntegrityError:
+        conn.rollback()
         raise HTTPException(status_code=400, detail="Username or email already exists")
-    finally:
-        conn.close()
 
-@app.post("/api/login")
+@app.post("/api/register", dependencies=[Depends(limit_login)])
+async def register(user: UserRegister):
+    password_hash = await run_hash(passwords.hash_password, user.password)
+    await run_db(_register, user, password_hash)
+    token = create_token(user.username)
+    return {"message": "User registered successfully", "token": token}
+
+@app.post("/api/login", dependencies=[Depends(limit_login)])
 async def login(user: UserLogin):
-    conn = safe_get_conn()
-    cursor = conn.cursor()
-    
-    cursor.execute(
+    result = await fetch_one(
         "SELECT username, password FROM users WHERE username = %s",
         (user.username,)
     )
-    result = cursor.fetchone()
-    conn.close()
     
-    if not result or result["password"] != user.password:
+    stored = result["password"] if result else None
+    valid, new_hash = await run_hash(passwords.verify, user.password, stored)
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
-    
+
+    if new_hash:
+        # Eski plaintext (yoki eskirgan hash) — kirishda bcrypt'ga o'tkaziladi.
+        # Parol shu orada o'zgargan bo'lsa, yangisini ustidan yozmaslik uchun eski qiymat solishtiriladi.
+        await run_db(
+            db.execute,
+            "UPDATE users SET password = %s WHERE username = %s AND password = %s",
+            (new_hash, user.username, stored)
+        )
+
     token = create_token(user.username)
     return {"message": "Login successful", "token": token}
 
 # Folder endpoints
-@app.post("/api/folders", response_model=FolderResponse)
-async def create_folder(folder: FolderCreate, current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
+def _create_folder(conn, folder: FolderCreate, current_user: str):
     cursor = conn.cursor()
-    
     try:
         cursor.execute(
-            "INSERT INTO folders (name, parent_id, author) VALUES (%s, %s, %s) RETURNING *",
+            f"INSERT INTO folders (name, parent_id, author) VALUES (%s, %s, %s) RETURNING {FOLDER_COLUMNS}",
             (folder.name, folder.parent_id, current_user)
         )
         result = cursor.fetchone()
         conn.commit()
-
-        created = result.get("created_at")
-        if isinstance(created, datetime):
-            created = created.isoformat()
-
-        return {
-            "id": result["id"],
-            "name": result["name"],
-            "parent_id": result["parent_id"],
-            "author": result["author"],
-            "created_at": created
-        }
+        return result
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        conn.close()
 
-@app.put("/api/folders/{folder_id}", response_model=FolderResponse)
-async def update_folder(folder_id: int, folder: FolderUpdate, current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
+@app.post("/api/folders", response_model=FolderResponse)
+async def create_folder(folder: FolderCreate, current_user: str = Depends(get_current_user)):
+    result = await run_db(_create_folder, folder, current_user)
+    return serialization.row_response(result)
+
+def _update_folder(conn, folder_id: int, folder: FolderUpdate, current_user: str):
     cursor = conn.cursor()
     
     # Faqat papka egasi yangilasa olishi uchun tekshirish
@@ -276,60 +571,30 @@ async def update_folder(folder_id: int, folder: FolderUpdate, current_user: str
     
     try:
         cursor.execute(
-            "UPDATE folders SET name = %s WHERE id = %s RETURNING *",
+            f"UPDATE folders SET name = %s WHERE id = %s RETURNING {FOLDER_COLUMNS}",
             (folder.name, folder_id)
         )
         result = cursor.fetchone()
         conn.commit()
-
-        created = result.get("created_at")
-        if isinstance(created, datetime):
-            created = created.isoformat()
-
-        return {
-            "id": result["id"],
-            "name": result["name"],
-            "parent_id": result["parent_id"],
-            "author": result["author"],
-            "created_at": created
-        }
+        return result
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        conn.close()
+
+@app.put("/api/folders/{folder_id}", response_model=FolderResponse)
+async def update_folder(folder_id: int, folder: FolderUpdate, current_user: str = Depends(get_current_user)):
+    result = await run_db(_update_folder, folder_id, folder, current_user)
+    return serialization.row_response(result)
 
 @app.get("/api/folders", response_model=List[FolderResponse])
 async def get_folders(current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT * FROM folders WHERE author = %s ORDER BY created_at DESC",
+    results = await read_all(
+        AUTHOR_FOLDERS_SQL.format(columns=FOLDER_COLUMNS),
         (current_user,)
     )
-    results = cursor.fetchall()
-    conn.close()
-    
-    folders = []
-    for result in results:
-        created = result.get("created_at")
-        if isinstance(created, datetime):
-            created = created.isoformat()
-
-        folders.append({
-            "id": result["id"],
-            "name": result["name"],
-            "parent_id": result["parent_id"],
-            "author": result["author"],
-            "created_at": created
-        })
-    
-    return folders
+    return serialization.rows_response(results)
 
-@app.delete("/api/folders/{folder_id}")
-async def delete_folder(folder_id: int, current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
+def _delete_folder(conn, folder_id: int, current_user: str):
     cursor = conn.cursor()
     
     cursor.execute("SELECT author FROM folders WHERE id = %s", (folder_id,))
@@ -342,23 +607,215 @@ async def delete_folder(folder_id: int, current_user: str = Depends(get_current_
         raise HTTPException(status_code=403, detail="You can only delete your own folders")
     
     try:
+        # Ichki papkalardagi bloglar ham folder_id = NULL bo'ladi, ularni keshdan chiqarish kerak
+        cursor.execute('''
+            WITH RECURSIVE subtree AS (
+                SELECT id FROM folders WHERE id = %s
+                UNION ALL
+                SELECT f.id FROM folders f JOIN subtree s ON f.parent_id = s.id
+            )
+            SELECT b.id FROM blogs b JOIN subtree s ON b.folder_id = s.id
+        ''', (folder_id,))
+        affected_blogs = [row["id"] for row in cursor.fetchall()]
+
         # Papka va uning ichidagi barcha narsalar o'chadi (CASCADE tufayli)
         cursor.execute("DELETE FROM folders WHERE id = %s", (folder_id,))
         conn.commit()
-        return {"message": "Folder and all its contents deleted successfully"}
+        return affected_blogs
     except Exception as e:
         conn.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        conn.close()
+
+@app.delete("/api/folders/{folder_id}")
+async def delete_folder(folder_id: int, current_user: str = Depends(get_current_user)):
+    affected_blogs = await run_db(_delete_folder, folder_id, current_user)
+    _invalidate_blogs(*affected_blogs)
+    return {"message": "Folder and all its contents deleted successfully"}
+
+# Bir nechta id ustida bitta tranzaksiyada ishlash: egalik va nishon tekshiruvlari bittadan so'rov
+def _unique(ids):
+    return list(dict.fromkeys(ids))
+
+def _owned_rows(cursor, table: str, ids: list, current_user: str):
+    """Returns (owned ids, per-id results for the others); locks the owned rows."""
+    cursor.execute(f"SELECT id, author FROM {table} WHERE id = ANY(%s) FOR UPDATE", (ids,))
+    authors = {row["id"]: row["author"] for row in cursor.fetchall()}
+    owned, results = [], {}
+    for item_id in ids:
+        if item_id not in authors:
+            results[item_id] = "not_found"
+        elif authors[item_id] != current_user:
+            results[item_id] = "forbidden"
+        else:
+            owned.append(item_id)
+    return owned, results
+
+def _batch_response(ids: list, results: dict, done_status: str):
+    return {
+        "results": [{"id": item_id, "status": results[item_id]} for item_id in ids],
+        done_status: sum(1 for status in results.values() if status == done_status),
+    }
+
+def _batch_move_folders(conn, ids: list, parent_id: Optional[int], current_user: str):
+    cursor = conn.cursor()
+    owned, results = _owned_rows(cursor, "folders", ids, current_user)
+
+    # Nishon papka va uning barcha ota papkalari: ularning birini o'z ichiga ko'chirib bo'lmaydi
+    blocked = set()
+    if parent_id is not None:
+        cursor.execute('''
+            WITH RECURSIVE ancestors AS (
+                SELECT id, parent_id, author FROM folders WHERE id = %s
+                UNION ALL
+                SELECT f.id, f.parent_id, f.author FROM folders f JOIN ancestors a ON f.id = a.parent_id
+            )
+            SELECT id, author FROM ancestors
+        ''', (parent_id,))
+        chain = cursor.fetchall()
+        if not chain or chain[0]["author"] != current_user:
+            conn.rollback()
+            raise HTTPException(status_code=404, detail="Target folder not found")
+        blocked = {row["id"] for row in chain}
+
+    movable = []
+    for folder_id in owned:
+        if folder_id in blocked:
+            results[folder_id] = "invalid_target"
+        else:
+            movable.append(folder_id)
+            results[folder_id] = "moved"
+
+    if movable:
+        cursor.execute("UPDATE folders SET parent_id = %s WHERE id = ANY(%s)", (parent_id, movable))
+    conn.commit()
+    return _batch_response(ids, results, "moved")
+
+def _batch_delete_folders(conn, ids: list, current_user: str):
+    cursor = conn.cursor()
+    owned, results = _owned_rows(cursor, "folders", ids, current_user)
+    affected_blogs = []
+    if owned:
+        cursor.execute('''
+            WITH RECURSIVE subtree AS (
+                SELECT id FROM folders WHERE id = ANY(%s)
+                UNION
+                SELECT f.id FROM folders f JOIN subtree s ON f.parent_id = s.id
+            )
+            SELECT b.id FROM blogs b JOIN subtree s ON b.folder_id = s.id
+        ''', (owned,))
+        affected_blogs = [row["id"] for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM folders WHERE id = ANY(%s)", (owned,))
+        for folder_id in owned:
+            results[folder_id] = "deleted"
+    conn.commit()
+    return _batch_response(ids, results, "deleted"), affected_blogs
+
+@app.post("/api/folders/batch/move")
+async def batch_move_folders(request: FolderBatchMove, current_user: str = Depends(get_current_user)):
+    result = await run_db(_batch_move_folders, _unique(request.ids), request.parent_id, current_user)
+    return serialization.json_response(result)
+
+@app.post("/api/folders/batch/delete")
+async def batch_delete_folders(request: BatchIds, current_user: str = Depends(get_current_user)):
+    result, affected_blogs = await run_db(_batch_delete_folders, _unique(request.ids), current_user)
+    _invalidate_blogs(*affected_blogs)
+    return serialization.json_response(result)
+
+# Media endpoints
+MEDIA_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_media_types = {}
+
+async def externalize_media(cells_data):
+    """Eski klientlar yuborgan base64 data URL'larni blob store'ga ko'chiradi."""
+    if not media.has_embedded_media(cells_data):
+        return cells_data, []
+    return await run_in_threadpool(media.externalize_cells, cells_data)
+
+def _register_upload(conn, sha256: str, content_type: str, size: int, current_user: str):
+    cursor = conn.cursor()
+    media.register_media(cursor, [(sha256, content_type, size)], current_user)
+    conn.commit()
+
+@app.post("/api/media")
+async def upload_media(file: UploadFile = File(...), current_user: str = Depends(get_current_user)):
+    content_type = media.normalize_type(file.content_type)
+    if not media.is_allowed_type(content_type):
+        raise HTTPException(status_code=415, detail="Only image and video files can be uploaded")
+    writer = await run_in_threadpool(media.BlobWriter)
+    try:
+        while True:
+            chunk = await file.read(media.CHUNK_SIZE)
+            if not chunk:
+                break
+            await run_in_threadpool(writer.write, chunk)
+        sha256, size = await run_in_threadpool(writer.commit)
+    except media.MediaTooLarge as e:
+        writer.abort()
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception:
+        writer.abort()
+        raise
+
+    await run_db(_register_upload, sha256, content_type, size, current_user)
+    return {
+        "name": file.filename,
+        "type": content_type,
+        "size": size,
+        "sha256": sha256,
+        "url": media.media_url(sha256)
+    }
+
+@app.get("/api/media/{sha256}")
+async def get_media(sha256: str, request: Request):
+    if not media.is_valid_sha256(sha256):
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    # Kontent hash bo'yicha saqlangani uchun fayl hech qachon o'zgarmaydi.
+    # nosniff: brauzer faylni e'lon qilingan turidan boshqa narsa (masalan HTML) deb talqin qilmaydi
+    etag = f'"{sha256}"'
+    headers = {"ETag": etag, "Cache-Control": MEDIA_CACHE_CONTROL, "X-Content-Type-Options": "nosniff"}
+    if request.headers.get("if-none-match") in (etag, "*"):
+        return Response(status_code=304, headers=headers)
+
+    path = media.blob_path(sha256)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    content_type = _media_types.get(sha256)
+    if content_type is None:
+        row = await read_one("SELECT content_type FROM media WHERE sha256 = %s", (sha256,))
+        content_type = row["content_type"] if row else "application/octet-stream"
+        if len(_media_types) > 10000:
+            _media_types.clear()
+        _media_types[sha256] = content_type
+
+    # Tekshiruvdan oldin saqlangan boshqa turdagi fayllar sahifada ochilmaydi, faqat yuklab olinadi
+    if not media.is_allowed_type(content_type):
+        headers["Content-Disposition"] = "attachment"
+    return FileResponse(path, media_type=content_type, headers=headers)
 
 # Blog endpoints
+def _create_blog(conn, blog: BlogCreate, cells_data: list, stored_media: list, current_user: str):
+    cursor = conn.cursor()
+    cells_json = json.dumps(cells_data)
+    try:
+        media.register_media(cursor, stored_media, current_user)
+        cursor.execute(
+            f"INSERT INTO blogs (title, cells, author, folder_id) VALUES (%s, %s::jsonb, %s, %s) RETURNING {BLOG_COLUMNS}",
+            (blog.title, cells_json, current_user, blog.folder_id)
+        )
+        result = cursor.fetchone()
+        revisions.record(cursor, result["id"], current_user, blog.title, cells_json)
+        _enqueue_post_save(cursor, result["id"], cells_data)
+        conn.commit()
+        return result
+    except Exception as e:
+        conn.rollback()
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
 @app.post("/api/blogs", response_model=BlogResponse)
 async def create_blog(blog: BlogCreate, current_user: str = Depends(get_current_user)):
-    print(f"Creating blog with folder_id: {blog.folder_id}")
-    
-    conn = safe_get_conn()
-    cursor = conn.cursor()
+    logger.debug("Creating blog with folder_id: %s", blog.folder_id)
     
     cells_data = []
     for cell in blog.cells:
@@ -369,107 +826,209 @@ async def create_blog(blog: BlogCreate, current_user: str = Depends(get_current_
         }
         cells_data.append(cell_data)
     
-    cells_json = json.dumps(cells_data)
+    cells_data, stored_media = await externalize_media(cells_data)
     
-    try:
-        cursor.execute(
-            "INSERT INTO blogs (title, cells, author, folder_id) VALUES (%s, %s::jsonb, %s, %s) RETURNING *",
-            (blog.title, cells_json, current_user, blog.folder_id)
-        )
-        result = cursor.fetchone()
-        conn.commit()
+    result = await run_db(_create_blog, blog, cells_data, stored_media, current_user)
+    jobs.worker.wake()
 
-        created = result.get("created_at")
-        updated = result.get("updated_at")
-        if isinstance(created, datetime):
-            created = created.isoformat()
-        if isinstance(updated, datetime):
-            updated = updated.isoformat()
-
-        return {
-            "id": result["id"],
-            "title": result["title"],
-            "cells": result["cells"],
-            "author": result["author"],
-            "folder_id": result["folder_id"],
-            "created_at": created,
-            "updated_at": updated
-        }
-    except Exception as e:
-        conn.rollback()
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        conn.close()
+    return serialization.row_response(result, raw_columns=("cells",))
 
 @app.get("/api/blogs", response_model=List[BlogResponse])
 async def get_blogs(current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT * FROM blogs WHERE author = %s ORDER BY created_at DESC",
+    results = await read_all(
+        AUTHOR_BLOGS_SQL.format(columns=BLOG_COLUMNS),
         (current_user,)
     )
-    results = cursor.fetchall()
-    conn.close()
+    return serialization.rows_response(results, raw_columns=("cells",))
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Siqilgan variantlarning ETag'i "-br" kabi qo'shimcha bilan farq qiladi, tarkib esa bir xil
+    candidates = [compression.base_etag(value.strip()) for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+async def _encoded_body(response_cache: cache.LRUCache, key, entry: dict, encoding: str) -> bytes:
+    """Keshlangan javobning siqilgan varianti; har bir versiya har bir encoding uchun bir marta siqiladi."""
+    encoded = entry["encoded"].get(encoding)
+    if encoded is None:
+        encoded = await compression.compress_async(entry["body"], encoding, compression.STATIC_LEVELS[encoding])
+        # Yangi dict: boshqa so'rovlar o'qiyotgan entry o'zgartirilmaydi
+        variants = {**entry["encoded"], encoding: encoded}
+        size = len(entry["body"]) + sum(len(data) for data in variants.values())
+        response_cache.update(key, {**entry, "encoded": variants}, size)
+    return encoded
+
+def _cache_entry(body: bytes, lsn: int = 0) -> dict:
+    # Kuchli ETag: javob tanasining hash'i, versiya o'zgarsa ETag ham o'zgaradi.
+    # lsn: ma'lumot kamida shu WAL pozitsiyasidagidek yangi (replikalar bilan, aks holda 0)
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    return {"etag": etag, "body": body, "encoded": {}, "lsn": lsn}
+
+def _cache_fresh(entry: Optional[dict]) -> bool:
+    # Mijoz (X-Min-LSN) yoki foydalanuvchi yozuvi talab qilgandan eskiroq yozuv ishlatilmaydi
+    return entry is not None and entry["lsn"] >= replicas.min_lsn()
+
+async def _cached_response(response_cache: cache.LRUCache, key, entry: dict, request: Request, media_type: str):
+    encoding = None
+    if len(entry["body"]) >= compression.MINIMUM_SIZE:
+        encoding = compression.negotiate(request.headers.get("accept-encoding"))
+    headers = {
+        "ETag": compression.encoded_etag(entry["etag"], encoding),
+        "Cache-Control": BLOG_CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+    }
+    if _etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+        return Response(status_code=304, headers=headers)
+    if encoding is None:
+        return Response(content=entry["body"], media_type=media_type, headers=headers)
+    # Content-Encoding o'rnatilgani uchun CompressionMiddleware javobni qayta siqmaydi
+    headers["Content-Encoding"] = encoding
+    body = await _encoded_body(response_cache, key, entry, encoding)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+@app.get("/api/blogs/{blog_id}", response_model=BlogResponse, dependencies=[Depends(limit_by_ip)])
+async def get_blog(blog_id: int, request: Request):
+    entry = blog_cache.get(blog_id)
+    if not _cache_fresh(entry):
+        token = blog_cache.begin_fill()
+        # Kesh shu jarayondagi yozuvlarning hammasini ko'rgan o'qish bilan to'ldiriladi:
+        # invalidatsiyadan orqada qolgan replika eski qatorni keshga qaytarmasin
+        replicas.require(replicas.primary_lsn())
+        result = await read_one(f"SELECT {BLOG_COLUMNS} FROM blogs WHERE id = %s", (blog_id,))
     
-    blogs = []
-    for result in results:
-        created = result.get("created_at")
-        updated = result.get("updated_at")
-        if isinstance(created, datetime):
-            created = created.isoformat()
-        if isinstance(updated, datetime):
-            updated = updated.isoformat()
-
-        blogs.append({
-            "id": result["id"],
-            "title": result["title"],
-            "cells": result["cells"],
-            "author": result["author"],
-            "folder_id": result["folder_id"],
-            "created_at": created,
-            "updated_at": updated
-        })
+        if not result:
+            raise HTTPException(status_code=404, detail="Blog not found")
     
-    return blogs
-
-@app.get("/api/blogs/{blog_id}", response_model=BlogResponse)
-async def get_blog(blog_id: int):
-    conn = safe_get_conn()
+        entry = _cache_entry(serialization.dumps(serialization.with_raw_json([result], "cells")[0]),
+                             replicas.read_lsn())
+        blog_cache.put(blog_id, entry, len(entry["body"]), token)
+
+    return await _cached_response(blog_cache, blog_id, entry, request, "application/json")
+
+# Saqlashda HTML eskirgan deb belgilanadi (html_version = NULL) va render_blog job'i qo'yiladi;
+# job ulgurmasa, birinchi GET /html o'zi render qiladi
+def _enqueue_render(cursor, blog_id: int):
+    jobs.enqueue(cursor, "render_blog", {"blog_id": blog_id}, key=str(blog_id))
+
+def _enqueue_post_save(cursor, blog_id: int, cells: list):
+    """cells: saqlangan yoki o'zgargan kataklar. Yangi rasmlar bo'lsa, avval ularning variantlari
+    tayyorlanadi, render_blog'ni esa media_variants job'i tugagach o'zi qo'yadi."""
+    if media.needs_variants(cells):
+        jobs.enqueue(cursor, "media_variants", {"blog_id": blog_id}, key=str(blog_id))
+    else:
+        _enqueue_render(cursor, blog_id)
+
+def _render_blog_html(conn, blog_id: int) -> Optional[list]:
+    """Blog HTML fragments, rendered and saved first if missing or stale; None if there is no such blog."""
     cursor = conn.cursor()
-
-    cursor.execute("SELECT * FROM blogs WHERE id = %s", (blog_id,))
+    cursor.execute("SELECT html_cells, html_version, xmin::text AS row_version FROM blogs WHERE id = %s", (blog_id,))
     result = cursor.fetchone()
-    conn.close()
-    
     if not result:
-        raise HTTPException(status_code=404, detail="Blog not found")
-    
-    created = result.get("created_at")
-    updated = result.get("updated_at")
-    if isinstance(created, datetime):
-        created = created.isoformat()
-    if isinstance(updated, datetime):
-        updated = updated.isoformat()
+        conn.commit()
+        return None
+    if render.is_current(result["html_cells"], result["html_version"]):
+        conn.commit()
+        return result["html_cells"]
 
-    return {
-        "id": result["id"],
-        "title": result["title"],
-        "cells": result["cells"],
-        "author": result["author"],
-        "folder_id": result["folder_id"],
-        "created_at": created,
-        "updated_at": updated
-    }
+    # Yangi saqlangan, import qilingan yoki renderer versiyasi eskirgan post
+    cursor.execute("SELECT cells FROM blogs WHERE id = %s", (blog_id,))
+    html_cells = render.render_cells(cursor.fetchone()["cells"], result["html_cells"])
+    # Shu orada qator o'zgargan bo'lsa (xmin har UPDATE'da yangilanadi, job'lar updated_at'ni
+    # o'zgartirmaydi), eskirgan HTML yangisi ustidan yozilmaydi
+    cursor.execute(
+        "UPDATE blogs SET html_cells = %s::jsonb, html_version = %s WHERE id = %s AND xmin::text = %s",
+        (serialization.dumps(html_cells).decode(), render.RENDERER_VERSION, blog_id, result["row_version"])
+    )
+    conn.commit()
+    return html_cells
 
-@app.put("/api/blogs/{blog_id}", response_model=BlogResponse)
-async def update_blog(blog_id: int, blog: BlogCreate, current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
+@jobs.handler("render_blog", concurrency=2)
+def _render_blog_job(conn, payload: dict):
+    _render_blog_html(conn, payload["blog_id"])
+
+def _variant_sources(conn, blog_id: int):
+    """(author, variantlari hali yo'q rasmlar sha256'lari) yoki blog yo'q bo'lsa None."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT cells, author FROM blogs WHERE id = %s", (blog_id,))
+    row = cursor.fetchone()
+    if not row:
+        conn.commit()
+        return None
+    sources = media.image_sources(row["cells"])
+    done = media.load_variants(cursor, sources)
+    conn.commit()
+    return row["author"], [sha256 for sha256 in sources if sha256 not in done]
+
+def _store_variants(conn, source: str, variants: list, author: str):
+    cursor = conn.cursor()
+    media.store_variants(cursor, source, variants, author)
+    conn.commit()
+
+def _apply_variants(conn, blog_id: int):
+    # Kataklar qulf ostida qayta o'qiladi: shu orada saqlangan o'zgarishlar yo'qolmaydi.
+    # Variantlar hosila ma'lumot, shuning uchun reviziya va updated_at o'zgarmaydi
+    cursor = conn.cursor()
+    cursor.execute("SELECT cells FROM blogs WHERE id = %s FOR UPDATE", (blog_id,))
+    row = cursor.fetchone()
+    if row:
+        cells, changed = media.apply_variants(row["cells"], media.load_variants(cursor, media.image_sources(row["cells"])))
+        if changed:
+            cursor.execute("UPDATE blogs SET cells = %s::jsonb, html_version = NULL WHERE id = %s",
+                           (json.dumps(cells), blog_id))
+        _enqueue_render(cursor, blog_id)
+    conn.commit()
+
+@jobs.handler("media_variants", concurrency=1)
+async def _media_variants_job(payload: dict):
+    blog_id = payload["blog_id"]
+    found = await db.run(_variant_sources, blog_id)
+    if found is None:
+        return
+    author, pending = found
+
+    # Rasmlar DB ulanishisiz qayta ishlanadi (Pillow sekin); har bir manba alohida qisqa
+    # tranzaksiyada yoziladi, qayta urinishda takrorlanmaydi
+    for sha256 in pending:
+        variants = await run_in_threadpool(media.generate_variants, sha256)
+        await db.run(_store_variants, sha256, variants, author)
+
+    await db.run(_apply_variants, blog_id)
+    _invalidate_blogs(blog_id)
+
+def _blog_html(conn, blog_id: int) -> str:
+    html_cells = _render_blog_html(conn, blog_id)
+    if html_cells is None:
+        raise HTTPException(status_code=404, detail="Blog not found")
+    return render.join(html_cells)
+
+@app.get("/api/blogs/{blog_id}/html", dependencies=[Depends(limit_by_ip)])
+async def get_blog_html(blog_id: int, request: Request):
+    entry = html_cache.get(blog_id)
+    if not _cache_fresh(entry):
+        token = html_cache.begin_fill()
+        # Eskirgan HTML shu yerda render qilinib yoziladi, shuning uchun primary'da
+        entry = _cache_entry((await run_db(_blog_html, blog_id)).encode(),
+                             max(replicas.min_lsn(), replicas.primary_lsn()))
+        html_cache.put(blog_id, entry, len(entry["body"]), token)
+    return await _cached_response(html_cache, blog_id, entry, request, "text/html; charset=utf-8")
+
+HIGHLIGHT_CSS = render.highlight_css().encode()
+HIGHLIGHT_CSS_ETAG = '"' + hashlib.sha256(HIGHLIGHT_CSS).hexdigest()[:32] + '"'
+
+@app.get("/api/render/highlight.css")
+async def get_highlight_css(request: Request):
+    headers = {"ETag": HIGHLIGHT_CSS_ETAG, "Cache-Control": "public, max-age=86400"}
+    if _etag_matches(request.headers.get("if-none-match"), HIGHLIGHT_CSS_ETAG):
+        return Response(status_code=304, headers=headers)
+    return Response(content=HIGHLIGHT_CSS, media_type="text/css", headers=headers)
+
+def _update_blog(conn, blog_id: int, blog: BlogCreate, cells_data: list, stored_media: list, current_user: str):
     cursor = conn.cursor()
     
-    # Faqat blog egasi yangilasa olishi uchun tekshirish
-    cursor.execute("SELECT author FROM blogs WHERE id = %s", (blog_id,))
+    # Faqat blog egasi yangilasa olishi uchun tekshirish.
+    # Qator qulflanadi: reviziyalar raqami va delta shu holatga nisbatan hisoblanadi
+    cursor.execute("SELECT author, cells FROM blogs WHERE id = %s FOR UPDATE", (blog_id,))
     result = cursor.fetchone()
     
     if not result:
@@ -477,7 +1036,24 @@ async def update_blog(blog_id: int, blog: BlogCreate, current_user: str = Depend
     
     if result["author"] != current_user:
         raise HTTPException(status_code=403, detail="You can only update your own blogs")
-    
+
+    cells_json = json.dumps(cells_data)
+    revisions.ensure_base(cursor, blog_id)
+    media.register_media(cursor, stored_media, current_user)
+    cursor.execute(
+        "UPDATE blogs SET title = %s, cells = %s::jsonb, folder_id = %s, updated_at = CURRENT_TIMESTAMP, "
+        f"html_version = NULL WHERE id = %s RETURNING {BLOG_COLUMNS}",
+        (blog.title, cells_json, blog.folder_id, blog_id)
+    )
+    updated = cursor.fetchone()
+    revisions.record(cursor, blog_id, current_user, blog.title, cells_json,
+                     revisions.diff(result["cells"], cells_data))
+    _enqueue_post_save(cursor, blog_id, cells_data)
+    conn.commit()
+    return updated
+
+@app.put("/api/blogs/{blog_id}", response_model=BlogResponse)
+async def update_blog(blog_id: int, blog: BlogCreate, current_user: str = Depends(get_current_user)):
     cells_data = []
     for cell in blog.cells:
         cell_data = {
@@ -487,37 +1063,190 @@ async def update_blog(blog_id: int, blog: BlogCreate, current_user: str = Depend
         }
         cells_data.append(cell_data)
     
-    cells_json = json.dumps(cells_data)
+    cells_data, stored_media = await externalize_media(cells_data)
 
-    cursor.execute(
-        "UPDATE blogs SET title = %s, cells = %s::jsonb, folder_id = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING *",
-        (blog.title, cells_json, blog.folder_id, blog_id)
-    )
-    result = cursor.fetchone()
-    conn.commit()
-    conn.close()
-    
-    # Ensure timestamps are strings for JSON serialization
-    created = result.get("created_at")
-    updated = result.get("updated_at")
-    if isinstance(created, datetime):
-        created = created.isoformat()
-    if isinstance(updated, datetime):
-        updated = updated.isoformat()
+    result = await run_db(_update_blog, blog_id, blog, cells_data, stored_media, current_user)
+    _invalidate_blogs(blog_id)
+    jobs.worker.wake()
+    return serialization.row_response(result, raw_columns=("cells",))
 
-    return {
+# Cell-level o'zgarishlar: butun cells o'rniga faqat delta yuboriladi
+def _patch_blog(conn, blog_id: int, patch: BlogPatch, ops_json: str, stored_media: list, current_user: str):
+    cursor = conn.cursor()
+    try:
+        revisions.ensure_base(cursor, blog_id)
+        media.register_media(cursor, stored_media, current_user)
+        cursor.execute(
+            '''
+            UPDATE blogs
+            SET cells = blog_cells_apply(cells, %s::jsonb),
+                title = COALESCE(%s, title),
+                updated_at = CURRENT_TIMESTAMP,
+                html_version = NULL
+            WHERE id = %s AND author = %s
+            RETURNING id, title, author, updated_at, cells::text AS cells,
+                      (SELECT coalesce(jsonb_agg(c->'id'), '[]'::jsonb) FROM jsonb_array_elements(cells) c) AS cell_order
+            ''',
+            (ops_json, patch.title, blog_id, current_user)
+        )
+        result = cursor.fetchone()
+    except (psycopg2.errors.NoDataFound, psycopg2.errors.UniqueViolation) as e:
+        conn.rollback()
+        raise HTTPException(status_code=409, detail=e.diag.message_primary)
+
+    if not result:
+        conn.rollback()
+        cursor.execute("SELECT author FROM blogs WHERE id = %s", (blog_id,))
+        owner = cursor.fetchone()
+        if not owner:
+            raise HTTPException(status_code=404, detail="Blog not found")
+        raise HTTPException(status_code=403, detail="You can only update your own blogs")
+
+    # Yuborilgan ops o'zi delta: reviziyada aynan shular saqlanadi
+    ops = json.loads(ops_json)
+    revisions.record(cursor, blog_id, result.pop("author"), result["title"], result.pop("cells"), ops)
+    # Faqat o'zgargan kataklar qayta render qilinadi, qolganlari avvalgi html_cells'dan olinadi
+    _enqueue_post_save(cursor, blog_id, [op["cell"] for op in ops if "cell" in op])
+    conn.commit()
+    return result
+
+@app.patch("/api/blogs/{blog_id}")
+async def patch_blog(blog_id: int, patch: BlogPatch, current_user: str = Depends(get_current_user)):
+    ops = []
+    for operation in patch.ops:
+        op = {"op": operation.op, "after_id": operation.after_id}
+        if operation.op in ("insert", "replace"):
+            if operation.cell is None:
+                raise HTTPException(status_code=422, detail=f"'{operation.op}' needs a cell")
+            if operation.op == "replace" and operation.id is not None and operation.id != operation.cell.id:
+                raise HTTPException(status_code=422, detail="'replace' cannot change a cell's id")
+            op["cell"] = operation.cell.model_dump()
+            op["id"] = operation.cell.id if operation.id is None else operation.id
+        else:
+            if operation.id is None:
+                raise HTTPException(status_code=422, detail=f"'{operation.op}' needs a cell id")
+            op["id"] = operation.id
+        ops.append(op)
+
+    changed_cells = [op["cell"] for op in ops if "cell" in op]
+    changed_cells, stored_media = await externalize_media(changed_cells)
+    changed = iter(changed_cells)
+    for op in ops:
+        if "cell" in op:
+            op["cell"] = next(changed)
+
+    result = await run_db(_patch_blog, blog_id, patch, json.dumps(ops), stored_media, current_user)
+    _invalidate_blogs(blog_id)
+    jobs.worker.wake()
+
+    # Faqat o'zgargan narsalar qaytariladi: yangi/almashtirilgan kataklar, o'chirilganlar va tartib
+    order = result["cell_order"]
+    present = set(order)
+    latest = {}
+    for op in ops:
+        if "cell" in op:
+            latest[op["cell"]["id"]] = op["cell"]
+    return serialization.json_response({
         "id": result["id"],
         "title": result["title"],
-        "cells": result["cells"],
-        "author": result["author"],
-        "folder_id": result["folder_id"],
-        "created_at": created,
-        "updated_at": updated
-    }
+        "updated_at": result["updated_at"],
+        "order": order,
+        "changed": [cell for cell_id, cell in latest.items() if cell_id in present],
+        "deleted": sorted({op["id"] for op in ops if op["op"] == "delete"} - present)
+    })
+
+# Reviziyalar tarixi (revisions.py): faqat blog egasiga ko'rinadi
+REVISION_PAGE_SIZE = 50
+REVISION_MAX_PAGE_SIZE = 200
+
+def _check_blog_owner(cursor, blog_id: int, current_user: str, columns: str = "author", lock: bool = False):
+    cursor.execute(f"SELECT {columns} FROM blogs WHERE id = %s" + (" FOR UPDATE" if lock else ""), (blog_id,))
+    result = cursor.fetchone()
+    if not result:
+        raise HTTPException(status_code=404, detail="Blog not found")
+    if result["author"] != current_user:
+        raise HTTPException(status_code=403, detail="You can only view the history of your own blogs")
+    return result
 
-@app.delete("/api/blogs/{blog_id}")
-async def delete_blog(blog_id: int, current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
+def _list_revisions(conn, blog_id: int, limit: int, before: Optional[int], current_user: str):
+    cursor = conn.cursor()
+    _check_blog_owner(cursor, blog_id, current_user)
+    rows = revisions.list_revisions(cursor, blog_id, limit, before)
+    conn.commit()
+    return rows
+
+@app.get("/api/blogs/{blog_id}/revisions")
+async def list_blog_revisions(
+    blog_id: int,
+    limit: int = Query(REVISION_PAGE_SIZE, ge=1, le=REVISION_MAX_PAGE_SIZE),
+    before: Optional[int] = Query(None, ge=1),
+    current_user: str = Depends(get_current_user),
+):
+    rows = await read_db(_list_revisions, blog_id, limit, before, current_user)
+    next_before = rows[-1]["revision"] if len(rows) == limit and rows[-1]["revision"] > 1 else None
+    return serialization.json_response({"items": rows, "next_before": next_before})
+
+def _get_revision(conn, blog_id: int, revision: int, current_user: str):
+    cursor = conn.cursor()
+    _check_blog_owner(cursor, blog_id, current_user)
+    result = revisions.fetch(cursor, blog_id, revision)
+    conn.commit()
+    if not result:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return result
+
+@app.get("/api/blogs/{blog_id}/revisions/{revision}")
+async def get_blog_revision(blog_id: int, revision: int, current_user: str = Depends(get_current_user)):
+    result = await read_db(_get_revision, blog_id, revision, current_user)
+    return serialization.row_response({"blog_id": blog_id, **result}, raw_columns=("cells",))
+
+def _restore_revision(conn, blog_id: int, revision: int, current_user: str,
+                      cells_data: Optional[list] = None, stored_media: list = ()):
+    """(blog, None) after restoring. cells_data: the revision's cells with their media already moved
+    to the blob store. Without it, a revision that still holds data URL media is not written and
+    (None, cells) is returned, so they can be moved outside the DB call first."""
+    cursor = conn.cursor()
+    current = _check_blog_owner(cursor, blog_id, current_user, "author, cells", lock=True)
+    revisions.ensure_base(cursor, blog_id)
+    restored = revisions.fetch(cursor, blog_id, revision)
+    if not restored:
+        conn.rollback()
+        raise HTTPException(status_code=404, detail="Revision not found")
+
+    if cells_data is None:
+        cells, cells_json = json.loads(restored["cells"]), restored["cells"]
+        if media.has_embedded_media(cells):
+            conn.rollback()
+            return None, cells
+    else:
+        cells, cells_json = cells_data, json.dumps(cells_data)
+    media.register_media(cursor, stored_media, current_user)
+
+    # Tiklash ham yangi reviziya sifatida yoziladi, oradagi tarix o'chmaydi
+    cursor.execute(
+        "UPDATE blogs SET title = %s, cells = %s::jsonb, updated_at = CURRENT_TIMESTAMP, "
+        f"html_version = NULL WHERE id = %s RETURNING {BLOG_COLUMNS}",
+        (restored["title"], cells_json, blog_id)
+    )
+    result = cursor.fetchone()
+    revisions.record(cursor, blog_id, current_user, restored["title"], cells_json,
+                     revisions.diff(current["cells"], cells))
+    _enqueue_post_save(cursor, blog_id, cells)
+    conn.commit()
+    return result, None
+
+@app.post("/api/blogs/{blog_id}/revisions/{revision}/restore", response_model=BlogResponse)
+async def restore_blog_revision(blog_id: int, revision: int, current_user: str = Depends(get_current_user)):
+    result, embedded = await run_db(_restore_revision, blog_id, revision, current_user)
+    if embedded is not None:
+        # Media migratsiyasidan oldingi reviziya: data URL'lar oddiy saqlashdagidek blob store'ga ko'chiriladi
+        cells_data, stored_media = await externalize_media(embedded)
+        result, _ = await run_db(_restore_revision, blog_id, revision, current_user, cells_data, stored_media)
+    _invalidate_blogs(blog_id)
+    jobs.worker.wake()
+    return serialization.row_response(result, raw_columns=("cells",))
+
+def _delete_blog(conn, blog_id: int, current_user: str):
     cursor = conn.cursor()
     
     # Faqat blog egasi o'chira olishi uchun tekshirish
@@ -532,46 +1261,22 @@ async def delete_blog(blog_id: int, current_user: str = Depends(get_current_user
     
     cursor.execute("DELETE FROM blogs WHERE id = %s", (blog_id,))
     conn.commit()
-    conn.close()
-    
+
+@app.delete("/api/blogs/{blog_id}")
+async def delete_blog(blog_id: int, current_user: str = Depends(get_current_user)):
+    await run_db(_delete_blog, blog_id, current_user)
+    _invalidate_blogs(blog_id)
     return {"message": "Blog deleted successfully"}
 
 @app.get("/api/my-blogs", response_model=List[BlogResponse])
 async def get_my_blogs(current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT * FROM blogs WHERE author = %s ORDER BY created_at DESC",
+    results = await read_all(
+        AUTHOR_BLOGS_SQL.format(columns=BLOG_COLUMNS),
         (current_user,)
     )
-    results = cursor.fetchall()
-    conn.close()
-    
-    blogs = []
-    for result in results:
-        created = result.get("created_at")
-        updated = result.get("updated_at")
-        if isinstance(created, datetime):
-            created = created.isoformat()
-        if isinstance(updated, datetime):
-            updated = updated.isoformat()
-
-        blogs.append({
-            "id": result["id"],
-            "title": result["title"],
-            "cells": result["cells"],
-            "author": result["author"],
-            "folder_id": result["folder_id"],
-            "created_at": created,
-            "updated_at": updated
-        })
-    
-    return blogs
+    return serialization.rows_response(results, raw_columns=("cells",))
 
-@app.put("/api/blogs/{blog_id}/move")
-async def move_blog(blog_id: int, move_request: BlogMoveRequest, current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
+def _move_blog(conn, blog_id: int, folder_id: Optional[int], current_user: str):
     cursor = conn.cursor()
     
     cursor.execute("SELECT author FROM blogs WHERE id = %s", (blog_id,))
@@ -583,216 +1288,533 @@ async def move_blog(blog_id: int, move_request: BlogMoveRequest, current_user: s
     if result["author"] != current_user:
         raise HTTPException(status_code=403, detail="You can only move your own blogs")
     
-    if move_request.folder_id:
+    if folder_id:
         cursor.execute("SELECT id FROM folders WHERE id = %s AND author = %s", 
-                      (move_request.folder_id, current_user))
+                      (folder_id, current_user))
         folder_exists = cursor.fetchone()
         if not folder_exists:
             raise HTTPException(status_code=404, detail="Folder not found")
     
     cursor.execute(
         "UPDATE blogs SET folder_id = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
-        (move_request.folder_id, blog_id)
+        (folder_id, blog_id)
     )
     conn.commit()
-    conn.close()
-    
+
+@app.put("/api/blogs/{blog_id}/move")
+async def move_blog(blog_id: int, move_request: BlogMoveRequest, current_user: str = Depends(get_current_user)):
+    await run_db(_move_blog, blog_id, move_request.folder_id, current_user)
+    _invalidate_blogs(blog_id)
     return {"message": "Blog moved successfully"}
 
-@app.get("/api/root-blogs", response_model=List[BlogResponse])
-async def get_root_blogs(current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
+def _batch_move_blogs(conn, ids: list, folder_id: Optional[int], current_user: str):
     cursor = conn.cursor()
+    owned, results = _owned_rows(cursor, "blogs", ids, current_user)
 
-    cursor.execute(
-        "SELECT * FROM blogs WHERE (folder_id IS NULL) AND author = %s ORDER BY created_at DESC",
+    if folder_id is not None:
+        cursor.execute("SELECT author FROM folders WHERE id = %s", (folder_id,))
+        folder = cursor.fetchone()
+        if not folder or folder["author"] != current_user:
+            conn.rollback()
+            raise HTTPException(status_code=404, detail="Folder not found")
+
+    if owned:
+        cursor.execute(
+            "UPDATE blogs SET folder_id = %s, updated_at = CURRENT_TIMESTAMP WHERE id = ANY(%s)",
+            (folder_id, owned)
+        )
+        for blog_id in owned:
+            results[blog_id] = "moved"
+    conn.commit()
+    return _batch_response(ids, results, "moved"), owned
+
+def _batch_delete_blogs(conn, ids: list, current_user: str):
+    cursor = conn.cursor()
+    owned, results = _owned_rows(cursor, "blogs", ids, current_user)
+    if owned:
+        cursor.execute("DELETE FROM blogs WHERE id = ANY(%s)", (owned,))
+        for blog_id in owned:
+            results[blog_id] = "deleted"
+    conn.commit()
+    return _batch_response(ids, results, "deleted"), owned
+
+@app.post("/api/blogs/batch/move")
+async def batch_move_blogs(request: BlogBatchMove, current_user: str = Depends(get_current_user)):
+    result, moved = await run_db(_batch_move_blogs, _unique(request.ids), request.folder_id, current_user)
+    _invalidate_blogs(*moved)
+    return serialization.json_response(result)
+
+@app.post("/api/blogs/batch/delete")
+async def batch_delete_blogs(request: BatchIds, current_user: str = Depends(get_current_user)):
+    result, deleted = await run_db(_batch_delete_blogs, _unique(request.ids), current_user)
+    _invalidate_blogs(*deleted)
+    return serialization.json_response(result)
+
+@app.get("/api/root-blogs", response_model=List[BlogResponse])
+async def get_root_blogs(current_user: str = Depends(get_current_user)):
+    results = await read_all(
+        ROOT_BLOGS_SQL.format(columns=BLOG_COLUMNS),
         (current_user,)
     )
-    results = cursor.fetchall()
-    conn.close()
-    
-    blogs = []
-    for result in results:
-        created = result.get("created_at")
-        updated = result.get("updated_at")
-        if isinstance(created, datetime):
-            created = created.isoformat()
-        if isinstance(updated, datetime):
-            updated = updated.isoformat()
-
-        blogs.append({
-            "id": result["id"],
-            "title": result["title"],
-            "cells": result["cells"],
-            "author": result["author"],
-            "folder_id": result["folder_id"],
-            "created_at": created,
-            "updated_at": updated
-        })
-    
-    return blogs
+    return serialization.rows_response(results, raw_columns=("cells",))
 
 @app.get("/api/folders/{folder_id}/blogs", response_model=List[BlogResponse])
 async def get_folder_blogs(folder_id: int, current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
-    cursor = conn.cursor()
-
-    cursor.execute(
-        "SELECT * FROM blogs WHERE folder_id = %s AND author = %s ORDER BY created_at DESC",
+    results = await read_all(
+        FOLDER_BLOGS_SQL.format(columns=BLOG_COLUMNS),
         (folder_id, current_user)
     )
-    results = cursor.fetchall()
-    conn.close()
-    
-    blogs = []
-    for result in results:
-        created = result.get("created_at")
-        updated = result.get("updated_at")
-        if isinstance(created, datetime):
-            created = created.isoformat()
-        if isinstance(updated, datetime):
-            updated = updated.isoformat()
-
-        blogs.append({
-            "id": result["id"],
-            "title": result["title"],
-            "cells": result["cells"],
-            "author": result["author"],
-            "folder_id": result["folder_id"],
-            "created_at": created,
-            "updated_at": updated
-        })
-    
-    return blogs
+    return serialization.rows_response(results, raw_columns=("cells",))
 
-# Nested folder structure uchun yangi endpointlar
-@app.get("/api/folders/{folder_id}/contents")
-async def get_folder_contents(folder_id: int, current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
+# Yengil ro'yxatlar: cells o'rniga faqat kerakli ustunlar, keyset pagination bilan
+def encode_cursor(created_at: datetime, blog_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), blog_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, blog_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(created_at), int(blog_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# Birinchi matn katagidan markdown/HTML belgilarisiz qisqa parcha
+EXCERPT_EXPR = f"""
+    left(
+        regexp_replace(
+            coalesce(jsonb_path_query_first(cells, '$[*] ? (@.type == "text").content') #>> '{{}}', ''),
+            '(<[^>]*>|[#*_`]|\\s)+', ' ', 'g'
+        ),
+        {EXCERPT_LENGTH}
+    )
+"""
+EXCERPT_SQL = f"btrim({EXCERPT_EXPR}) AS excerpt"
+
+ROOT_SUMMARY_FILTER = "AND folder_id IS NULL"
+FOLDER_SUMMARY_FILTER = "AND folder_id = %s"
+
+def blog_summaries_query(folder_filter: str, after: bool, excerpt: bool) -> str:
+    """Parametrlar: author, folder_filter'niki, after bo'lsa (created_at, id), limit.
+    benchmarks/check_indexes.py ham shu so'rovni tekshiradi."""
+    columns = "id, title, folder_id, jsonb_array_length(cells) AS cell_count, created_at, updated_at, "
+    columns += EXCERPT_SQL if excerpt else "NULL AS excerpt"
+
+    query = f"SELECT {columns} FROM blogs WHERE author = %s {folder_filter}"
+    if after:
+        query += " AND (created_at, id) < (%s, %s)"
+    return query + " ORDER BY created_at DESC, id DESC LIMIT %s"
+
+def _list_blog_summaries(conn, current_user: str, folder_filter: str, folder_params: tuple,
+                         cursor: Optional[str], limit: int, excerpt: bool):
+    query = blog_summaries_query(folder_filter, bool(cursor), excerpt)
+    params = [current_user, *folder_params]
+    if cursor:
+        params.extend(decode_cursor(cursor))
+    # Keyingi sahifa bor-yo'qligini bilish uchun bitta ortiqcha qator olinadi
+    params.append(limit + 1)
+
+    rows = db.fetch_all(conn, query, params)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = encode_cursor(rows[-1]["created_at"], rows[-1]["id"]) if has_more else None
+    return serialization.json_response({"items": rows, "next_cursor": next_cursor})
+
+@app.get("/api/my-blogs/summary", response_model=BlogSummaryPage)
+async def get_my_blog_summaries(
+    cursor: Optional[str] = None,
+    limit: int = Query(SUMMARY_PAGE_SIZE, ge=1, le=SUMMARY_MAX_PAGE_SIZE),
+    excerpt: bool = False,
+    current_user: str = Depends(get_current_user),
+):
+    return await read_db(_list_blog_summaries, current_user, "", (), cursor, limit, excerpt)
+
+@app.get("/api/root-blogs/summary", response_model=BlogSummaryPage)
+async def get_root_blog_summaries(
+    cursor: Optional[str] = None,
+    limit: int = Query(SUMMARY_PAGE_SIZE, ge=1, le=SUMMARY_MAX_PAGE_SIZE),
+    excerpt: bool = False,
+    current_user: str = Depends(get_current_user),
+):
+    return await read_db(_list_blog_summaries, current_user, ROOT_SUMMARY_FILTER, (), cursor, limit, excerpt)
+
+@app.get("/api/folders/{folder_id}/blogs/summary", response_model=BlogSummaryPage)
+async def get_folder_blog_summaries(
+    folder_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(SUMMARY_PAGE_SIZE, ge=1, le=SUMMARY_MAX_PAGE_SIZE),
+    excerpt: bool = False,
+    current_user: str = Depends(get_current_user),
+):
+    return await read_db(_list_blog_summaries, current_user, FOLDER_SUMMARY_FILTER, (folder_id,), cursor, limit, excerpt)
+
+# Papkalar daraxti: bitta rekursiv CTE bilan butun ierarxiya yoki subtree
+FOLDER_TREE_MAX_DEPTH = 50
+
+def _folder_tree(conn, current_user: str, folder_id: Optional[int], depth: Optional[int],
+                 include_blogs: bool, excerpt: bool):
+    params = {"author": current_user, "folder_id": folder_id, "max_depth": depth}
+
+    if folder_id is None:
+        anchor = '''
+            SELECT id, name, parent_id, created_at, 1 AS depth, ARRAY[id] AS path
+            FROM folders
+            WHERE parent_id IS NULL AND author = %(author)s
+              AND (%(max_depth)s::int IS NULL OR %(max_depth)s::int >= 1)
+        '''
+    else:
+        anchor = '''
+            SELECT id, name, parent_id, created_at, 0 AS depth, ARRAY[id] AS path
+            FROM folders
+            WHERE id = %(folder_id)s AND author = %(author)s
+        '''
+
+    # Bloglar to'liq qator emas, faqat yengil stub sifatida (cells o'qilmaydi, excerpt so'ralmasa)
+    if include_blogs:
+        stub_fields = '''
+            'id', b.id, 'title', b.title, 'folder_id', b.folder_id, 'cell_count', jsonb_array_length(b.cells),
+            'created_at', b.created_at, 'updated_at', b.updated_at
+        '''
+        if excerpt:
+            stub_fields += f", 'excerpt', btrim({EXCERPT_EXPR.replace('cells', 'b.cells')})"
+        blogs_agg = f"coalesce(jsonb_agg(jsonb_build_object({stub_fields}) ORDER BY b.created_at DESC, b.id DESC), '[]')"
+    else:
+        blogs_agg = "'[]'::jsonb"
+
+    def blog_stats(folder_condition):
+        return f'''
+            LEFT JOIN LATERAL (
+                SELECT count(*) AS blog_count, {blogs_agg} AS blogs
+                FROM blogs b
+                WHERE b.author = %(author)s AND {folder_condition}
+            ) stats ON true
+        '''
+
+    query = f'''
+        WITH RECURSIVE tree AS (
+            {anchor}
+            UNION ALL
+            SELECT f.id, f.name, f.parent_id, f.created_at, t.depth + 1, t.path || f.id
+            FROM folders f
+            JOIN tree t ON f.parent_id = t.id
+            WHERE f.author = %(author)s
+              AND NOT f.id = ANY(t.path)
+              AND (%(max_depth)s::int IS NULL OR t.depth < %(max_depth)s::int)
+        )
+        SELECT t.id, t.name, t.parent_id, t.created_at, t.depth,
+               (SELECT count(*) FROM folders c WHERE c.parent_id = t.id AND c.author = %(author)s) AS subfolder_count,
+               stats.blog_count, stats.blogs::text AS blogs
+        FROM tree t
+        {blog_stats("b.folder_id = t.id")}
+    '''
+    if folder_id is None:
+        # Root papkaning o'zi: ildiz papkalar soni va folder_id IS NULL bloglar
+        query += f'''
+        UNION ALL
+        SELECT NULL, NULL, NULL, NULL, 0,
+               (SELECT count(*) FROM folders c WHERE c.parent_id IS NULL AND c.author = %(author)s),
+               stats.blog_count, stats.blogs::text AS blogs
+        FROM (SELECT 1) root
+        {blog_stats("b.folder_id IS NULL")}
+        '''
+    query += " ORDER BY depth, created_at DESC NULLS FIRST"
+
+    rows = db.fetch_all(conn, query, params)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Folder not found")
+
+    nodes = {}
+    for row in rows:
+        nodes[row["id"]] = {
+            "id": row["id"],
+            "name": row["name"],
+            "parent_id": row["parent_id"],
+            "created_at": row["created_at"],
+            "depth": row["depth"],
+            "blog_count": row["blog_count"],
+            "subfolder_count": row["subfolder_count"],
+            "total_blog_count": row["blog_count"],
+            "blogs": serialization.raw_json(row["blogs"]),
+            "children": [],
+        }
+
+    # Qatorlar chuqurlik bo'yicha tartiblangan: teskari yurib, bolalarni ota-onaga yig'amiz
+    for row in reversed(rows[1:]):
+        node = nodes[row["id"]]
+        parent = nodes[node["parent_id"]]
+        parent["children"].insert(0, node)
+        parent["total_blog_count"] += node["total_blog_count"]
+
+    return serialization.json_response(nodes[folder_id])
+
+@app.get("/api/folders/tree", response_model=FolderTreeNode)
+async def get_folder_tree(
+    folder_id: Optional[int] = None,
+    depth: Optional[int] = Query(None, ge=0, le=FOLDER_TREE_MAX_DEPTH),
+    blogs: bool = True,
+    excerpt: bool = False,
+    current_user: str = Depends(get_current_user),
+):
+    return await read_db(_folder_tree, current_user, folder_id, depth, blogs, excerpt)
+
+# To'liq matnli qidiruv (search_vector trigger orqali yangilanadi)
+SEARCH_MAX_PAGE_SIZE = 50
+# ts_headline belgilari: natija HTML-escape qilingandan keyin <mark> bilan almashtiriladi
+_MARK_START = "\x02"
+_MARK_STOP = "\x03"
+_HEADLINE_OPTIONS = f"StartSel={_MARK_START}, StopSel={_MARK_STOP}"
+
+def _highlight(text: Optional[str]) -> str:
+    escaped = html.escape(text or "")
+    return escaped.replace(_MARK_START, "<mark>").replace(_MARK_STOP, "</mark>")
+
+def _search_blogs(conn, current_user: str, q: str, folder_id: Optional[int], limit: int, offset: int):
+    folder_filter = ""
+    params = {"q": q, "author": current_user, "limit": limit + 1, "offset": offset,
+              "title_opts": _HEADLINE_OPTIONS + ", HighlightAll=true",
+              "snippet_opts": _HEADLINE_OPTIONS + ", MaxFragments=2, MaxWords=25, MinWords=10"}
+    if folder_id is not None:
+        # Papka va uning barcha ichki papkalari
+        folder_filter = '''
+            AND b.folder_id IN (
+                WITH RECURSIVE subtree AS (
+                    SELECT id FROM folders WHERE id = %(folder_id)s AND author = %(author)s
+                    UNION ALL
+                    SELECT f.id FROM folders f JOIN subtree s ON f.parent_id = s.id
+                )
+                SELECT id FROM subtree
+            )
+        '''
+        params["folder_id"] = folder_id
+
+    # Avval faqat sahifadagi qatorlar tanlanadi, qimmat ts_headline faqat ular uchun
+    rows = db.fetch_all(conn, f'''
+        WITH query AS (SELECT websearch_to_tsquery('simple', %(q)s) AS q),
+        hits AS (
+            SELECT b.id, b.title, b.folder_id, b.created_at, b.updated_at, b.cells,
+                   ts_rank_cd(b.search_vector, query.q) AS rank
+            FROM blogs b, query
+            WHERE b.search_vector @@ query.q AND b.author = %(author)s {folder_filter}
+            ORDER BY rank DESC, b.id DESC
+            LIMIT %(limit)s OFFSET %(offset)s
+        )
+        SELECT hits.id, hits.title, hits.folder_id, hits.created_at, hits.updated_at, hits.rank,
+               ts_headline('simple', hits.title, query.q, %(title_opts)s) AS title_highlight,
+               ts_headline('simple', blog_search_text(hits.cells), query.q, %(snippet_opts)s) AS snippet
+        FROM hits, query
+        ORDER BY hits.rank DESC, hits.id DESC
+    ''', params)
+
+    items = rows[:limit]
+    for row in items:
+        row["title_highlight"] = _highlight(row["title_highlight"])
+        row["snippet"] = _highlight(row["snippet"])
+    return serialization.json_response({"items": items, "has_more": len(rows) > limit})
+
+@app.get("/api/search", response_model=SearchPage)
+async def search_blogs(
+    q: str = Query(..., min_length=1, max_length=200),
+    folder_id: Optional[int] = None,
+    limit: int = Query(SUMMARY_PAGE_SIZE, ge=1, le=SEARCH_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=1000),
+    current_user: str = Depends(get_current_user),
+):
+    return await read_db(_search_blogs, current_user, q, folder_id, limit, offset)
+
+def _contents_response(folders, blogs):
+    return serialization.json_response({
+        "folders": folders,
+        "blogs": serialization.with_raw_json(blogs, "cells"),
+    })
+
+def _get_folder_contents(conn, folder_id: int, current_user: str):
     cursor = conn.cursor()
 
     # Folder ichidagi papkalar
     cursor.execute(
-        "SELECT * FROM folders WHERE parent_id = %s AND author = %s ORDER BY created_at DESC",
+        SUBFOLDERS_SQL.format(columns=f"{FOLDER_COLUMNS}, 'folder' AS type"),
         (folder_id, current_user)
     )
     subfolders = cursor.fetchall()
 
     # Folder ichidagi bloglar
     cursor.execute(
-        "SELECT * FROM blogs WHERE folder_id = %s AND author = %s ORDER BY created_at DESC",
+        FOLDER_BLOGS_SQL.format(columns=f"{BLOG_COLUMNS}, 'blog' AS type"),
         (folder_id, current_user)
     )
     blogs = cursor.fetchall()
+    conn.commit()
+    return subfolders, blogs
 
-    conn.close()
-    
-    # Format folders
-    formatted_folders = []
-    for folder in subfolders:
-        created = folder.get("created_at")
-        if isinstance(created, datetime):
-            created = created.isoformat()
-
-        formatted_folders.append({
-            "id": folder["id"],
-            "name": folder["name"],
-            "parent_id": folder["parent_id"],
-            "author": folder["author"],
-            "created_at": created,
-            "type": "folder"
-        })
-
-    # Format blogs
-    formatted_blogs = []
-    for blog in blogs:
-        created = blog.get("created_at")
-        updated = blog.get("updated_at")
-        if isinstance(created, datetime):
-            created = created.isoformat()
-        if isinstance(updated, datetime):
-            updated = updated.isoformat()
-
-        formatted_blogs.append({
-            "id": blog["id"],
-            "title": blog["title"],
-            "cells": blog["cells"],
-            "author": blog["author"],
-            "folder_id": blog["folder_id"],
-            "created_at": created,
-            "updated_at": updated,
-            "type": "blog"
-        })
-
-    return {
-        "folders": formatted_folders,
-        "blogs": formatted_blogs
-    }
+# Nested folder structure uchun yangi endpointlar
+@app.get("/api/folders/{folder_id}/contents")
+async def get_folder_contents(folder_id: int, current_user: str = Depends(get_current_user)):
+    subfolders, blogs = await read_db(_get_folder_contents, folder_id, current_user)
+    return _contents_response(subfolders, blogs)
 
-# Root papka contents
-@app.get("/api/root-contents")
-async def get_root_contents(current_user: str = Depends(get_current_user)):
-    conn = safe_get_conn()
+def _get_root_contents(conn, current_user: str):
     cursor = conn.cursor()
 
     # Root papkadagi papkalar (parent_id NULL)
     cursor.execute(
-        "SELECT * FROM folders WHERE parent_id IS NULL AND author = %s ORDER BY created_at DESC",
+        ROOT_FOLDERS_SQL.format(columns=f"{FOLDER_COLUMNS}, 'folder' AS type"),
         (current_user,)
     )
     folders = cursor.fetchall()
 
     # Root papkadagi bloglar (folder_id NULL)
     cursor.execute(
-        "SELECT * FROM blogs WHERE folder_id IS NULL AND author = %s ORDER BY created_at DESC",
+        ROOT_BLOGS_SQL.format(columns=f"{BLOG_COLUMNS}, 'blog' AS type"),
         (current_user,)
     )
     blogs = cursor.fetchall()
+    conn.commit()
+    return folders, blogs
 
-    conn.close()
-    
-    # Format folders
-    formatted_folders = []
-    for folder in folders:
-        created = folder.get("created_at")
-        if isinstance(created, datetime):
-            created = created.isoformat()
-
-        formatted_folders.append({
-            "id": folder["id"],
-            "name": folder["name"],
-            "parent_id": folder["parent_id"],
-            "author": folder["author"],
-            "created_at": created,
-            "type": "folder"
-        })
-
-    # Format blogs
-    formatted_blogs = []
-    for blog in blogs:
-        created = blog.get("created_at")
-        updated = blog.get("updated_at")
-        if isinstance(created, datetime):
-            created = created.isoformat()
-        if isinstance(updated, datetime):
-            updated = updated.isoformat()
-
-        formatted_blogs.append({
-            "id": blog["id"],
-            "title": blog["title"],
-            "cells": blog["cells"],
-            "author": blog["author"],
-            "folder_id": blog["folder_id"],
-            "created_at": created,
-            "updated_at": updated,
-            "type": "blog"
-        })
+# Root papka contents
+@app.get("/api/root-contents")
+async def get_root_contents(current_user: str = Depends(get_current_user)):
+    folders, blogs = await read_db(_get_root_contents, current_user)
+    return _contents_response(folders, blogs)
+
+# Eksport: papka va bloglar NDJSON oqimi sifatida, server-side cursor bilan.
+# Xotira hisob hajmiga bog'liq emas: bir vaqtda faqat EXPORT_FETCH_SIZE qator o'qiladi.
+EXPORT_FETCH_SIZE = int(os.getenv("EXPORT_FETCH_SIZE") or 500)
+# Har bir eksport butun oqim davomida bitta ulanishni band qiladi
+EXPORT_MAX_CONCURRENT = int(os.getenv("EXPORT_MAX_CONCURRENT") or 2)
+_exports_running = 0
+
+def _parse_checkpoint(after: Optional[str]):
+    """'folder:<id>' yoki 'blog:<id>' — oxirgi qabul qilingan yozuv."""
+    if not after:
+        return None, 0
+    kind, _, raw_id = after.partition(":")
+    if kind not in ("folder", "blog") or not raw_id.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid checkpoint, expected folder:<id> or blog:<id>")
+    return kind, int(raw_id)
+
+async def _export_records(current_user: str, checkpoint):
+    global _exports_running
+    if _exports_running >= EXPORT_MAX_CONCURRENT:
+        raise HTTPException(status_code=503, detail="Too many exports running, try again later",
+                            headers={"Retry-After": "10"})
+    _exports_running += 1
+    try:
+        async with db.held_connection(admit=True) as conn:
+            # Papkalar va bloglar bitta snapshot'dan o'qiladi
+            await db.call(conn.cursor().execute, "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            yield b""
+
+            kind, last_id = checkpoint
+            parts = []
+            if kind != "blog":
+                parts.append(("folder", f"SELECT 'folder' AS type, {FOLDER_COLUMNS} FROM folders", last_id))
+            parts.append(("blog", f"SELECT 'blog' AS type, {BLOG_COLUMNS} FROM blogs", last_id if kind == "blog" else 0))
+
+            counts = {}
+            for part, select, after_id in parts:
+                counts[part] = 0
+                cursor = conn.cursor(name=f"export_{part}")
+                await db.call(cursor.execute, select + " WHERE author = %s AND id > %s ORDER BY id",
+                              (current_user, after_id))
+                while True:
+                    rows = await db.call(cursor.fetchmany, EXPORT_FETCH_SIZE)
+                    if not rows:
+                        break
+                    if part == "blog":
+                        serialization.with_raw_json(rows, "cells")
+                    counts[part] += len(rows)
+                    yield serialization.ndjson_lines(rows)
+                await db.call(cursor.close)
+
+            # Oxirgi qator: oqim to'liq tugaganini bildiradi (uzilgan oqimda bo'lmaydi)
+            yield serialization.ndjson_lines([{"type": "end", "folders": counts.get("folder", 0),
+                                               "blogs": counts["blog"]}])
+    finally:
+        _exports_running -= 1
+
+async def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip header
+    async for chunk in chunks:
+        data = await run_in_threadpool(compressor.compress, chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.get("/api/export")
+async def export_account(
+    after: Optional[str] = None,
+    gzip: bool = False,
+    current_user: str = Depends(get_current_user),
+):
+    records = _export_records(current_user, _parse_checkpoint(after))
+    # Ulanish javob boshlanishidan oldin olinadi, shunda xatolar hali status kod bo'lib qaytadi
+    try:
+        await records.__anext__()
+    except (db.ExecutorBusy, db.PoolTimeout) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except db.DatabaseUnavailable as e:
+        raise HTTPException(status_code=500, detail=f"Database connection error: {str(e)}")
 
-    return {
-        "folders": formatted_folders,
-        "blogs": formatted_blogs
-    }
+    filename = "blog-export.ndjson"
+    if gzip:
+        body, media_type, filename = _gzip_chunks(records), "application/gzip", filename + ".gz"
+    else:
+        body, media_type = records, "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# Import: eksport formatidagi NDJSON oqimi, partiyalab (importer.py)
+_imports = {}  # author -> ImportJob, shu worker'dagi davom etayotgan importlar
+
+# Har bir partiya o'z tranzaksiyasida shu job'ni qo'yadi: import xato bilan tugasa ham
+# saqlangan postlar qidiruvga tushadi. Kichik bo'laklarda, har biri alohida commit
+@jobs.handler(importer.BACKFILL_JOB, concurrency=1)
+def _search_backfill_job(conn, payload: dict):
+    while importer.backfill_search_vectors(conn, payload["author"]) == importer.BACKFILL_BATCH_SIZE:
+        pass
+
+@app.post("/api/import")
+async def import_account(request: Request, current_user: str = Depends(get_current_user)):
+    if current_user in _imports:
+        raise HTTPException(status_code=409, detail="An import is already running for this account")
+    job = importer.ImportJob(current_user)
+    _imports[current_user] = job
+    try:
+        chunks = request.stream()
+        if request.headers.get("content-encoding") == "gzip" or \
+                request.headers.get("content-type") == "application/gzip":
+            chunks = importer.gunzip(chunks)
+
+        # Qatorlar event loop'da faqat bo'linadi; parse va INSERT DB thread'ida.
+        # db.run: import boshlangan, partiyalar yuklama ostida rad etilmaydi, navbat kutadi
+        batch, batch_bytes = [], 0
+        async for line_no, line in importer.iter_lines(chunks):
+            batch.append((line_no, line))
+            batch_bytes += len(line)
+            if len(batch) >= importer.BATCH_SIZE or batch_bytes >= importer.BATCH_MAX_BYTES:
+                await db.run(job.write_batch, batch)
+                batch, batch_bytes = [], 0
+        if batch:
+            await db.run(job.write_batch, batch)
+        await db.run(job.finish)
+    except importer.RecordTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except zlib.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid gzip body: {e}")
+    finally:
+        del _imports[current_user]
+    return serialization.json_response(job.stats())
+
+@app.get("/api/import/progress")
+async def get_import_progress(current_user: str = Depends(get_current_user)):
+    job = _imports.get(current_user)
+    if job is None:
+        return {"running": False}
+    return serialization.json_response({"running": True, **job.stats()})
 
 if __name__ == "__main__":
+    # Ishlab chiqish uchun bitta jarayon; production: python serve.py (README)
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,334 @@
+import base64
+import binascii
+import hashlib
+import io
+import os
+import re
+import tempfile
+
+try:
+    from PIL import Image, ImageOps, UnidentifiedImageError
+except ImportError:  # optional
+    Image = None
+
+MEDIA_ROOT = os.path.abspath(os.getenv("MEDIA_ROOT") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "media"))
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES") or 50 * 1024 * 1024)
+CHUNK_SIZE = 1024 * 1024
+
+# Resized copies of uploaded images (see generate_variants)
+VARIANT_WIDTHS = sorted({int(width) for width in (os.getenv("MEDIA_VARIANT_WIDTHS") or "320,640,1280").split(",") if width.strip()})
+THUMBNAIL_SIZE = int(os.getenv("MEDIA_THUMBNAIL_SIZE") or 256)
+WEBP_QUALITY = int(os.getenv("MEDIA_WEBP_QUALITY") or 80)
+JPEG_QUALITY = int(os.getenv("MEDIA_JPEG_QUALITY") or 82)
+# Larger images are not decoded at all (decompression bombs)
+MAX_IMAGE_PIXELS = int(os.getenv("MEDIA_MAX_PIXELS") or 50_000_000)
+VARIANT_SOURCE_TYPES = ("image/jpeg", "image/png", "image/webp", "image/gif", "image/bmp", "image/tiff")
+
+# Media is served from the API's origin, so only types a browser will not run as a page are accepted:
+# images and video, but not SVG (it can carry scripts)
+BLOCKED_TYPES = ("image/svg+xml",)
+
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+DATA_URL_RE = re.compile(r"^data:(?P<type>[\w.+-]+/[\w.+-]+)?(?:;[\w-]+=[^;,]*)*;base64,", re.IGNORECASE)
+
+
+class MediaTooLarge(Exception):
+    pass
+
+
+def is_valid_sha256(value: str) -> bool:
+    return bool(SHA256_RE.match(value))
+
+
+def normalize_type(content_type) -> str:
+    """'Image/PNG; charset=x' -> 'image/png'."""
+    return str(content_type or "").split(";", 1)[0].strip().lower()
+
+
+def is_allowed_type(content_type) -> bool:
+    content_type = normalize_type(content_type)
+    return content_type.startswith(("image/", "video/")) and content_type not in BLOCKED_TYPES
+
+
+def blob_path(sha256: str) -> str:
+    # media/ab/cd/abcd... — bitta papkada juda ko'p fayl bo'lmasligi uchun
+    return os.path.join(MEDIA_ROOT, sha256[:2], sha256[2:4], sha256)
+
+
+def media_url(sha256: str) -> str:
+    return f"/api/media/{sha256}"
+
+
+class BlobWriter:
+    """Streams a blob to a temp file while hashing it, then moves it into
+    its content-addressed location. Identical content is stored once."""
+
+    def __init__(self, max_bytes: int = MEDIA_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        tmp_dir = os.path.join(MEDIA_ROOT, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise MediaTooLarge(f"File is larger than {self.max_bytes} bytes")
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self):
+        self._file.close()
+        sha256 = self._hash.hexdigest()
+        path = blob_path(sha256)
+        if os.path.exists(path):
+            os.remove(self._tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._tmp_path, path)
+        return sha256, self.size
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def store_bytes(data: bytes):
+    writer = BlobWriter(max_bytes=max(MEDIA_MAX_BYTES, len(data)))
+    try:
+        for start in range(0, len(data), CHUNK_SIZE):
+            writer.write(data[start:start + CHUNK_SIZE])
+        return writer.commit()
+    except Exception:
+        writer.abort()
+        raise
+
+
+def decode_data_url(value: str):
+    """Returns (content_type, bytes) for a base64 data URL, or None."""
+    if not isinstance(value, str):
+        return None
+    match = DATA_URL_RE.match(value)
+    if not match:
+        return None
+    try:
+        data = base64.b64decode(value[match.end():], validate=False)
+    except (binascii.Error, ValueError):
+        return None
+    return (match.group("type") or "application/octet-stream"), data
+
+
+def has_embedded_media(cells) -> bool:
+    for cell in cells:
+        if cell.get("type") != "media" or not isinstance(cell.get("content"), list):
+            continue
+        for item in cell["content"]:
+            if isinstance(item, dict) and isinstance(item.get("data"), str) and item["data"].startswith("data:"):
+                return True
+    return False
+
+
+def externalize_cells(cells):
+    """Moves base64 data URLs out of media cells into the blob store.
+
+    Returns (cells, stored) where cells hold only references
+    ({sha256, url, ...}) and stored is a list of (sha256, content_type, size)
+    that still has to be recorded in the media table. Items of a type that is
+    not allowed (is_allowed_type) stay inline and are never served by the API.
+    """
+    stored = []
+    result = []
+    for cell in cells:
+        if cell.get("type") != "media" or not isinstance(cell.get("content"), list):
+            result.append(cell)
+            continue
+
+        items = []
+        for item in cell["content"]:
+            decoded = decode_data_url(item.get("data")) if isinstance(item, dict) else None
+            if decoded is None:
+                items.append(item)
+                continue
+
+            content_type, data = decoded
+            content_type = normalize_type(item.get("type") or content_type)
+            if not is_allowed_type(content_type):
+                items.append(item)
+                continue
+            sha256, size = store_bytes(data)
+            stored.append((sha256, content_type, size))
+
+            reference = {key: value for key, value in item.items() if key != "data"}
+            reference.update({
+                "type": content_type,
+                "size": size,
+                "sha256": sha256,
+                "url": media_url(sha256),
+            })
+            items.append(reference)
+
+        result.append({**cell, "content": items})
+    return result, stored
+
+
+def register_media(cursor, stored, uploaded_by):
+    for sha256, content_type, size in stored:
+        cursor.execute(
+            "INSERT INTO media (sha256, content_type, size, uploaded_by) VALUES (%s, %s, %s, %s) "
+            "ON CONFLICT (sha256) DO NOTHING",
+            (sha256, content_type, size, uploaded_by)
+        )
+
+
+# Image variants
+#
+# For every stored image a background job (media_variants in main.py) keeps
+# a square thumbnail and copies at VARIANT_WIDTHS narrower than the original,
+# each as WebP and as JPEG (PNG when the image has transparency) for clients
+# without WebP. Variants are ordinary content-addressed blobs listed in the
+# media_variants table under their source; the "original" row records the
+# source's own size and marks it as processed, also when it could not be
+# decoded. Media cell items then carry "width", "height", "thumbnail" and
+# "variants" next to the original "url" (see apply_variants).
+
+def variants_supported() -> bool:
+    return Image is not None
+
+
+def image_sources(cells):
+    """sha256 of the image items that have no variants yet, in order, without repeats."""
+    sources = {}
+    for cell in cells:
+        if cell.get("type") != "media" or not isinstance(cell.get("content"), list):
+            continue
+        for item in cell["content"]:
+            if (isinstance(item, dict) and isinstance(item.get("sha256"), str) and is_valid_sha256(item["sha256"])
+                    and "variants" not in item and item.get("type") in VARIANT_SOURCE_TYPES):
+                sources.setdefault(item["sha256"], None)
+    return list(sources)
+
+
+def needs_variants(cells) -> bool:
+    return Image is not None and bool(image_sources(cells))
+
+
+def _encode(image, content_type):
+    buffer = io.BytesIO()
+    if content_type == "image/webp":
+        image.save(buffer, "WEBP", quality=WEBP_QUALITY, method=4)
+    elif content_type == "image/png":
+        image.save(buffer, "PNG", optimize=True)
+    else:
+        image.convert("RGB").save(buffer, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def generate_variants(sha256):
+    """Decodes the stored image and stores its variants in the blob store.
+
+    Returns [(name, variant sha256, content_type, width, height, size)],
+    starting with ("original", sha256, None, width, height, None), or [] if
+    the blob is not an image Pillow can decode.
+    """
+    if Image is None:
+        return []
+    try:
+        with Image.open(blob_path(sha256)) as source:
+            if source.width * source.height > MAX_IMAGE_PIXELS:
+                return []
+            # Animated images keep their original only
+            if getattr(source, "is_animated", False):
+                return [("original", sha256, None, source.width, source.height, None)]
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError, FileNotFoundError):
+        return []
+
+    alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if alpha else "RGB")
+    fallback = "image/png" if alpha else "image/jpeg"
+    extension = {"image/png": "png", "image/jpeg": "jpeg", "image/webp": "webp"}
+
+    sized = [("thumb", ImageOps.fit(image, (THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.Resampling.LANCZOS))]
+    for width in VARIANT_WIDTHS:
+        if width < image.width:
+            height = max(1, round(image.height * width / image.width))
+            sized.append((f"w{width}", image.resize((width, height), Image.Resampling.LANCZOS)))
+
+    result = [("original", sha256, None, image.width, image.height, None)]
+    for name, resized in sized:
+        for content_type in ("image/webp", fallback):
+            variant_sha256, size = store_bytes(_encode(resized, content_type))
+            result.append((f"{name}.{extension[content_type]}", variant_sha256, content_type,
+                           resized.width, resized.height, size))
+    return result
+
+
+def store_variants(cursor, source, variants, uploaded_by):
+    """Records generated variants (and their blobs in the media table); an empty list marks source as not an image."""
+    register_media(cursor, [(sha256, content_type, size) for name, sha256, content_type, _, _, size in variants
+                            if name != "original"], uploaded_by)
+    rows = variants or [("original", source, None, None, None, None)]
+    for name, sha256, content_type, width, height, size in rows:
+        cursor.execute(
+            "INSERT INTO media_variants (source_sha256, name, sha256, content_type, width, height, size) "
+            "VALUES (%s, %s, %s, %s, %s, %s, %s) ON CONFLICT (source_sha256, name) DO NOTHING",
+            (source, name, sha256, content_type, width, height, size)
+        )
+
+
+def load_variants(cursor, sources):
+    """{source sha256: rows} for the sources that have been processed."""
+    if not sources:
+        return {}
+    cursor.execute(
+        "SELECT source_sha256, name, sha256, content_type, width, height FROM media_variants "
+        "WHERE source_sha256 = ANY(%s) ORDER BY source_sha256, width, name",
+        (list(sources),)
+    )
+    result = {}
+    for row in cursor.fetchall():
+        result.setdefault(row["source_sha256"], []).append(row)
+    return result
+
+
+def _variant_reference(row):
+    return {"url": media_url(row["sha256"]), "sha256": row["sha256"], "type": row["content_type"],
+            "width": row["width"], "height": row["height"]}
+
+
+def apply_variants(cells, variants):
+    """Adds width, height, thumbnail and variants to image items with processed sources.
+
+    Returns (cells, changed). Items of sources that could not be decoded get
+    an empty variants list, so they are not queued again.
+    """
+    changed = False
+    result = []
+    for cell in cells:
+        if cell.get("type") != "media" or not isinstance(cell.get("content"), list):
+            result.append(cell)
+            continue
+        items = []
+        for item in cell["content"]:
+            rows = variants.get(item.get("sha256")) if isinstance(item, dict) and "variants" not in item else None
+            if rows is None:
+                items.append(item)
+                continue
+            item = dict(item)
+            original = next((row for row in rows if row["name"] == "original"), None)
+            if original is not None and original["width"]:
+                item["width"], item["height"] = original["width"], original["height"]
+            thumbnails = [row for row in rows if row["name"].startswith("thumb.")]
+            if thumbnails:
+                item["thumbnail"] = [_variant_reference(row) for row in thumbnails]
+            item["variants"] = [_variant_reference(row) for row in rows if row["name"].startswith("w")]
+            items.append(item)
+            changed = True
+        result.append({**cell, "content": items})
+    return result, changed
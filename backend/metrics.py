@@ -0,0 +1,270 @@
+"""Request and database metrics, exposed in Prometheus text format.
+
+MetricsMiddleware starts a RequestTiming for every HTTP request and keeps it
+in a context variable. The database layer (db.TimedCursor, db.AsyncExecutor)
+and serialization.dumps add to it from whatever thread they run on: the DB
+executor copies the request context into its threads. At the end of the
+request the totals go into the histograms below, and the response carries
+them as a Server-Timing header (db, db-wait, serialize, app), which browser
+devtools show per request.
+
+Routes are labelled by their path template (/api/blogs/{blog_id}), never by
+the raw URL, so the number of series stays bounded.
+"""
+import contextvars
+import threading
+import time
+
+from starlette.datastructures import MutableHeaders
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+_registry = []
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_series(key, value) for key, value in items)
+        return "\n".join(lines)
+
+    def _render_series(self, key, value):
+        return f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def _render_series(self, key, series):
+        counts, total, count = series
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labels, key, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', '+Inf')])} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return "\n".join(lines)
+
+
+def render():
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time from request start to the last response byte.",
+    ("method", "route", "status"))
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled.")
+RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "Response body size as sent (after compression).",
+    ("method", "route"), SIZE_BUCKETS)
+DB_ACQUIRE = Histogram(
+    "db_connection_acquire_seconds", "Wait for a DB thread slot and a pooled connection.", ("route",))
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Time per statement (execute, or fetch on server-side cursors).",
+    ("route", "statement"))
+DB_QUERY_ROWS = Histogram(
+    "db_query_rows", "Rows returned or affected per statement.", ("route", "statement"), ROW_BUCKETS)
+SERIALIZE_DURATION = Histogram(
+    "response_serialize_seconds", "Time spent encoding JSON per request.", ("route",))
+DB_REJECTED = Counter(
+    "db_executor_rejected_total", "Request queries shed instead of queued for a DB slot.", ("reason",))
+
+# Filled in from the pool, executor and cache when /metrics is scraped
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "Pooled connections by state.", ("state",))
+DB_EXECUTOR_TASKS = Gauge("db_executor_tasks", "DB executor calls by state.", ("state",))
+BLOG_CACHE = Gauge("blog_cache", "Blog response cache counters.", ("stat",))
+
+
+# Per-request timing
+
+class RequestTiming:
+    __slots__ = ("scope", "started", "db", "db_wait", "queries", "serialize", "_lock")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.started = time.perf_counter()
+        self.db = 0.0
+        self.db_wait = 0.0
+        self.queries = 0
+        self.serialize = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def route(self):
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+    def add(self, field, seconds):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + seconds)
+
+    def server_timing(self):
+        total = time.perf_counter() - self.started
+        return (f'db;dur={self.db * 1000:.2f};desc="{self.queries} queries", '
+                f"db-wait;dur={self.db_wait * 1000:.2f}, "
+                f"serialize;dur={self.serialize * 1000:.2f}, "
+                f"app;dur={total * 1000:.2f}")
+
+
+_current = contextvars.ContextVar("request_timing", default=None)
+
+
+def current():
+    return _current.get()
+
+
+def _route():
+    timing = _current.get()
+    return timing.route if timing is not None else "none"
+
+
+def _statement(query):
+    """First keyword of a statement, as a low-cardinality label."""
+    if isinstance(query, bytes):
+        query = query[:32].decode("utf-8", "replace")
+    elif not isinstance(query, str):
+        return "other"
+    words = query.lstrip(" \n\t(").split(None, 1)
+    keyword = words[0].upper() if words else ""
+    return keyword if keyword in ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "FETCH", "DECLARE") else "other"
+
+
+def record_db_acquire(seconds):
+    timing = _current.get()
+    if timing is not None:
+        timing.add("db_wait", seconds)
+    DB_ACQUIRE.observe(seconds, route=_route())
+
+
+def record_query(query, seconds, rows):
+    timing = _current.get()
+    route = "none"
+    if timing is not None:
+        route = timing.route
+        timing.add("db", seconds)
+        timing.add("queries", 1)
+    statement = _statement(query)
+    DB_QUERY_DURATION.observe(seconds, route=route, statement=statement)
+    DB_QUERY_ROWS.observe(max(rows, 0), route=route, statement=statement)
+
+
+def record_serialize(seconds):
+    timing = _current.get()
+    if timing is not None:
+        timing.add("serialize", seconds)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming(scope)
+        token = _current.set(timing)
+        status = 500
+        size = 0
+
+        async def send_with_timing(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                MutableHeaders(scope=message).append("Server-Timing", timing.server_timing())
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            _current.reset(token)
+            route = timing.route
+            REQUEST_DURATION.observe(time.perf_counter() - timing.started,
+                                     method=scope["method"], route=route, status=str(status))
+            RESPONSE_SIZE.observe(size, method=scope["method"], route=route)
+            if timing.serialize:
+                SERIALIZE_DURATION.observe(timing.serialize, route=route)
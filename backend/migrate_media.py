@@ -0,0 +1,71 @@
+"""Moves base64 media embedded in blogs.cells into the media blob store.
+
+Safe to run more than once: blogs that only hold references are skipped and
+identical files are stored once. Migrated blogs get their image variants and
+HTML rebuilt by the API's job worker, as after a save.
+
+    cd backend
+    python migrate_media.py            # migrate everything
+    python migrate_media.py --dry-run  # only report what would change
+"""
+import argparse
+import json
+
+from dotenv import load_dotenv
+import psycopg2
+
+load_dotenv()
+
+import db
+import jobs
+import media
+
+
+def migrate(dry_run=False, batch_size=50):
+    conn = psycopg2.connect(**db.connection_kwargs())
+    cursor = conn.cursor()
+
+    cursor.execute(
+        "SELECT id FROM blogs WHERE jsonb_path_exists(cells, '$[*] ? (@.type == \"media\").content[*].data ? (@ starts with \"data:\")') ORDER BY id"
+    )
+    blog_ids = [row["id"] for row in cursor.fetchall()]
+    print(f"{len(blog_ids)} blogs with embedded media")
+    if dry_run:
+        conn.close()
+        return
+
+    migrated = 0
+    files = 0
+    bytes_moved = 0
+    for blog_id in blog_ids:
+        cursor.execute("SELECT cells, author FROM blogs WHERE id = %s FOR UPDATE", (blog_id,))
+        row = cursor.fetchone()
+        if not row:
+            continue
+
+        cells, stored = media.externalize_cells(row["cells"])
+        media.register_media(cursor, stored, row["author"])
+        # Stored HTML still embeds the data URLs: rebuild it as a save does, variants first
+        cursor.execute("UPDATE blogs SET cells = %s::jsonb, html_version = NULL WHERE id = %s",
+                       (json.dumps(cells), blog_id))
+        job_type = "media_variants" if media.needs_variants(cells) else "render_blog"
+        jobs.enqueue(cursor, job_type, {"blog_id": blog_id}, key=str(blog_id))
+
+        migrated += 1
+        files += len(stored)
+        bytes_moved += sum(size for _, _, size in stored)
+        if migrated % batch_size == 0:
+            conn.commit()
+            print(f"  {migrated}/{len(blog_ids)} blogs migrated")
+
+    conn.commit()
+    conn.close()
+    print(f"Done: {migrated} blogs, {files} files, {bytes_moved / 1024 / 1024:.1f} MB moved to {media.MEDIA_ROOT}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract embedded base64 media from blog cells")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+    migrate(dry_run=args.dry_run, batch_size=args.batch_size)
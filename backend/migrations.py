@@ -0,0 +1,449 @@
+"""Versioned schema migrations.
+
+Each migration runs once, in its own transaction, and is recorded in the
+schema_migrations table. Add new migrations to the end of MIGRATIONS with
+the next version number; never edit one that has already been released.
+The first migrations use IF NOT EXISTS so databases created by the old
+init_db() are adopted without changes.
+
+Every API worker calls migrate() on startup. When the schema is current it
+only reads schema_migrations; otherwise the work runs under a session-level
+advisory lock, so one process applies the migrations while the others wait
+and then find nothing left to do, instead of racing on the same DDL. The
+lock belongs to the connection: run migrate() on a connection that is closed
+afterwards, not on a pooled one.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+# pg_advisory_lock key, the same in every process ("blogmigr" in ASCII)
+LOCK_ID = 0x626C6F676D696772
+
+MIGRATIONS = [
+    (1, "initial schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS folders (
+            id SERIAL PRIMARY KEY,
+            name TEXT NOT NULL,
+            parent_id INTEGER REFERENCES folders(id) ON DELETE CASCADE,
+            author TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS blogs (
+            id SERIAL PRIMARY KEY,
+            title TEXT NOT NULL,
+            cells JSONB NOT NULL,
+            author TEXT NOT NULL,
+            folder_id INTEGER REFERENCES folders(id) ON DELETE SET NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (2, "blogs.folder_id for databases created before folders", [
+        "ALTER TABLE blogs ADD COLUMN IF NOT EXISTS folder_id INTEGER REFERENCES folders(id) ON DELETE SET NULL",
+    ]),
+    (3, "media blob store", [
+        '''
+        CREATE TABLE IF NOT EXISTS media (
+            sha256 TEXT PRIMARY KEY,
+            content_type TEXT NOT NULL,
+            size BIGINT NOT NULL,
+            uploaded_by TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    ]),
+    (4, "indexes for listing queries", [
+        # /api/blogs, /api/my-blogs, /api/my-blogs/summary
+        "CREATE INDEX IF NOT EXISTS blogs_author_created_idx ON blogs (author, created_at DESC, id DESC)",
+        # /api/folders/{id}/blogs, folder contents (folder_id = X)
+        "CREATE INDEX IF NOT EXISTS blogs_author_folder_created_idx ON blogs (author, folder_id, created_at DESC, id DESC)",
+        # /api/root-blogs, root contents. IS NULL is not an equality for ordering,
+        # so root listings get their own partial index.
+        "CREATE INDEX IF NOT EXISTS blogs_author_root_created_idx ON blogs (author, created_at DESC, id DESC) WHERE folder_id IS NULL",
+        # /api/folders
+        "CREATE INDEX IF NOT EXISTS folders_author_created_idx ON folders (author, created_at DESC)",
+        # Folder contents subfolders (parent_id = X)
+        "CREATE INDEX IF NOT EXISTS folders_author_parent_created_idx ON folders (author, parent_id, created_at DESC)",
+        # Root contents folders
+        "CREATE INDEX IF NOT EXISTS folders_author_root_created_idx ON folders (author, created_at DESC) WHERE parent_id IS NULL",
+        # Foreign keys: ON DELETE CASCADE / SET NULL look rows up by these columns
+        "CREATE INDEX IF NOT EXISTS blogs_folder_id_idx ON blogs (folder_id)",
+        "CREATE INDEX IF NOT EXISTS folders_parent_id_idx ON folders (parent_id)",
+    ]),
+    (5, "cell-level patch functions", [
+        # Index of the cell with the given id, or NULL
+        '''
+        CREATE OR REPLACE FUNCTION blog_cell_position(cells jsonb, cell_id jsonb) RETURNS integer
+        LANGUAGE sql IMMUTABLE AS $$
+            SELECT (e.ord - 1)::integer
+            FROM jsonb_array_elements(cells) WITH ORDINALITY AS e(cell, ord)
+            WHERE e.cell->'id' = cell_id
+            LIMIT 1
+        $$
+        ''',
+        # Inserts cell after the cell with id after_id (JSON null = at the start)
+        '''
+        CREATE OR REPLACE FUNCTION blog_cell_insert_after(cells jsonb, cell jsonb, after_id jsonb) RETURNS jsonb
+        LANGUAGE plpgsql IMMUTABLE AS $$
+        DECLARE
+            pos integer;
+        BEGIN
+            IF after_id IS NULL OR after_id = 'null'::jsonb THEN
+                RETURN jsonb_insert(cells, '{0}', cell);
+            END IF;
+            pos := blog_cell_position(cells, after_id);
+            IF pos IS NULL THEN
+                RAISE EXCEPTION 'Cell % not found', after_id USING ERRCODE = 'no_data_found';
+            END IF;
+            RETURN jsonb_insert(cells, ARRAY[pos::text], cell, true);
+        END
+        $$
+        ''',
+        # Applies a list of {op, id, cell, after_id} operations in order
+        '''
+        CREATE OR REPLACE FUNCTION blog_cells_apply(cells jsonb, ops jsonb) RETURNS jsonb
+        LANGUAGE plpgsql IMMUTABLE AS $$
+        DECLARE
+            op jsonb;
+            pos integer;
+            moved jsonb;
+        BEGIN
+            FOR op IN SELECT value FROM jsonb_array_elements(ops) LOOP
+                IF op->>'op' = 'insert' THEN
+                    IF blog_cell_position(cells, op->'cell'->'id') IS NOT NULL THEN
+                        RAISE EXCEPTION 'Cell % already exists', op->'cell'->'id' USING ERRCODE = 'unique_violation';
+                    END IF;
+                    cells := blog_cell_insert_after(cells, op->'cell', op->'after_id');
+                    CONTINUE;
+                END IF;
+
+                pos := blog_cell_position(cells, op->'id');
+                IF pos IS NULL THEN
+                    RAISE EXCEPTION 'Cell % not found', op->'id' USING ERRCODE = 'no_data_found';
+                END IF;
+
+                IF op->>'op' = 'replace' THEN
+                    cells := jsonb_set(cells, ARRAY[pos::text], op->'cell');
+                ELSIF op->>'op' = 'delete' THEN
+                    cells := cells - pos;
+                ELSIF op->>'op' = 'move' THEN
+                    moved := cells->pos;
+                    cells := blog_cell_insert_after(cells - pos, moved, op->'after_id');
+                ELSE
+                    RAISE EXCEPTION 'Unknown cell operation %', op->>'op' USING ERRCODE = 'invalid_parameter_value';
+                END IF;
+            END LOOP;
+            RETURN cells;
+        END
+        $$
+        ''',
+    ]),
+    (6, "full-text search over titles and text/code cells", [
+        # Plain text of the text and code cells, also used for search snippets
+        '''
+        CREATE OR REPLACE FUNCTION blog_search_text(cells jsonb) RETURNS text
+        LANGUAGE sql IMMUTABLE AS $$
+            SELECT coalesce(string_agg(c->>'content', ' '), '')
+            FROM jsonb_array_elements(cells) c
+            WHERE c->>'type' IN ('text', 'code') AND jsonb_typeof(c->'content') = 'string'
+        $$
+        ''',
+        # 'simple' config: posts are written in several languages, so no stemming
+        '''
+        CREATE OR REPLACE FUNCTION blog_search_document(title text, cells jsonb) RETURNS tsvector
+        LANGUAGE sql IMMUTABLE AS $$
+            SELECT setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+                || setweight(to_tsvector('simple', blog_search_text(cells)), 'B')
+        $$
+        ''',
+        "ALTER TABLE blogs ADD COLUMN IF NOT EXISTS search_vector tsvector",
+        # Recomputed only for the row being written, and only when title or cells change
+        '''
+        CREATE OR REPLACE FUNCTION blogs_search_vector_update() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            NEW.search_vector := blog_search_document(NEW.title, NEW.cells);
+            RETURN NEW;
+        END
+        $$
+        ''',
+        "DROP TRIGGER IF EXISTS blogs_search_vector_trigger ON blogs",
+        '''
+        CREATE TRIGGER blogs_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF title, cells ON blogs
+        FOR EACH ROW EXECUTE FUNCTION blogs_search_vector_update()
+        ''',
+        "UPDATE blogs SET search_vector = blog_search_document(title, cells) WHERE search_vector IS NULL",
+        "CREATE INDEX IF NOT EXISTS blogs_search_vector_idx ON blogs USING GIN (search_vector)",
+    ]),
+    (7, "indexes for streaming export", [
+        # /api/export walks each author's rows in id order so it can resume from a checkpoint
+        "CREATE INDEX IF NOT EXISTS blogs_author_id_idx ON blogs (author, id)",
+        "CREATE INDEX IF NOT EXISTS folders_author_id_idx ON folders (author, id)",
+    ]),
+    (8, "deferred search vectors for bulk imports", [
+        # Bulk imports set blogs.defer_search_vector for their transactions and
+        # fill search_vector in afterwards (see importer.backfill_search_vectors)
+        '''
+        CREATE OR REPLACE FUNCTION blogs_search_vector_update() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF current_setting('blogs.defer_search_vector', true) = 'on' THEN
+                NEW.search_vector := NULL;
+            ELSE
+                NEW.search_vector := blog_search_document(NEW.title, NEW.cells);
+            END IF;
+            RETURN NEW;
+        END
+        $$
+        ''',
+        "CREATE INDEX IF NOT EXISTS blogs_search_vector_missing_idx ON blogs (author) WHERE search_vector IS NULL",
+    ]),
+    (9, "pre-rendered cell HTML", [
+        # [{"id", "hash", "html"}] per cell, see render.py; NULL until first rendered
+        "ALTER TABLE blogs ADD COLUMN IF NOT EXISTS html_cells JSONB",
+        "ALTER TABLE blogs ADD COLUMN IF NOT EXISTS html_version INTEGER",
+    ]),
+    (10, "blog revision history", [
+        # Each row is either a full snapshot of the cells or the ops from the
+        # previous revision (see revisions.py); size is the stored JSON in bytes
+        '''
+        CREATE TABLE IF NOT EXISTS blog_revisions (
+            blog_id INTEGER NOT NULL REFERENCES blogs(id) ON DELETE CASCADE,
+            revision INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            snapshot JSONB,
+            delta JSONB,
+            author TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (blog_id, revision),
+            CHECK ((snapshot IS NULL) <> (delta IS NULL))
+        )
+        ''',
+        # Cells of a revision: its nearest snapshot with the deltas after it applied in order
+        '''
+        CREATE OR REPLACE FUNCTION blog_revision_cells(p_blog_id integer, p_revision integer) RETURNS jsonb
+        LANGUAGE plpgsql STABLE AS $$
+        DECLARE
+            base integer;
+            result jsonb;
+            step jsonb;
+        BEGIN
+            SELECT revision, snapshot INTO base, result
+            FROM blog_revisions
+            WHERE blog_id = p_blog_id AND revision <= p_revision AND snapshot IS NOT NULL
+            ORDER BY revision DESC
+            LIMIT 1;
+            IF base IS NULL THEN
+                RETURN NULL;
+            END IF;
+            FOR step IN
+                SELECT delta FROM blog_revisions
+                WHERE blog_id = p_blog_id AND revision > base AND revision <= p_revision
+                ORDER BY revision
+            LOOP
+                result := blog_cells_apply(result, step);
+            END LOOP;
+            RETURN result;
+        END
+        $$
+        ''',
+    ]),
+    (11, "background job queue", [
+        # See jobs.py. status: queued -> running -> done | failed | superseded
+        '''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id BIGSERIAL PRIMARY KEY,
+            type TEXT NOT NULL,
+            payload JSONB NOT NULL DEFAULT '{}',
+            idempotency_key TEXT,
+            status TEXT NOT NULL DEFAULT 'queued'
+                CHECK (status IN ('queued', 'running', 'done', 'failed', 'superseded')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            run_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            locked_at TIMESTAMPTZ,
+            locked_by TEXT,
+            last_error TEXT,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            finished_at TIMESTAMPTZ
+        )
+        ''',
+        # Claims walk only the queued jobs of one type in run_at order
+        "CREATE INDEX IF NOT EXISTS jobs_queued_idx ON jobs (type, run_at, id) WHERE status = 'queued'",
+        # At most one queued job per key (enqueue coalesces into it); also used for the running-twin check
+        '''
+        CREATE UNIQUE INDEX IF NOT EXISTS jobs_queued_key_idx ON jobs (type, idempotency_key)
+        WHERE status = 'queued'
+        ''',
+        "CREATE INDEX IF NOT EXISTS jobs_running_idx ON jobs (type, idempotency_key) WHERE status = 'running'",
+        "CREATE INDEX IF NOT EXISTS jobs_finished_idx ON jobs (finished_at) WHERE status IN ('done', 'superseded')",
+    ]),
+    (12, "image variants", [
+        # Thumbnails and resized copies of images (media.generate_variants); the
+        # "original" row holds the source's own size and marks it as processed
+        '''
+        CREATE TABLE IF NOT EXISTS media_variants (
+            source_sha256 TEXT NOT NULL,
+            name TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            content_type TEXT,
+            width INTEGER,
+            height INTEGER,
+            size BIGINT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (source_sha256, name)
+        )
+        ''',
+    ]),
+    (13, "reject cell replaces that duplicate an id", [
+        # Same as in migration 5, except that a replace whose new cell takes the
+        # id of another cell fails like an insert of an existing id. A replace
+        # that renames to an unused id still applies, so revisions stored
+        # before this keep rebuilding; the API no longer sends those.
+        '''
+        CREATE OR REPLACE FUNCTION blog_cells_apply(cells jsonb, ops jsonb) RETURNS jsonb
+        LANGUAGE plpgsql IMMUTABLE AS $$
+        DECLARE
+            op jsonb;
+            pos integer;
+            moved jsonb;
+        BEGIN
+            FOR op IN SELECT value FROM jsonb_array_elements(ops) LOOP
+                IF op->>'op' = 'insert' THEN
+                    IF blog_cell_position(cells, op->'cell'->'id') IS NOT NULL THEN
+                        RAISE EXCEPTION 'Cell % already exists', op->'cell'->'id' USING ERRCODE = 'unique_violation';
+                    END IF;
+                    cells := blog_cell_insert_after(cells, op->'cell', op->'after_id');
+                    CONTINUE;
+                END IF;
+
+                pos := blog_cell_position(cells, op->'id');
+                IF pos IS NULL THEN
+                    RAISE EXCEPTION 'Cell % not found', op->'id' USING ERRCODE = 'no_data_found';
+                END IF;
+
+                IF op->>'op' = 'replace' THEN
+                    IF op->'cell'->'id' IS DISTINCT FROM op->'id'
+                            AND blog_cell_position(cells, op->'cell'->'id') IS NOT NULL THEN
+                        RAISE EXCEPTION 'Cell % already exists', op->'cell'->'id' USING ERRCODE = 'unique_violation';
+                    END IF;
+                    cells := jsonb_set(cells, ARRAY[pos::text], op->'cell');
+                ELSIF op->>'op' = 'delete' THEN
+                    cells := cells - pos;
+                ELSIF op->>'op' = 'move' THEN
+                    moved := cells->pos;
+                    cells := blog_cell_insert_after(cells - pos, moved, op->'after_id');
+                ELSE
+                    RAISE EXCEPTION 'Unknown cell operation %', op->>'op' USING ERRCODE = 'invalid_parameter_value';
+                END IF;
+            END LOOP;
+            RETURN cells;
+        END
+        $$
+        ''',
+    ]),
+]
+
+
+def applied_versions(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row["version"] for row in cursor.fetchall()}
+
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def pending_versions(cursor):
+    """Versions not applied yet, without creating anything (no DDL, no lock)."""
+    cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL AS present")
+    if not cursor.fetchone()["present"]:
+        return [version for version, _, _ in MIGRATIONS]
+    cursor.execute("SELECT version FROM schema_migrations")
+    done = {row["version"] for row in cursor.fetchall()}
+    return [version for version, _, _ in MIGRATIONS if version not in done]
+
+
+def migrate(conn):
+    """Applies pending migrations in order. Returns the list of applied versions."""
+    cursor = conn.cursor()
+    pending = pending_versions(cursor)
+    conn.commit()
+    if not pending:
+        return []
+
+    cursor.execute("SELECT pg_advisory_lock(%s)", (LOCK_ID,))
+    conn.commit()
+    try:
+        # Another process may have applied them while this one waited for the lock
+        done = applied_versions(cursor)
+        conn.commit()
+
+        applied = []
+        for version, name, statements in MIGRATIONS:
+            if version in done:
+                continue
+            logger.info("Applying migration %s: %s", version, name)
+            try:
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (version, name)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            applied.append(version)
+        return applied
+    finally:
+        if not conn.closed:
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (LOCK_ID,))
+            conn.commit()
+
+
+def current_version(conn):
+    cursor = conn.cursor()
+    done = applied_versions(cursor)
+    conn.commit()
+    return max(done) if done else 0
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    import psycopg2
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    import db
+
+    conn = psycopg2.connect(**db.connection_kwargs())
+    try:
+        applied = migrate(conn)
+        print(f"Applied {len(applied)} migration(s); schema is at version {current_version(conn)}")
+    finally:
+        conn.close()
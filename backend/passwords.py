@@ -0,0 +1,161 @@
+"""Password hashing on a dedicated, size-limited worker pool.
+
+bcrypt costs ~100-250 ms of CPU per call, far too long to run on the event
+loop. The bcrypt extension releases the GIL while hashing, so a small thread
+pool gives real parallelism without the pickling and startup cost of a
+process pool. At most PASSWORD_HASH_WORKERS hashes run at once and at most
+PASSWORD_HASH_MAX_QUEUE more wait; beyond that HashQueueFull is raised so a
+login storm turns into fast 503s instead of an unbounded backlog.
+
+Rows created before hashing was introduced hold the plaintext password.
+verify() still accepts them and returns a bcrypt hash to store instead.
+"""
+import asyncio
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=_env_int("PASSWORD_BCRYPT_ROUNDS", 12),
+)
+
+# Verified when the user does not exist, so unknown usernames take as long as wrong passwords.
+# Made by warm() at startup (or on first use), not at import, which every worker process would pay for
+_dummy_hash = None
+
+
+def _get_dummy_hash():
+    global _dummy_hash
+    if _dummy_hash is None:
+        _dummy_hash = context.hash("dummy password")
+    return _dummy_hash
+
+
+def warm():
+    _get_dummy_hash()
+
+
+class HashQueueFull(Exception):
+    pass
+
+
+class HashWorkerPool:
+    def __init__(self, max_workers, max_queue):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="passwords")
+        self._semaphore = None
+        self._in_flight = 0
+        self._queued = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._work_seconds = 0.0
+
+    def _timed(self, fn, args):
+        started = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._work_seconds += time.perf_counter() - started
+
+    async def run(self, fn, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+
+        if self._semaphore.locked() and self._queued >= self.max_queue:
+            self._rejected += 1
+            raise HashQueueFull("Too many concurrent logins, try again shortly")
+
+        self._queued += 1
+        started = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._queued -= 1
+        waited = time.perf_counter() - started
+        self._wait_seconds += waited
+        self._max_wait_seconds = max(self._max_wait_seconds, waited)
+
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._timed, fn, args)
+        finally:
+            self._in_flight -= 1
+            self._completed += 1
+            self._semaphore.release()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+    def stats(self):
+        done = self._completed or 1
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queued": self._queued,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "avg_wait_ms": round(self._wait_seconds / done * 1000, 2),
+            "max_wait_ms": round(self._max_wait_seconds * 1000, 2),
+            "avg_hash_ms": round(self._work_seconds / done * 1000, 2),
+        }
+
+
+pool = None
+
+
+def get_pool():
+    global pool
+    if pool is None:
+        pool = HashWorkerPool(
+            _env_int("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)),
+            _env_int("PASSWORD_HASH_MAX_QUEUE", 64),
+        )
+    return pool
+
+
+def shutdown_pool():
+    global pool
+    if pool is not None:
+        pool.shutdown()
+        pool = None
+
+
+def is_hashed(stored):
+    return context.identify(stored) is not None
+
+
+def _verify(password, stored):
+    """Returns (valid, new_hash); new_hash is set when the stored value should be replaced."""
+    if stored is None:
+        context.verify(password, _get_dummy_hash())
+        return False, None
+    if not is_hashed(stored):
+        # Legacy plaintext row
+        if not hmac.compare_digest(password.encode(), stored.encode()):
+            return False, None
+        return True, context.hash(password)
+    return context.verify_and_update(password, stored)
+
+
+async def hash_password(password):
+    return await get_pool().run(context.hash, password)
+
+
+async def verify(password, stored):
+    return await get_pool().run(_verify, password, stored)
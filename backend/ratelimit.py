@@ -0,0 +1,87 @@
+"""Token-bucket rate limits, per user or per client address.
+
+Each key (a username, an IP) has a bucket of up to burst tokens that refills
+at rate tokens per second; a request takes cost tokens or is refused with
+the time until enough are back, which the API sends as Retry-After with a
+429. Expensive endpoints cost more than one token (see ROUTE_COSTS in
+main.py), so a client polling full blog lists runs dry long before one
+clicking through posts does.
+
+Buckets live in this process: with several workers a client effectively
+gets up to workers x the limit, the same trade-off as the response caches.
+The number of buckets is bounded (max_keys); the least recently used one
+is dropped first, and by then it has usually refilled anyway.
+
+Limits are configured as "rate,burst" (RATE_LIMIT_USER=20,100); a rate of 0
+turns a limiter off, and RATE_LIMITS=off turns all of them off (benchmarks).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+ENABLED = os.getenv("RATE_LIMITS", "on").lower() not in ("0", "off", "false", "no")
+
+RATE_LIMITED = metrics.Counter("rate_limited_total", "Requests refused with 429, by limiter.", ("limiter",))
+
+
+def parse(name, default):
+    """(rate, burst) from the environment variable name, "rate,burst" or just "rate"."""
+    value = os.getenv(name)
+    if not value:
+        return default
+    rate, _, burst = value.partition(",")
+    rate = float(rate)
+    return rate, float(burst) if burst else max(1.0, rate)
+
+
+class RateLimiter:
+    def __init__(self, name, rate, burst, max_keys=100000):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.enabled = ENABLED and rate > 0
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+        self.allowed = 0
+        self.limited = 0
+
+    def hit(self, key, cost=1):
+        """Takes cost tokens from key's bucket. Returns 0 if allowed, else seconds until it would be."""
+        if not self.enabled:
+            return 0
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                self.allowed += 1
+                return 0
+            self.limited += 1
+            wait = (cost - bucket[0]) / self.rate
+        RATE_LIMITED.inc(limiter=self.name)
+        return wait
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "rate": self.rate,
+                "burst": self.burst,
+                "keys": len(self._buckets),
+                "allowed": self.allowed,
+                "limited": self.limited,
+            }
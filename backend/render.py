@@ -0,0 +1,241 @@
+"""Server-side HTML for blog cells.
+
+Each cell is rendered to an HTML fragment after a write (the render_blog
+job in main.py) and stored in blogs.html_cells as [{"id", "hash", "html"}],
+so GET /api/blogs/{id}/html
+only joins stored fragments. The hash covers everything the fragment
+depends on (cell type, content, language and RENDERER_VERSION), so on an
+update only cells whose hash is new are rendered; the rest are taken from
+the previous html_cells or from the in-process fragment cache.
+
+Text cells use the same small markup as the frontend (headings, **bold**,
+*italic*, __underline__, [links](url), <div align="...">) but everything
+else is escaped first, so no HTML from the post reaches the page. Links are
+limited to http(s), mailto and relative URLs. Code cells are highlighted
+with Pygments when it is installed and escaped otherwise. Images with
+variants (see media.py) get WebP and fallback srcsets, so browsers download
+a copy sized for the 320px figure instead of the original; media not yet
+moved to the blob store is rendered from its image/video data URL.
+
+Bump RENDERER_VERSION whenever the output changes; stored HTML of an older
+version is re-rendered the next time it is requested.
+"""
+import hashlib
+import html
+import os
+import re
+
+import orjson
+
+import cache
+import metrics
+
+try:
+    from pygments import highlight
+    from pygments.formatters import HtmlFormatter
+    from pygments.lexers import TextLexer, get_lexer_by_name, guess_lexer
+    from pygments.util import ClassNotFound
+except ImportError:  # optional
+    highlight = None
+
+RENDERER_VERSION = 3
+CODE_STYLE = os.getenv("RENDER_CODE_STYLE") or "monokai"
+# Media figures are at most 320 CSS pixels wide (max-w-xs); browsers pick the variant for their pixel density
+IMAGE_SIZES = "320px"
+IMAGE_FALLBACK_WIDTH = 640
+# Guessing the language looks at the start of the code only
+GUESS_LANGUAGE_CHARS = 4096
+
+fragment_cache = cache.LRUCache(max_bytes=int(os.getenv("RENDER_CACHE_MAX_BYTES") or 16 * 1024 * 1024))
+
+CELLS_RENDERED = metrics.Counter(
+    "render_cells_total", "Cells rendered to HTML on write, by whether the fragment was reused.", ("result",))
+
+SAFE_URL_RE = re.compile(r"^(https?://|mailto:|/(?!/)|#)", re.IGNORECASE)
+# Media saved before the blob store (migrate_media.py) is still inline: only image/video data URLs are used
+DATA_URL_RE = re.compile(r"^data:(image|video)/[\w.+-]+(;[\w-]+=[\w.+-]*)*;base64,[A-Za-z0-9+/=\s]*$", re.IGNORECASE)
+
+_TEXT_RULES = [
+    (re.compile(r"^# (.*)$", re.MULTILINE), r'<h1 class="text-3xl font-bold text-white mt-6 mb-4">\1</h1>'),
+    (re.compile(r"^## (.*)$", re.MULTILINE), r'<h2 class="text-2xl font-bold text-white mt-5 mb-3">\1</h2>'),
+    (re.compile(r"^### (.*)$", re.MULTILINE), r'<h3 class="text-xl font-bold text-white mt-4 mb-2">\1</h3>'),
+    (re.compile(r"\*\*(.*?)\*\*"), r'<strong class="font-bold text-white">\1</strong>'),
+    (re.compile(r"\*(.*?)\*"), r'<em class="italic text-gray-200">\1</em>'),
+    (re.compile(r"__(.*?)__"), r'<u class="underline text-white">\1</u>'),
+]
+_LINK_RE = re.compile(r"\[(.*?)\]\((.*?)\)")
+# <div align="..."> after html.escape()
+_ALIGN_RE = re.compile(r"&lt;div align=&quot;(left|center|right)&quot;&gt;(.*?)&lt;/div&gt;")
+
+
+def render_text(text):
+    if not isinstance(text, str) or not text:
+        return ""
+    result = html.escape(text, quote=True)
+
+    # Links first, with the URL held out as a placeholder so the inline rules
+    # below can never reach into the href attribute
+    urls = []
+
+    def link(match):
+        label, url = match.group(1), match.group(2)
+        if not SAFE_URL_RE.match(html.unescape(url)):
+            return label
+        urls.append(url)
+        return (f'<a href="\x00{len(urls) - 1}\x00" class="text-blue-400 hover:text-blue-300 underline" '
+                f'target="_blank" rel="noopener noreferrer">{label}</a>')
+
+    result = _LINK_RE.sub(link, result.replace("\x00", ""))
+    for pattern, replacement in _TEXT_RULES:
+        result = pattern.sub(replacement, result)
+    result = _ALIGN_RE.sub(r'<div class="text-\1">\2</div>', result)
+    result = result.replace("\n\n", '</p><p class="mb-4">').replace("\n", "<br>")
+    result = re.sub("\x00(\\d+)\x00", lambda match: urls[int(match.group(1))], result)
+    return f'<p class="text-gray-200 leading-relaxed mb-4">{result}</p>'
+
+
+def _lexer(code, language):
+    if language:
+        try:
+            return get_lexer_by_name(language)
+        except ClassNotFound:
+            pass
+    try:
+        return guess_lexer(code[:GUESS_LANGUAGE_CHARS])
+    except ClassNotFound:
+        return TextLexer()
+
+
+def render_code(code, language=None):
+    if not isinstance(code, str) or not code:
+        return ""
+    copy = '<button type="button" class="copy-code bg-green-600 hover:bg-green-700 text-white px-3 py-1.5 rounded text-sm">Nusxa olish</button>'
+    if highlight is None:
+        body = f'<pre class="bg-gray-900 text-green-300 rounded-lg p-4 overflow-x-auto border border-gray-700"><code>{html.escape(code)}</code></pre>'
+    else:
+        formatter = HtmlFormatter(cssclass="highlight rounded-lg p-4 overflow-x-auto border border-gray-700")
+        body = highlight(code, _lexer(code, language), formatter)
+    return f'<div class="relative"><div class="absolute top-2 right-2 z-10">{copy}</div>{body}</div>'
+
+
+def _media_url(item):
+    url = item.get("url")
+    if isinstance(url, str) and SAFE_URL_RE.match(url):
+        return url
+    data = item.get("data")
+    if isinstance(data, str) and DATA_URL_RE.match(data):
+        return data
+    return None
+
+
+def _srcset(variants, webp):
+    candidates = []
+    for variant in variants:
+        url = _media_url(variant) if isinstance(variant, dict) else None
+        if url is None or not isinstance(variant.get("width"), int) or (variant.get("type") == "image/webp") != webp:
+            continue
+        candidates.append(f'{html.escape(url, quote=True)} {variant["width"]}w')
+    return ", ".join(candidates)
+
+
+def _fallback_src(variants, url):
+    """Non-WebP variant closest to IMAGE_FALLBACK_WIDTH, for browsers without srcset; the original if none."""
+    fallbacks = [variant for variant in variants if isinstance(variant, dict) and variant.get("type") != "image/webp"
+                 and isinstance(variant.get("width"), int) and _media_url(variant)]
+    if not fallbacks:
+        return url
+    return _media_url(min(fallbacks, key=lambda variant: abs(variant["width"] - IMAGE_FALLBACK_WIDTH)))
+
+
+def render_image(item, url, name):
+    """<img>, inside a <picture> with WebP and fallback srcsets when the item has variants (media.apply_variants)."""
+    variants = item.get("variants") if isinstance(item.get("variants"), list) else []
+    src = html.escape(_fallback_src(variants, url), quote=True)
+    size = ""
+    if isinstance(item.get("width"), int) and isinstance(item.get("height"), int):
+        size = f' width="{item["width"]}" height="{item["height"]}"'
+    img_srcset = _srcset(variants, webp=False)
+    img_srcset = f' srcset="{img_srcset}" sizes="{IMAGE_SIZES}"' if img_srcset else ""
+    img = (f'<img src="{src}"{img_srcset} alt="{name}"{size} loading="lazy" decoding="async" '
+           f'class="w-full h-64 object-cover mx-auto">')
+    webp = _srcset(variants, webp=True)
+    if not webp:
+        return img
+    return f'<picture><source type="image/webp" srcset="{webp}" sizes="{IMAGE_SIZES}">{img}</picture>'
+
+
+def render_media(items):
+    if not isinstance(items, list):
+        return ""
+    figures = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        url = _media_url(item)
+        if url is None:
+            continue
+        src = html.escape(url, quote=True)
+        name = html.escape(str(item.get("name") or ""), quote=True)
+        if str(item.get("type") or "").startswith("video/") or url[:11].lower() == "data:video/":
+            element = f'<video src="{src}" controls preload="metadata" class="w-full h-64 object-cover mx-auto"></video>'
+        else:
+            element = f'<a href="{src}" target="_blank" rel="noopener">{render_image(item, url, name)}</a>'
+        figures.append(
+            f'<figure class="bg-gray-800 rounded-lg overflow-hidden border border-gray-700 max-w-xs w-full">'
+            f'{element}<figcaption class="p-3 text-white text-sm text-center truncate">{name}</figcaption></figure>'
+        )
+    if not figures:
+        return ""
+    return ('<div class="flex justify-center"><div class="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-6 '
+            'justify-items-center max-w-6xl">' + "".join(figures) + "</div></div>")
+
+
+def render_cell(cell):
+    kind = cell.get("type")
+    if kind == "text":
+        inner = render_text(cell.get("content"))
+    elif kind == "code":
+        inner = render_code(cell.get("content"), cell.get("language"))
+    elif kind == "media":
+        inner = render_media(cell.get("content"))
+    else:
+        inner = ""
+    kind = html.escape(str(kind), quote=True)
+    return f'<div class="mb-8 last:mb-0" data-cell-type="{kind}">{inner}</div>'
+
+
+def cell_hash(cell):
+    key = {"v": RENDERER_VERSION, "type": cell.get("type"), "content": cell.get("content"),
+           "language": cell.get("language")}
+    return hashlib.sha256(orjson.dumps(key, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def render_cells(cells, previous=None):
+    """Renders cells to [{"id", "hash", "html"}], reusing fragments whose hash is unchanged."""
+    reuse = {entry["hash"]: entry["html"] for entry in previous or () if isinstance(entry, dict)}
+    result = []
+    for cell in cells:
+        digest = cell_hash(cell)
+        fragment = reuse.get(digest) or fragment_cache.get(digest)
+        if fragment is None:
+            fragment = render_cell(cell)
+            CELLS_RENDERED.inc(result="rendered")
+        else:
+            CELLS_RENDERED.inc(result="reused")
+        fragment_cache.put(digest, fragment, len(fragment))
+        result.append({"id": cell.get("id"), "hash": digest, "html": fragment})
+    return result
+
+
+def join(html_cells):
+    return "".join(entry["html"] for entry in html_cells)
+
+
+def is_current(html_cells, version):
+    return html_cells is not None and version == RENDERER_VERSION
+
+
+def highlight_css():
+    if highlight is None:
+        return ""
+    return HtmlFormatter(style=CODE_STYLE).get_style_defs(".highlight")
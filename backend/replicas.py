@@ -0,0 +1,238 @@
+"""Read-replica routing with read-your-writes consistency.
+
+Reads that do not write (db.read) may run on a streaming replica listed in
+PG_REPLICA_DSNS; everything else runs on the primary. Replicas lag, so every
+request carries a Session with the WAL position (LSN) its reads must see:
+
+- After a call that wrote has committed, the primary's current LSN is noted
+  (note_write). The response sends it as X-Write-LSN, and the user's later
+  reads in this process must see it as well.
+- A client sends the highest X-Write-LSN it has received back as X-Min-LSN.
+  That carries the guarantee across workers and hosts, and to reads without
+  a login (GET /api/blogs/{id}). No write can be past the primary's current
+  LSN, so a larger X-Min-LSN is lowered to it (refreshed from the primary
+  first); otherwise any client could send every read to the primary.
+
+A read then goes to a replica known to have replayed that LSN. A replica's
+replay position only moves forward, so the last one seen is a safe lower
+bound, and a replica is asked again only when that bound is too low. If
+no replica has caught up, or none is reachable, the read runs on the
+primary. A replica that fails is skipped for REPLICA_RETRY_SECONDS.
+
+Reads without a required LSN can be as stale as the replica's lag.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from starlette.datastructures import MutableHeaders
+
+import metrics
+
+RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS") or 5)
+MAX_USERS = int(os.getenv("REPLICA_MAX_USERS") or 100000)
+
+READS = metrics.Counter("db_reads_total", "Replica-eligible reads by where they ran.", ("target",))
+
+
+def parse_lsn(text):
+    """'16/B374D848' -> int; None if text is not an LSN."""
+    if not text:
+        return None
+    high, separator, low = text.strip().partition("/")
+    if not separator:
+        return None
+    try:
+        return (int(high, 16) << 32) | int(low, 16)
+    except ValueError:
+        return None
+
+
+def format_lsn(value):
+    return f"{value >> 32:X}/{value & 0xFFFFFFFF:X}"
+
+
+class Replica:
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.replay_lsn = 0
+        self.down_until = 0.0
+        self.reads = 0
+        self.lagging = 0
+        self.errors = 0
+
+    @property
+    def available(self):
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self):
+        self.errors += 1
+        self.down_until = time.monotonic() + RETRY_SECONDS
+
+    def saw(self, lsn):
+        if lsn is not None and lsn > self.replay_lsn:
+            self.replay_lsn = lsn
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "available": self.available,
+            "replay_lsn": format_lsn(self.replay_lsn),
+            "reads": self.reads,
+            "lagging": self.lagging,
+            "errors": self.errors,
+            "pool": self.pool.stats(),
+        }
+
+
+# Per request
+
+class Session:
+    __slots__ = ("min_lsn", "write_lsn", "read_lsn", "user")
+
+    def __init__(self, min_lsn=0):
+        self.min_lsn = min_lsn  # reads must see at least this
+        self.write_lsn = 0  # primary LSN after this request's writes
+        self.read_lsn = 0  # the last read was at least this new
+        self.user = None
+
+
+_session = contextvars.ContextVar("replica_session", default=None)
+
+# The primary is always at or past the highest LSN this process has seen from it
+_lock = threading.Lock()
+_primary_lsn = 0
+_user_lsns = OrderedDict()  # username -> LSN of their last write through this process
+_refresh_last = None  # the latest task reading the primary's LSN
+_refresh_next = None  # the one that has not sent its query yet, if any
+
+
+def min_lsn():
+    session = _session.get()
+    return session.min_lsn if session is not None else 0
+
+
+def primary_lsn():
+    return _primary_lsn
+
+
+def read_lsn():
+    """How new (at least) the data of this request's last read was."""
+    session = _session.get()
+    return session.read_lsn if session is not None else 0
+
+
+def require(lsn):
+    """Makes the rest of this request's reads see at least lsn."""
+    session = _session.get()
+    if session is not None and lsn > session.min_lsn:
+        session.min_lsn = lsn
+
+
+def bind_user(user):
+    """Attaches the logged-in user, whose own writes this request's reads must then see."""
+    session = _session.get()
+    if session is None:
+        return
+    session.user = user
+    with _lock:
+        lsn = _user_lsns.get(user, 0)
+    require(lsn)
+
+
+def note_write(lsn):
+    """Records the primary's LSN after a call that wrote has committed."""
+    global _primary_lsn
+    session = _session.get()
+    user = session.user if session is not None else None
+    with _lock:
+        _primary_lsn = max(_primary_lsn, lsn)
+        if user is not None:
+            _user_lsns[user] = max(lsn, _user_lsns.pop(user, 0))
+            if len(_user_lsns) > MAX_USERS:
+                _user_lsns.popitem(last=False)
+    if session is not None:
+        session.write_lsn = max(session.write_lsn, lsn)
+        require(lsn)
+
+
+def note_primary(lsn):
+    global _primary_lsn
+    if lsn is not None:
+        with _lock:
+            _primary_lsn = max(_primary_lsn, lsn)
+
+
+async def _refresh_primary_lsn(fetch, previous):
+    global _refresh_next
+    if previous is not None and not previous.done():
+        await asyncio.wait([previous])  # one query at a time
+    if _refresh_next is asyncio.current_task():
+        _refresh_next = None  # requests arriving from here on need a later query
+    note_primary(await fetch())
+
+
+async def refresh_primary_lsn(fetch):
+    """Updates primary_lsn() with await fetch(), sent after this call started.
+
+    Concurrent callers share one query: all that arrive while a query waits
+    to be sent join it, so at most one runs and one waits at any time.
+    """
+    global _refresh_last, _refresh_next
+    loop = asyncio.get_running_loop()
+    if _refresh_next is None or _refresh_next.get_loop() is not loop:
+        previous = _refresh_last if _refresh_last is not None and _refresh_last.get_loop() is loop else None
+        _refresh_next = _refresh_last = loop.create_task(_refresh_primary_lsn(fetch, previous))
+    await asyncio.shield(_refresh_next)
+
+
+def note_read(lsn):
+    session = _session.get()
+    if session is not None:
+        session.read_lsn = lsn
+
+
+class ConsistencyMiddleware:
+    """Starts a Session per request from X-Min-LSN and answers X-Write-LSN after writes.
+
+    primary_lsn: async () -> the primary's current LSN, or None without replicas.
+    """
+
+    def __init__(self, app, primary_lsn=None):
+        self.app = app
+        self.primary_lsn = primary_lsn
+
+    async def _bounded(self, requested):
+        if requested > _primary_lsn and self.primary_lsn is not None:
+            try:
+                await refresh_primary_lsn(self.primary_lsn)
+            except Exception:
+                pass  # the last LSN seen is still a bound
+        return min(requested, _primary_lsn)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        requested = None
+        for name, value in scope["headers"]:
+            if name == b"x-min-lsn":
+                requested = parse_lsn(value.decode("latin-1"))
+                break
+        session = Session(await self._bounded(requested) if requested else 0)
+        token = _session.set(session)
+
+        async def send_with_lsn(message):
+            if message["type"] == "http.response.start" and session.write_lsn:
+                MutableHeaders(scope=message).append("X-Write-LSN", format_lsn(session.write_lsn))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_lsn)
+        finally:
+            _session.reset(token)
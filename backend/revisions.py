@@ -0,0 +1,152 @@
+"""Revision history for blogs, stored as deltas.
+
+Every save of a blog's title or cells adds a row to blog_revisions. Most rows
+hold only the cell operations that turn the previous revision into this one,
+in the same {op, id, cell, after_id} format PATCH /api/blogs/{id} accepts,
+so a PATCH is stored as it was sent and a PUT is diffed against the cells it
+replaces. Every SNAPSHOT_EVERY revisions (and whenever the delta would not
+be smaller) the full cells are stored instead, so rebuilding a revision
+never applies more than SNAPSHOT_EVERY - 1 deltas. Rebuilding happens in
+the database (blog_revision_cells), with the blog_cells_apply function the
+PATCH endpoint uses, so the stored operations mean exactly what they meant
+when they were applied.
+
+Media in cells are references to content-addressed blobs (see media.py), so
+neither deltas nor snapshots copy file contents.
+
+Blogs written before revisions existed get their current state recorded as
+revision 1 on their next save (ensure_base), so that save can be undone too.
+"""
+import os
+
+import orjson
+
+SNAPSHOT_EVERY = max(1, int(os.getenv("REVISION_SNAPSHOT_EVERY") or 20))
+
+REVISION_COLUMNS = ("revision, title, author, created_at, "
+                    "CASE WHEN snapshot IS NULL THEN 'delta' ELSE 'snapshot' END AS kind, size")
+
+
+def _stable(positions):
+    """Indexes into positions of a longest increasing subsequence."""
+    tails, tail_index, previous = [], [], [None] * len(positions)
+    for i, value in enumerate(positions):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tails[mid] < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        previous[i] = tail_index[lo - 1] if lo else None
+        if lo == len(tails):
+            tails.append(value)
+            tail_index.append(i)
+        else:
+            tails[lo] = value
+            tail_index[lo] = i
+    result = set()
+    i = tail_index[-1] if tail_index else None
+    while i is not None:
+        result.add(i)
+        i = previous[i]
+    return result
+
+
+def _ids(cells):
+    ids = [cell.get("id") if isinstance(cell, dict) else None for cell in cells]
+    if None in ids or len(set(ids)) != len(ids):
+        return None
+    return ids
+
+
+def diff(old, new):
+    """Cell operations that turn old into new, or None when cell ids are missing or repeated.
+
+    Deleted cells are deleted, changed cells replaced and new cells inserted
+    after their predecessor. Of the cells present in both, the longest run
+    that is already in order stays put and only the rest are moved, so moving
+    one cell costs one operation however long the post is.
+    """
+    old_ids, new_ids = _ids(old), _ids(new)
+    if old_ids is None or new_ids is None:
+        return None
+    old_by_id = dict(zip(old_ids, old))
+    old_position = {cell_id: n for n, cell_id in enumerate(old_ids)}
+    new_set = set(new_ids)
+
+    ops = [{"op": "delete", "id": cell_id} for cell_id in old_ids if cell_id not in new_set]
+    kept = [n for n, cell_id in enumerate(new_ids) if cell_id in old_position]
+    stable = {kept[i] for i in _stable([old_position[new_ids[n]] for n in kept])}
+
+    after_id = None
+    for n, (cell_id, cell) in enumerate(zip(new_ids, new)):
+        if cell_id not in old_by_id:
+            ops.append({"op": "insert", "cell": cell, "after_id": after_id})
+        else:
+            if cell != old_by_id[cell_id]:
+                ops.append({"op": "replace", "id": cell_id, "cell": cell})
+            if n not in stable:
+                ops.append({"op": "move", "id": cell_id, "after_id": after_id})
+        after_id = cell_id
+    return ops
+
+
+def ensure_base(cursor, blog_id):
+    """Records the blog's current state as revision 1 if it has no revisions yet."""
+    cursor.execute(
+        '''
+        INSERT INTO blog_revisions (blog_id, revision, title, snapshot, author, created_at, size)
+        SELECT id, 1, title, cells, author, updated_at, octet_length(cells::text)
+        FROM blogs
+        WHERE id = %s AND NOT EXISTS (SELECT 1 FROM blog_revisions WHERE blog_id = %s)
+        ON CONFLICT DO NOTHING
+        ''',
+        (blog_id, blog_id)
+    )
+
+
+def record(cursor, blog_id, author, title, cells_json, ops=None):
+    """Stores the blog's new title and cells (JSON text) as its next revision, in the caller's transaction.
+
+    ops are the operations from the previous revision; without them (first
+    revision, or a diff that was not possible) a snapshot is stored.
+    Returns the revision number.
+    """
+    cursor.execute("SELECT coalesce(max(revision), 0) + 1 AS revision FROM blog_revisions WHERE blog_id = %s",
+                   (blog_id,))
+    number = cursor.fetchone()["revision"]
+
+    snapshot = cells_json
+    delta = orjson.dumps(ops).decode() if ops is not None else None
+    if delta is None or (number - 1) % SNAPSHOT_EVERY == 0 or len(delta) >= len(snapshot):
+        delta = None
+    else:
+        snapshot = None
+    stored = delta if snapshot is None else snapshot
+    cursor.execute(
+        "INSERT INTO blog_revisions (blog_id, revision, title, snapshot, delta, author, size) "
+        "VALUES (%s, %s, %s, %s::jsonb, %s::jsonb, %s, %s)",
+        (blog_id, number, title, snapshot, delta, author, len(stored.encode()))
+    )
+    return number
+
+
+def list_revisions(cursor, blog_id, limit, before=None):
+    """Newest first."""
+    cursor.execute(
+        f"SELECT {REVISION_COLUMNS} FROM blog_revisions "
+        "WHERE blog_id = %s AND (%s::integer IS NULL OR revision < %s) ORDER BY revision DESC LIMIT %s",
+        (blog_id, before, before, limit)
+    )
+    return cursor.fetchall()
+
+
+def fetch(cursor, blog_id, number):
+    """The revision with its cells rebuilt, as JSON text in "cells"; None if it does not exist."""
+    cursor.execute(
+        f"SELECT {REVISION_COLUMNS}, blog_revision_cells(blog_id, revision)::text AS cells "
+        "FROM blog_revisions WHERE blog_id = %s AND revision = %s",
+        (blog_id, number)
+    )
+    return cursor.fetchone()
@@ -0,0 +1,65 @@
+"""JSON responses built straight from database rows.
+
+Rows from RealDictCursor are already dicts with the right keys, so they are
+encoded as they are with orjson instead of being copied into new dicts and
+validated against the response models (the models stay on the routes for
+the OpenAPI schema). orjson writes datetimes in the same format as
+datetime.isoformat(). JSONB columns selected as ::text are wrapped in
+orjson.Fragment and written into the output unchanged, so cells are never
+decoded into Python objects only to be encoded again.
+"""
+import time
+
+import orjson
+from fastapi.responses import Response
+
+import metrics
+
+
+def dumps(content):
+    started = time.perf_counter()
+    data = orjson.dumps(content)
+    metrics.record_serialize(time.perf_counter() - started)
+    return data
+
+
+def raw_json(text):
+    """Embeds an already-encoded JSON document (e.g. jsonb::text) as is."""
+    return orjson.Fragment(text)
+
+
+def ndjson_lines(rows):
+    """One JSON document per line, as a single bytes chunk."""
+    started = time.perf_counter()
+    data = b"".join(orjson.dumps(row) + b"\n" for row in rows)
+    metrics.record_serialize(time.perf_counter() - started)
+    return data
+
+
+def json_response(content, status_code=200, headers=None):
+    return Response(content=dumps(content), status_code=status_code,
+                    media_type="application/json", headers=headers)
+
+
+def with_raw_json(rows, *columns):
+    """Marks text-encoded JSON columns of the rows (in place) for passthrough."""
+    for row in rows:
+        for column in columns:
+            if row[column] is not None:
+                row[column] = orjson.Fragment(row[column])
+    return rows
+
+
+def rows_response(rows, raw_columns=(), **extra):
+    """Response with a JSON array of rows; extra keys are added to every row."""
+    if raw_columns:
+        with_raw_json(rows, *raw_columns)
+    if extra:
+        for row in rows:
+            row.update(extra)
+    return json_response(rows)
+
+
+def row_response(row, raw_columns=()):
+    with_raw_json([row], *raw_columns)
+    return json_response(row)
@@ -0,0 +1,98 @@
+"""Production entry point: the API in several uvicorn worker processes.
+
+    cd backend
+    python serve.py                          # WEB_CONCURRENCY workers on HOST:PORT
+    python serve.py --workers 8 --port 8080
+
+Pending migrations are applied here once, before any worker starts, so the
+workers' own startup only finds the schema current (one read of
+schema_migrations), then opens and warms its pool and caches. Each worker
+starts accepting requests once that is done; /readyz answers 200 from then
+on and /healthz as long as the process is alive.
+
+Sizing. Every worker is a separate process with its own connection pool
+(PG_POOL_MAX), DB thread pool, caches, rate-limit buckets and job worker.
+The requests themselves are async, so one worker per CPU core is the usual
+starting point (the default); add workers only while CPU is the limit. The
+database sees up to workers x PG_POOL_MAX connections, and that must stay
+below its max_connections with room for migrations, psql and replicas —
+the check below refuses to start otherwise (--force to override).
+"""
+import argparse
+import logging
+import os
+
+from dotenv import load_dotenv
+import psycopg2
+
+load_dotenv()
+logging.basicConfig(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger("serve")
+
+import db
+import migrations
+
+# Connections left for everything that is not an API worker
+RESERVED_CONNECTIONS = 10
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def prepare_database(workers, pool_max, force):
+    conn = psycopg2.connect(**db.connection_kwargs())
+    try:
+        applied = migrations.migrate(conn)
+        logger.info("Schema is at version %s (applied %s)", migrations.LATEST_VERSION, applied or "none")
+        cursor = conn.cursor()
+        cursor.execute("SELECT current_setting('max_connections')::int AS max_connections")
+        max_connections = cursor.fetchone()["max_connections"]
+        conn.commit()
+    finally:
+        conn.close()
+
+    needed = workers * pool_max
+    if needed > max_connections - RESERVED_CONNECTIONS:
+        message = (f"{workers} workers x PG_POOL_MAX={pool_max} = {needed} connections, but the server allows "
+                   f"{max_connections} (keeping {RESERVED_CONNECTIONS} free); lower --workers or PG_POOL_MAX")
+        if not force:
+            raise SystemExit(message)
+        logger.warning(message)
+    logger.info("%d workers x %d connections = %d of max_connections %d", workers, pool_max, needed, max_connections)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=_env_int("PORT", 8000))
+    parser.add_argument("--workers", type=int, default=_env_int("WEB_CONCURRENCY", os.cpu_count() or 1),
+                        help="worker processes (WEB_CONCURRENCY, default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="start even if the connection budget is exceeded")
+    args = parser.parse_args()
+
+    pool_max = _env_int("PG_POOL_MAX", 10)
+    prepare_database(args.workers, pool_max, args.force)
+
+    import uvicorn
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        # Behind a reverse proxy the client address (rate limits) comes from X-Forwarded-For
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        timeout_keep_alive=_env_int("KEEP_ALIVE_TIMEOUT", 5),
+        # In-flight requests and running jobs get this long to finish on SIGTERM
+        timeout_graceful_shutdown=_env_int("GRACEFUL_SHUTDOWN_TIMEOUT", 30),
+        log_level=os.getenv("LOG_LEVEL", "info").lower(),
+    )
+
+
+if __name__ == "__main__":
+    main()
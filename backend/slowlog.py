@@ -0,0 +1,154 @@
+"""Slow-query log.
+
+db.TimedCursor hands every statement that takes SLOW_QUERY_MS or longer to
+record(). The statement is logged with its route, the shape of its
+parameters (types and lengths, never the values) and its duration, and kept
+in a bounded ring buffer that GET /api/admin/slow-queries returns.
+
+For a sample of slow SELECTs (SLOW_QUERY_EXPLAIN_SAMPLE, 0 = never) the
+statement is run again under EXPLAIN (ANALYZE, BUFFERS) right away, on the
+same connection and inside a savepoint, so the plan is taken in the same
+transaction and with the same settings as the slow run. This repeats the
+query, which is why it is sampled and limited to SELECT.
+"""
+import logging
+import os
+import random
+import threading
+from collections import deque
+from datetime import datetime, timezone
+
+from psycopg2 import extensions
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+THRESHOLD_SECONDS = float(os.getenv("SLOW_QUERY_MS") or 500) / 1000
+EXPLAIN_SAMPLE = float(os.getenv("SLOW_QUERY_EXPLAIN_SAMPLE") or 0)
+LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE") or 200)
+MAX_STATEMENT_CHARS = 2000
+
+SLOW_QUERIES = metrics.Counter("db_slow_queries_total", "Statements over the slow-query threshold.", ("route",))
+
+
+def params_shape(params):
+    """Types and sizes of query parameters, without their values."""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: params_shape(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [_value_shape(value) for value in params]
+    return _value_shape(params)
+
+
+def _value_shape(value):
+    if value is None:
+        return "null"
+    name = type(value).__name__
+    if isinstance(value, (str, bytes, list, tuple, dict)):
+        return f"{name}[{len(value)}]"
+    return name
+
+
+def _statement_text(query, params):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+        if params is None:
+            # execute_values() sends the values inlined in the SQL; keep only the statement head
+            head, sep, _ = query.partition(" VALUES ")
+            query = head + sep + "..." if sep else query
+    elif not isinstance(query, str):
+        query = str(query)
+    query = " ".join(query.split())
+    return query if len(query) <= MAX_STATEMENT_CHARS else query[:MAX_STATEMENT_CHARS] + "..."
+
+
+def _explain(cursor):
+    """EXPLAIN (ANALYZE, BUFFERS) of the cursor's last statement, on its connection."""
+    conn = cursor.connection
+    # A plain cursor, so the EXPLAIN itself is not timed or logged again
+    explain_cursor = conn.cursor(cursor_factory=extensions.cursor)
+    savepoint = not conn.autocommit
+    try:
+        if savepoint:
+            explain_cursor.execute("SAVEPOINT slowlog_explain")
+        try:
+            explain_cursor.execute(b"EXPLAIN (ANALYZE, BUFFERS) " + cursor.query)
+            plan = "\n".join(row[0] for row in explain_cursor.fetchall())
+        except Exception as e:
+            if savepoint:
+                explain_cursor.execute("ROLLBACK TO SAVEPOINT slowlog_explain")
+            plan = f"EXPLAIN failed: {str(e).strip()}"
+        if savepoint:
+            explain_cursor.execute("RELEASE SAVEPOINT slowlog_explain")
+        return plan
+    except Exception as e:
+        return f"EXPLAIN failed: {str(e).strip()}"
+    finally:
+        explain_cursor.close()
+
+
+class SlowQueryLog:
+    def __init__(self, size=LOG_SIZE):
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.total = 0
+
+    def add(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+            self.total += 1
+
+    def entries(self, limit=None):
+        """Newest first."""
+        with self._lock:
+            entries = list(self._entries)
+        entries.reverse()
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "threshold_ms": THRESHOLD_SECONDS * 1000,
+                "explain_sample": EXPLAIN_SAMPLE,
+                "capacity": self._entries.maxlen,
+                "buffered": len(self._entries),
+                "total": self.total,
+            }
+
+
+log = SlowQueryLog()
+
+
+def record(cursor, query, params, seconds):
+    timing = metrics.current()
+    route = timing.route if timing is not None else None
+    method = timing.scope.get("method") if timing is not None else None
+    statement = _statement_text(query, params)
+
+    plan = None
+    if (EXPLAIN_SAMPLE > 0 and cursor.name is None and statement[:6].upper() == "SELECT"
+            and random.random() < EXPLAIN_SAMPLE):
+        plan = _explain(cursor)
+
+    entry = {
+        "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "method": method,
+        "route": route,
+        "duration_ms": round(seconds * 1000, 3),
+        "rows": cursor.rowcount,
+        "statement": statement,
+        "params": params_shape(params),
+        "explain": plan,
+    }
+    log.add(entry)
+    SLOW_QUERIES.inc(route=route or "none")
+    logger.warning("Slow query (%.1f ms) on %s %s: %s params=%s",
+                   entry["duration_ms"], method or "-", route or "-", statement, entry["params"])
+    return entry
@@ -1,7 +1,7 @@
 import React, { useState, useRef } from 'react';
 import { Link, useNavigate, useLocation } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
-import { blogAPI } from '../services/api';
+import { blogAPI, mediaAPI, mediaUrl } from '../services/api';
 import { 
   Plus, X, Copy, Check, Code, Type, Image, Video, Bold, Italic, 
   Underline, Link as LinkIcon, Save, ArrowLeft, AlignLeft, 
@@ -457,29 +457,27 @@ function MediaUploader({ content, onChange }) {
   const [files, setFiles] = useState(content || []);
   const fileInputRef = useRef(null);
 
-  const handleFileUpload = (e) => {
+  const [uploading, setUploading] = useState(false);
+
+  const handleFileUpload = async (e) => {
     const selectedFiles = Array.from(e.target.files);
-    const filePromises = selectedFiles.map(file => {
-      return new Promise((resolve) => {
-        const reader = new FileReader();
-        reader.onload = (event) => {
-          resolve({
-            id: Date.now() + Math.random(),
-            name: file.name,
-            type: file.type,
-            data: event.target.result,
-            size: file.size
-          });
-        };
-        reader.readAsDataURL(file);
-      });
-    });
-
-    Promise.all(filePromises).then(newFiles => {
+    setUploading(true);
+    try {
+      // Fayllar serverga yuklanadi, katakda faqat havola saqlanadi
+      const newFiles = await Promise.all(selectedFiles.map(async (file) => {
+        const response = await mediaAPI.upload(file);
+        return { id: Date.now() + Math.random(), ...response.data, name: file.name };
+      }));
       const updated = [...files, ...newFiles];
       setFiles(updated);
       onChange(updated);
-    });
+    } catch (error) {
+      console.error('Error uploading media:', error);
+      alert('Fayl yuklashda xatolik: ' + (error?.response?.data?.detail || error.message));
+    } finally {
+      setUploading(false);
+      e.target.value = '';
+    }
   };
 
   const removeFile = (id) => {
@@ -490,7 +488,7 @@ function MediaUploader({ content, onChange }) {
 
   const downloadFile = (file) => {
     const link = document.createElement('a');
-    link.href = file.data;
+    link.href = mediaUrl(file);
     link.download = file.name;
     link.click();
   };
@@ -510,7 +508,7 @@ function MediaUploader({ content, onChange }) {
         className="bg-purple-600 hover:bg-purple-700 text-white px-3 py-2 rounded-lg mb-3 flex items-center gap-2 transition text-sm"
       >
         <Plus size={16} />
-        Rasm yoki Video yuklash
+        {uploading ? 'Yuklanmoqda...' : 'Rasm yoki Video yuklash'}
       </button>
 
       <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-4 justify-items-center">
@@ -534,14 +532,14 @@ function MediaUploader({ content, onChange }) {
             </div>
             {file.type.startsWith('image/') ? (
               <img 
-                src={file.data} 
+                src={mediaUrl(file)} 
                 alt={file.name} 
                 className="w-full h-48 object-cover cursor-pointer mx-auto"
-                onClick={() => window.open(file.data, '_blank')}
+                onClick={() => window.open(mediaUrl(file), '_blank')}
               />
             ) : (
               <video 
-                src={file.data} 
+                src={mediaUrl(file)} 
                 controls 
                 className="w-full h-48 object-cover mx-auto"
               />
@@ -1,7 +1,7 @@
 import React, { useState, useRef, useEffect } from 'react';
 import { Link, useNavigate, useParams } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
-import { blogAPI, folderAPI } from '../services/api';
+import { blogAPI, folderAPI, mediaAPI, mediaUrl, thumbnailUrl, diffCells } from '../services/api';
 import { Plus, X, Copy, Check, Code, Type, Image, Video, Bold, Italic, Underline, Link as LinkIcon, Save, ArrowLeft, AlignLeft, AlignCenter, AlignRight, Heading1, Heading2, Heading3, Download, Folder } from 'lucide-react';
 
 function BlogEditor() {
@@ -12,6 +12,8 @@ function BlogEditor() {
   const [loading, setLoading] = useState(true)
   const [folders, setFolders] = useState([])
   const [selectedFolder, setSelectedFolder] = useState(null)
+  // Oxirgi saqlangan holat: saqlashda faqat farq yuboriladi
+  const [original, setOriginal] = useState({ title: '', cells: [], folderId: null })
   const { user } = useAuth()
   const navigate = useNavigate()
 
@@ -36,7 +38,9 @@ function BlogEditor() {
           cellsData = []
         }
       }
-      setCells(Array.isArray(cellsData) ? cellsData : [])
+      cellsData = Array.isArray(cellsData) ? cellsData : []
+      setCells(cellsData)
+      setOriginal({ title: blog.title, cells: cellsData, folderId: blog.folder_id || null })
     } catch (error) {
       console.error('Error fetching blog:', error)
       alert('Blogni yuklashda xatolik')
@@ -104,7 +108,14 @@ function BlogEditor() {
 
     setSaving(true)
     try {
-      const response = await blogAPI.update(id, payload)
+      let response
+      if (selectedFolder === original.folderId) {
+        const patch = { ops: diffCells(original.cells, payload.cells) }
+        if (payload.title !== original.title) patch.title = payload.title
+        response = await blogAPI.patch(id, patch)
+      } else {
+        response = await blogAPI.update(id, payload)
+      }
       console.log('Update response:', response.data)
       // After successful update, redirect back to settings (or dashboard)
       // Do not show a blocking alert — navigate directly so the UI updates seamlessly
@@ -447,23 +458,27 @@ function MediaUploader({ content, onChange }) {
   const [files, setFiles] = useState(content || []);
   const fileInputRef = useRef(null);
 
-  const handleFileUpload = (e) => {
+  const [uploading, setUploading] = useState(false);
+
+  const handleFileUpload = async (e) => {
     const selectedFiles = Array.from(e.target.files);
-    const filePromises = selectedFiles.map(file => {
-      return new Promise((resolve) => {
-        const reader = new FileReader();
-        reader.onload = (event) => {
-          resolve({ id: Date.now() + Math.random(), name: file.name, type: file.type, data: event.target.result, size: file.size });
-        };
-        reader.readAsDataURL(file);
-      });
-    });
-
-    Promise.all(filePromises).then(newFiles => {
+    setUploading(true);
+    try {
+      // Fayllar serverga yuklanadi, katakda faqat havola saqlanadi
+      const newFiles = await Promise.all(selectedFiles.map(async (file) => {
+        const response = await mediaAPI.upload(file);
+        return { id: Date.now() + Math.random(), ...response.data, name: file.name };
+      }));
       const updated = [...files, ...newFiles];
       setFiles(updated);
       onChange(updated);
-    });
+    } catch (error) {
+      console.error('Error uploading media:', error);
+      alert('Fayl yuklashda xatolik: ' + (error?.response?.data?.detail || error.message));
+    } finally {
+      setUploading(false);
+      e.target.value = '';
+    }
   };
 
   const removeFile = (id) => {
@@ -474,7 +489,7 @@ function MediaUploader({ content, onChange }) {
 
   const downloadFile = (file) => {
     const link = document.createElement('a');
-    link.href = file.data;
+    link.href = mediaUrl(file);
     link.download = file.name;
     link.click();
   };
@@ -482,7 +497,7 @@ function MediaUploader({ content, onChange }) {
   return (
     <div>
       <input ref={fileInputRef} type="file" multiple accept="image/*,video/*" onChange={handleFileUpload} className="hidden" />
-      <button onClick={() => fileInputRef.current.click()} className="bg-purple-600 hover:bg-purple-700 text-white px-3 py-2 rounded-lg mb-3 flex items-center gap-2 transition text-sm"><Plus size={16} /> Rasm yoki Video yuklash</button>
+      <button onClick={() => fileInputRef.current.click()} className="bg-purple-600 hover:bg-purple-700 text-white px-3 py-2 rounded-lg mb-3 flex items-center gap-2 transition text-sm"><Plus size={16} /> {uploading ? 'Yuklanmoqda...' : 'Rasm yoki Video yuklash'}</button>
 
       <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-4 justify-items-center">
         {files.map(file => (
@@ -492,9 +507,9 @@ function MediaUploader({ content, onChange }) {
               <button onClick={() => removeFile(file.id)} className="bg-red-600 hover:bg-red-700 text-white p-1.5 rounded transition text-xs" title="O'chirish"><X size={12} /></button>
             </div>
             {file.type.startsWith('image/') ? (
-              <img src={file.data} alt={file.name} className="w-full h-48 object-cover cursor-pointer mx-auto" onClick={() => window.open(file.data, '_blank')} />
+              <img src={thumbnailUrl(file)} alt={file.name} loading="lazy" className="w-full h-48 object-cover cursor-pointer mx-auto" onClick={() => window.open(mediaUrl(file), '_blank')} />
             ) : (
-              <video src={file.data} controls className="w-full h-48 object-cover mx-auto" />
+              <video src={mediaUrl(file)} controls className="w-full h-48 object-cover mx-auto" />
             )}
             <div className="p-3 bg-gray-900/80">
               <div className="text-white text-sm font-medium truncate text-center">{file.name}</div>
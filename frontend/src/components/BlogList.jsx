@@ -12,8 +12,8 @@ const BlogList = ({ onViewBlog, onCreateBlog, onLogout, user }) => {
 
   const loadBlogs = async () => {
     try {
-      const response = await blogAPI.getAll();
-      setBlogs(response.data);
+      const response = await blogAPI.getMyBlogSummaries({ excerpt: true });
+      setBlogs(response.data.items);
     } catch (error) {
       console.error('Error loading blogs:', error);
     } finally {
@@ -89,7 +89,7 @@ const BlogList = ({ onViewBlog, onCreateBlog, onLogout, user }) => {
                       {blog.title}
                     </h3>
                     <p className="text-gray-600 text-sm mb-4 line-clamp-3">
-                      {blog.description}
+                      {blog.excerpt}
                     </p>
                     <div className="flex items-center justify-between text-sm text-gray-500">
                       <div className="flex items-center">
@@ -97,7 +97,7 @@ const BlogList = ({ onViewBlog, onCreateBlog, onLogout, user }) => {
                         {formatDate(blog.created_at)}
                       </div>
                       <span className="bg-blue-100 text-blue-800 px-2 py-1 rounded text-xs">
-                        {blog.cells?.length || 0} qism
+                        {blog.cell_count || 0} qism
                       </span>
                     </div>
                   </div>
@@ -1,11 +1,12 @@
 import React, { useState, useEffect } from 'react'
 import { useParams, Link, useNavigate } from 'react-router-dom'
-import { blogAPI } from '../services/api'
+import { blogAPI, mediaUrl, imageSrcSets, IMAGE_SIZES, highlightCssUrl, withApiOrigin } from '../services/api'
 import { ArrowLeft, Copy, Check, Download, Calendar, User } from 'lucide-react'
 
 function BlogViewer() {
   const { id } = useParams()
   const [blog, setBlog] = useState(null)
+  const [html, setHtml] = useState(null)
   const [loading, setLoading] = useState(true)
   const [copiedCodeId, setCopiedCodeId] = useState(null)
   const navigate = useNavigate()
@@ -14,10 +15,23 @@ function BlogViewer() {
     fetchBlog()
   }, [id])
 
+  useEffect(() => {
+    if (document.querySelector(`link[href="${highlightCssUrl}"]`)) return
+    const link = document.createElement('link')
+    link.rel = 'stylesheet'
+    link.href = highlightCssUrl
+    document.head.appendChild(link)
+  }, [])
+
   const fetchBlog = async () => {
     try {
-      const response = await blogAPI.getById(id)
+      // HTML bo'lmasa kataklar oldingidek brauzerda chiziladi
+      const [response, rendered] = await Promise.all([
+        blogAPI.getById(id),
+        blogAPI.getHtml(id).catch(() => null),
+      ])
       setBlog(response.data)
+      setHtml(rendered ? withApiOrigin(rendered.data) : null)
     } catch (error) {
       console.error('Error fetching blog:', error)
       alert('Blogni yuklashda xatolik: ' + (error.response?.data?.detail || error.message))
@@ -32,9 +46,20 @@ function BlogViewer() {
     setTimeout(() => setCopiedCodeId(null), 2000)
   }
 
+  const handleRenderedClick = (event) => {
+    const button = event.target.closest('.copy-code')
+    if (!button) return
+    const code = button.closest('.relative')?.querySelector('pre')
+    if (!code) return
+    navigator.clipboard.writeText(code.textContent)
+    const label = button.textContent
+    button.textContent = 'Nusxa olindi!'
+    setTimeout(() => { button.textContent = label }, 2000)
+  }
+
   const downloadFile = (file) => {
     const link = document.createElement('a')
-    link.href = file.data
+    link.href = mediaUrl(file)
     link.download = file.name
     link.click()
   }
@@ -110,6 +135,13 @@ function BlogViewer() {
         </h1>
 
         {/* Blog Content */}
+        {html !== null ? (
+          <div
+            className="prose prose-invert max-w-none"
+            onClick={handleRenderedClick}
+            dangerouslySetInnerHTML={{ __html: html }}
+          />
+        ) : (
         <div className="prose prose-invert max-w-none">
           {blog.cells && blog.cells.map((cell) => (
             <div key={cell.id} className="mb-8 last:mb-0">
@@ -154,15 +186,23 @@ function BlogViewer() {
                     {cell.content.map((file) => (
                       <div key={file.id} className="bg-gray-800 rounded-lg overflow-hidden border border-gray-700 max-w-xs w-full">
                         {file.type.startsWith('image/') ? (
-                          <img 
-                            src={file.data} 
-                            alt={file.name}
-                            className="w-full h-64 object-cover cursor-pointer mx-auto"
-                            onClick={() => window.open(file.data, '_blank')}
-                          />
+                          <picture>
+                            {imageSrcSets(file).webp && (
+                              <source type="image/webp" srcSet={imageSrcSets(file).webp} sizes={IMAGE_SIZES} />
+                            )}
+                            <img 
+                              src={mediaUrl(file)} 
+                              srcSet={imageSrcSets(file).fallback || undefined}
+                              sizes={IMAGE_SIZES}
+                              alt={file.name}
+                              loading="lazy"
+                              className="w-full h-64 object-cover cursor-pointer mx-auto"
+                              onClick={() => window.open(mediaUrl(file), '_blank')}
+                            />
+                          </picture>
                         ) : (
                           <video 
-                            src={file.data} 
+                            src={mediaUrl(file)} 
                             controls 
                             className="w-full h-64 object-cover mx-auto"
                           />
@@ -192,6 +232,7 @@ function BlogViewer() {
             </div>
           ))}
         </div>
+        )}
       </article>
     </div>
   )
@@ -10,6 +10,7 @@ function FolderManager() {
   const [rootBlogs, setRootBlogs] = useState([]);
   const [selectedFolder, setSelectedFolder] = useState(null);
   const [folderBlogs, setFolderBlogs] = useState([]);
+  const [blogsByFolder, setBlogsByFolder] = useState({});
   const [loading, setLoading] = useState(true);
   const [movingBlog, setMovingBlog] = useState(null);
   const [showCreateBlog, setShowCreateBlog] = useState(false);
@@ -21,13 +22,27 @@ function FolderManager() {
 
   const loadData = async () => {
     try {
-      const [foldersResponse, rootBlogsResponse] = await Promise.all([
-        folderAPI.getAll(),
-        blogAPI.getRootBlogs()
-      ]);
-      setFolders(foldersResponse.data);
-      setRootBlogs(rootBlogsResponse.data);
-      console.log('Root blogs loaded:', rootBlogsResponse.data);
+      // Papkalar va bloglar daraxti bitta so'rovda
+      const response = await folderAPI.getTree({ excerpt: true });
+      const tree = response.data;
+
+      const flatFolders = [];
+      const byFolder = {};
+      const walk = (node) => {
+        node.children.forEach((child) => {
+          flatFolders.push(child);
+          byFolder[child.id] = child.blogs;
+          walk(child);
+        });
+      };
+      walk(tree);
+
+      setFolders(flatFolders);
+      setRootBlogs(tree.blogs);
+      setBlogsByFolder(byFolder);
+      if (selectedFolder !== null) {
+        setFolderBlogs(byFolder[selectedFolder] || []);
+      }
     } catch (error) {
       console.error('Error loading data:', error);
     } finally {
@@ -35,24 +50,10 @@ function FolderManager() {
     }
   };
 
-  const loadFolderBlogs = async (folderId) => {
-    try {
-      if (folderId === null) {
-        // Asosiy papka
-        const response = await blogAPI.getRootBlogs();
-        setFolderBlogs(response.data);
-        setSelectedFolder(null);
-        console.log('Root blogs loaded:', response.data);
-      } else {
-        // User papkasi
-        const response = await blogAPI.getFolderBlogs(folderId);
-        setFolderBlogs(response.data);
-        setSelectedFolder(folderId);
-        console.log('Folder blogs loaded:', response.data);
-      }
-    } catch (error) {
-      console.error('Error loading folder blogs:', error);
-    }
+  const loadFolderBlogs = (folderId) => {
+    // Bloglar daraxt bilan birga yuklangan, qo'shimcha so'rov kerak emas
+    setSelectedFolder(folderId);
+    setFolderBlogs(folderId === null ? rootBlogs : (blogsByFolder[folderId] || []));
   };
 
   const handleDeleteFolder = async (folderId) => {
@@ -80,11 +81,7 @@ function FolderManager() {
       setMovingBlog(null);
       
       // Yangilash
-      if (selectedFolder === null) {
-        await loadData(); // Root bloglarni yangilash
-      } else {
-        await loadFolderBlogs(selectedFolder); // Joriy papkani yangilash
-      }
+      await loadData();
       
       alert('Blog muvaffaqiyatli ko\'chirildi!');
     } catch (error) {
@@ -110,11 +107,7 @@ function FolderManager() {
       setShowCreateBlog(false);
       
       // Yangilash
-      if (selectedFolder === null) {
-        await loadData(); // Root bloglarni yangilash
-      } else {
-        await loadFolderBlogs(selectedFolder); // Joriy papkani yangilash
-      }
+      await loadData();
       
       alert('Blog muvaffaqiyatli yaratildi!');
     } catch (error) {
@@ -305,8 +298,7 @@ function FolderManager() {
                           </h3>
                         </Link>
                         <p className="text-gray-300 text-sm line-clamp-2 mb-4">
-                          {blog.cells.find(cell => cell.type === 'text')?.content?.substring(0, 100) || 
-                           'Blog matni...'}
+                          {blog.excerpt?.substring(0, 100) || 'Blog matni...'}
                         </p>
                       </div>
                       
@@ -359,7 +351,7 @@ function FolderManager() {
                     
                     <div className="flex items-center justify-between text-sm text-gray-400">
                       <span>{new Date(blog.created_at).toLocaleDateString()}</span>
-                      <span>{blog.cells?.length || 0} qism</span>
+                      <span>{blog.cell_count || 0} qism</span>
                     </div>
                   </div>
                 ))}
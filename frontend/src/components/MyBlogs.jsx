@@ -9,6 +9,8 @@ function MyBlogs() {
   const [blogs, setBlogs] = useState([])
   const [folders, setFolders] = useState([])
   const [loading, setLoading] = useState(true)
+  const [nextCursor, setNextCursor] = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   useEffect(() => {
     fetchMyData()
@@ -17,10 +19,11 @@ function MyBlogs() {
   const fetchMyData = async () => {
     try {
       const [blogsResponse, foldersResponse] = await Promise.all([
-        blogAPI.getMyBlogs(),
+        blogAPI.getMyBlogSummaries(),
         folderAPI.getAll()
       ])
-      setBlogs(blogsResponse.data)
+      setBlogs(blogsResponse.data.items)
+      setNextCursor(blogsResponse.data.next_cursor)
       setFolders(foldersResponse.data)
     } catch (error) {
       console.error('Error fetching my data:', error)
@@ -29,6 +32,20 @@ function MyBlogs() {
     }
   }
 
+  const loadMore = async () => {
+    if (!nextCursor) return
+    setLoadingMore(true)
+    try {
+      const response = await blogAPI.getMyBlogSummaries({ cursor: nextCursor })
+      setBlogs(prev => [...prev, ...response.data.items])
+      setNextCursor(response.data.next_cursor)
+    } catch (error) {
+      console.error('Error loading more blogs:', error)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const getFolderName = (folderId) => {
     if (!folderId) return null
     const folder = folders.find(f => f.id === folderId)
@@ -95,7 +112,7 @@ function MyBlogs() {
                   <div className="flex items-center gap-4 text-sm text-gray-400 mb-4">
                     <div className="flex items-center gap-1">
                       <User size={14} />
-                      {blog.author}
+                      {user?.username}
                     </div>
                     <div className="flex items-center gap-1">
                       <Calendar size={14} />
@@ -112,7 +129,7 @@ function MyBlogs() {
                       Ko'rish
                     </Link>
                     <span className="text-gray-400 text-sm">
-                      {blog.cells?.length || 0} qism
+                      {blog.cell_count || 0} qism
                     </span>
                   </div>
                 </div>
@@ -121,6 +138,18 @@ function MyBlogs() {
           </div>
         )}
 
+        {!loading && nextCursor && (
+          <div className="text-center mt-8">
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="bg-gray-700 hover:bg-gray-600 text-white px-6 py-2 rounded-lg transition disabled:opacity-50"
+            >
+              {loadingMore ? 'Yuklanmoqda...' : "Ko'proq yuklash"}
+            </button>
+          </div>
+        )}
+
         {!loading && blogs.length === 0 && (
           <div className="text-center text-gray-400 py-12">
             <BookOpen size={48} className="mx-auto mb-4 opacity-50" />
@@ -6,6 +6,24 @@ const api = axios.create({
   baseURL: API_BASE_URL,
 });
 
+// O'qishlar replikadan bo'lishi mumkin: server yozuvdan keyin X-Write-LSN qaytaradi,
+// eng kattasini saqlab X-Min-LSN sifatida yuboramiz, shunda o'z o'zgarishlarimizni ko'ramiz
+const LSN_KEY = 'minLsn';
+
+const parseLsn = (lsn) => {
+  const [high, low] = (lsn || '').split('/');
+  return low === undefined ? null : [parseInt(high, 16), parseInt(low, 16)];
+};
+
+const rememberLsn = (lsn) => {
+  const next = parseLsn(lsn);
+  if (!next || next.some(Number.isNaN)) return;
+  const current = parseLsn(sessionStorage.getItem(LSN_KEY));
+  if (!current || next[0] > current[0] || (next[0] === current[0] && next[1] > current[1])) {
+    sessionStorage.setItem(LSN_KEY, lsn);
+  }
+};
+
 // Request interceptor - token qo'shish
 api.interceptors.request.use(
   (config) => {
@@ -13,6 +31,10 @@ api.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    const minLsn = sessionStorage.getItem(LSN_KEY);
+    if (minLsn) {
+      config.headers['X-Min-LSN'] = minLsn;
+    }
     return config;
   },
   (error) => {
@@ -22,7 +44,10 @@ api.interceptors.request.use(
 
 // Response interceptor - token xatolari bilan ishlash
 api.interceptors.response.use(
-  (response) => response,
+  (response) => {
+    rememberLsn(response.headers['x-write-lsn']);
+    return response;
+  },
   (error) => {
     if (error.response?.status === 401) {
       localStorage.removeItem('token');
@@ -40,13 +65,24 @@ export const authAPI = {
 export const blogAPI = {
   getAll: () => api.get('/blogs'),
   getById: (id) => api.get(`/blogs/${id}`),
+  // Serverda render qilingan HTML (kod highlight bilan)
+  getHtml: (id) => api.get(`/blogs/${id}/html`, { responseType: 'text' }),
   getMyBlogs: () => api.get('/my-blogs'),
   create: (blogData) => api.post('/blogs', blogData),
   update: (id, blogData) => api.put(`/blogs/${id}`, blogData),
+  // Faqat o'zgargan kataklarni yuborish: { title?, ops: [...] }
+  patch: (id, patchData) => api.patch(`/blogs/${id}`, patchData),
   delete: (id) => api.delete(`/blogs/${id}`),
   move: (id, folderId) => api.put(`/blogs/${id}/move`, { folder_id: folderId }),
+  // Ko'p tanlov: bitta so'rov, { results: [{ id, status }], moved | deleted } qaytaradi
+  moveMany: (ids, folderId) => api.post('/blogs/batch/move', { ids, folder_id: folderId }),
+  deleteMany: (ids) => api.post('/blogs/batch/delete', { ids }),
   getRootBlogs: () => api.get('/root-blogs'),
   getFolderBlogs: (folderId) => api.get(`/folders/${folderId}/blogs`),
+  // Yengil ro'yxatlar: { items, next_cursor } qaytaradi
+  getMyBlogSummaries: (params) => api.get('/my-blogs/summary', { params }),
+  getRootBlogSummaries: (params) => api.get('/root-blogs/summary', { params }),
+  getFolderBlogSummaries: (folderId, params) => api.get(`/folders/${folderId}/blogs/summary`, { params }),
 };
 
 export const folderAPI = {
@@ -54,7 +90,111 @@ export const folderAPI = {
   create: (folderData) => api.post('/folders', folderData),
   update: (id, folderData) => api.put(`/folders/${id}`, folderData), // ✅ YANGI: papka nomini o'zgartirish
   delete: (id) => api.delete(`/folders/${id}`),
+  moveMany: (ids, parentId) => api.post('/folders/batch/move', { ids, parent_id: parentId }),
+  deleteMany: (ids) => api.post('/folders/batch/delete', { ids }),
   getContents: (folderId) => api.get(`/folders/${folderId}/contents`),
+  // Butun ierarxiya bitta so'rovda: { folder_id, depth, blogs, excerpt }
+  getTree: (params = {}) => api.get('/folders/tree', { params }),
+};
+
+// Eski va yangi kataklar ro'yxatidan PATCH /blogs/{id} uchun operatsiyalar tuzadi
+export const diffCells = (original, current) => {
+  const ops = [];
+  const originalById = new Map(original.map(cell => [cell.id, cell]));
+  const currentIds = new Set(current.map(cell => cell.id));
+
+  const order = [];
+  original.forEach(cell => {
+    if (currentIds.has(cell.id)) {
+      order.push(cell.id);
+    } else {
+      ops.push({ op: 'delete', id: cell.id });
+    }
+  });
+
+  current.forEach((cell, index) => {
+    const afterId = index === 0 ? null : current[index - 1].id;
+    const old = originalById.get(cell.id);
+    const snapshot = { id: cell.id, type: cell.type, content: cell.content };
+
+    if (!old) {
+      ops.push({ op: 'insert', cell: snapshot, after_id: afterId });
+      order.splice(afterId === null ? 0 : order.indexOf(afterId) + 1, 0, cell.id);
+      return;
+    }
+    if (old.type !== cell.type || JSON.stringify(old.content) !== JSON.stringify(cell.content)) {
+      ops.push({ op: 'replace', cell: snapshot });
+    }
+    const position = order.indexOf(cell.id);
+    const currentAfter = position === 0 ? null : order[position - 1];
+    if (currentAfter !== afterId) {
+      ops.push({ op: 'move', id: cell.id, after_id: afterId });
+      order.splice(position, 1);
+      order.splice(afterId === null ? 0 : order.indexOf(afterId) + 1, 0, cell.id);
+    }
+  });
+
+  return ops;
+};
+
+export const mediaAPI = {
+  upload: (file) => {
+    const formData = new FormData();
+    formData.append('file', file);
+    return api.post('/media', formData);
+  },
+};
+
+// Media katagidagi fayl manzili: yangi fayllar blob store'ga havola, eskilari data URL
+export const highlightCssUrl = `${API_BASE_URL}/render/highlight.css`;
+
+// Render qilingan HTML'dagi /api/... havolalari (src, srcset, rasm havolasi) API serveriga yo'naltiriladi
+export const withApiOrigin = (html) => html
+  .replaceAll('src="/api/', `src="${API_BASE_URL}/`)
+  .replaceAll('href="/api/media/', `href="${API_BASE_URL}/media/`)
+  .replace(/srcset="([^"]*)"/g, (_, urls) => `srcset="${urls.replace(/(^|, )\/api\//g, `$1${API_BASE_URL}/`)}"`);
+
+export const mediaUrl = (file) => (file.sha256 ? `${API_BASE_URL}/media/${file.sha256}` : file.data);
+
+// Rasm variantlari (backend saqlashdan keyin qo'shadi): kichraytirilgan nusxalar, WebP va oddiy formatda
+const variantUrl = (variant) => `${API_BASE_URL}/media/${variant.sha256}`;
+
+// Media figuralari 320px'dan keng emas; brauzer ekran zichligiga mos variantni tanlaydi
+export const IMAGE_SIZES = '320px';
+
+export const imageSrcSets = (file) => {
+  const variants = file.variants || [];
+  const srcSet = (webp) => variants
+    .filter((variant) => (variant.type === 'image/webp') === webp)
+    .map((variant) => `${variantUrl(variant)} ${variant.width}w`)
+    .join(', ');
+  return { webp: srcSet(true), fallback: srcSet(false) };
+};
+
+export const thumbnailUrl = (file) => {
+  const thumbnails = file.thumbnail || [];
+  const thumbnail = thumbnails.find((variant) => variant.type === 'image/webp') || thumbnails[0];
+  return thumbnail ? variantUrl(thumbnail) : mediaUrl(file);
+};
+
+export const searchAPI = {
+  // { q, folder_id?, limit?, offset? } -> { items, has_more }
+  search: (params) => api.get('/search', { params }),
+};
+
+export const exportAPI = {
+  // NDJSON fayl (gzip: true bo'lsa .ndjson.gz); after: 'folder:<id>' | 'blog:<id>' uzilgan joydan davom etish uchun
+  download: (params = {}) => api.get('/export', { params, responseType: 'blob' }),
+};
+
+export const importAPI = {
+  // file: eksport formatidagi .ndjson yoki .ndjson.gz -> import statistikasi
+  upload: (file) => api.post('/import', file, {
+    headers: {
+      'Content-Type': file.name.endsWith('.gz') ? 'application/gzip' : 'application/x-ndjson',
+    },
+  }),
+  progress: () => api.get('/import/progress'),
 };
 
 export const contentAPI = {